@@ -0,0 +1,572 @@
+#!/usr/bin/env python3
+
+'''
+
+    End-to-end benchmarks for branding.py against the local mock
+    Management API in mock_api.py ... reports wall time, request count
+    and p50/p99 latency per operation for each scenario
+
+'''
+
+import argparse
+import json
+import logging
+import os
+import re
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import branding
+from mock_api import MockServer
+
+
+##
+## cold-start budget for "import branding" ... the heavy HTTP stack must
+## stay out of the import path
+##
+IMPORT_BUDGET_MS = 60
+
+
+###############################################################################
+###############################################################################
+##
+## Arguments - allows user to call from command line
+##
+###############################################################################
+###############################################################################
+
+
+class Args(object):
+
+    parser = argparse.ArgumentParser(description='Benchmark branding.py against a local mock API')
+
+    parser.add_argument(
+        '--latency-ms',
+        dest='latency_ms',
+        nargs=1,
+        type=float,
+        help='Mock API latency per request in milliseconds (default: 20)'
+    )
+
+    parser.add_argument(
+        '--rate-limit',
+        dest='rate_limit',
+        nargs=1,
+        type=float,
+        help='Mock API requests per second before HTTP 429 (default: unlimited)'
+    )
+
+    parser.add_argument(
+        '--failure-rate',
+        dest='failure_rate',
+        nargs=1,
+        type=float,
+        help='Fraction of mock API requests answered with HTTP 503 (default: 0)'
+    )
+
+    parser.add_argument(
+        '--concurrency',
+        dest='concurrency',
+        nargs=1,
+        type=int,
+        help='Prompt update concurrency passed to branding.py (default: 1)'
+    )
+
+    parser.add_argument(
+        '--prompts',
+        dest='prompts',
+        nargs=1,
+        type=int,
+        help='Number of prompts in the synthetic input (default: 10)'
+    )
+
+    parser.add_argument(
+        '--languages',
+        dest='languages',
+        nargs=1,
+        type=int,
+        help='Number of languages per prompt in the synthetic input (default: 50)'
+    )
+
+    parser.add_argument(
+        '--scenario',
+        dest='scenario',
+        nargs=1,
+        help='Only run scenarios whose name contains this string'
+    )
+
+    parser.add_argument(
+        '--import-budget-ms',
+        dest='import_budget_ms',
+        nargs=1,
+        type=float,
+        help='Cold-start budget for importing branding.py in milliseconds (default: {})'.format(IMPORT_BUDGET_MS)
+    )
+
+    parser.add_argument(
+        '--json',
+        dest='json_output',
+        nargs=1,
+        help='Write the results as JSON to this path'
+    )
+
+    parser.add_argument(
+        '--compare',
+        dest='compare',
+        nargs=1,
+        help='JSON results from an earlier run to compare against'
+    )
+
+    def parse(self):
+        args = self.parser.parse_args()
+        return args
+
+
+###############################################################################
+###############################################################################
+##
+## Inputs
+##
+###############################################################################
+###############################################################################
+
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'examples')
+
+
+def load_examples():
+
+    with open(os.path.join(EXAMPLES, 'branding', 'default_rev1.json'), 'rb') as f:
+        branding_json = json.load(f)
+
+    with open(os.path.join(EXAMPLES, 'prompts', 'prompts.json'), 'rb') as f:
+        prompts_json = json.load(f)
+
+    html_template = branding.build_template(os.path.join(EXAMPLES, 'templates', 'default_combined.liquid'))
+
+    return tuple([branding_json, prompts_json, html_template])
+
+
+def synthetic_prompts(prompts=10, languages=50):
+
+    return dict([
+        (
+            'prompt-{}'.format(p),
+            dict([
+                (
+                    'lang-{}'.format(l),
+                    {
+                        'screen-{}'.format(p) : {
+                            'title' : 'Title {} {}'.format(p, l),
+                            'description' : 'Description {} {}'.format(p, l),
+                            'buttonText' : 'Continue'
+                        }
+                    }
+                )
+                for l in range(languages)
+            ])
+        )
+        for p in range(prompts)
+    ])
+
+
+###############################################################################
+###############################################################################
+##
+## Measurement
+##
+###############################################################################
+###############################################################################
+
+
+##
+## collapse IDs and prompt/language names so calls group by operation
+##
+OPERATIONS = [
+    (r'/prompts/[^/]+/custom-text/[^/]+$', '/prompts/{prompt}/custom-text/{language}'),
+    (r'/branding/themes/(?!default$)[^/]+$', '/branding/themes/{id}'),
+]
+
+
+def operation_name(method, url):
+
+    path = re.sub(r'^https?://[^/]+', '', url).split('?')[0]
+    path = re.sub(r'^/api/v2', '', path)
+
+    for pattern, name in OPERATIONS:
+        path = re.sub(pattern, name, path)
+
+    return '{} {}'.format(method, path)
+
+
+class Recorder(object):
+
+    def __init__(self):
+        self.timings = {}
+
+
+    def hook(self, response, *args, **kwargs):
+
+        op = operation_name(response.request.method, response.request.url)
+        self.timings.setdefault(op, []).append(response.elapsed.total_seconds() * 1000)
+
+
+    def summary(self):
+
+        return dict([
+            (op, {
+                'count' : len(t),
+                'p50_ms' : round(branding.percentile(t, 50), 2),
+                'p99_ms' : round(branding.percentile(t, 99), 2)
+            })
+            for op, t in sorted(self.timings.items())
+        ])
+
+
+###############################################################################
+###############################################################################
+##
+## Scenarios
+##
+###############################################################################
+###############################################################################
+
+
+def scenario_deploy(auth0, branding_json, prompts_json, html_template, concurrency):
+
+    return auth0.deploy(
+        branding_json=branding_json,
+        prompts_json=prompts_json,
+        html_template=html_template,
+        concurrency=concurrency
+    )
+
+
+def scenario_diff(auth0, branding_json, prompts_json, html_template, concurrency):
+
+    plan = auth0.plan_deployment(
+        branding_json=branding_json,
+        prompts_json=prompts_json,
+        html_template=html_template,
+        concurrency=concurrency
+    )
+
+    return auth0.apply_plan(plan=plan, concurrency=concurrency)
+
+
+def run_scenario(name, inputs, run, settings, seed=None):
+
+    ##
+    ## every scenario gets its own mock tenant ... seed runs first and is
+    ## not measured, so "unchanged" scenarios start from a deployed tenant
+    ##
+    with MockServer(
+        latency_ms=settings['latency_ms'],
+        rate_limit=settings['rate_limit'],
+        failure_rate=settings['failure_rate']
+    ) as server:
+
+        auth0 = branding.Auth0(
+            client_id='benchmark',
+            client_secret='benchmark',
+            auth0_domain='localhost',
+            mgmt_endpoint=server.mgmt_endpoint,
+            pool_size=max(branding.DEFAULT_POOL_SIZE, settings['concurrency']),
+            rate_limit=settings['client_rate_limit']
+        )
+
+        with auth0:
+
+            if seed is not None:
+                seed(auth0, *inputs, concurrency=settings['concurrency'])
+
+            server.reset_stats()
+
+            recorder = Recorder()
+            auth0.session.hooks['response'].append(recorder.hook)
+
+            start = time.monotonic()
+            run(auth0, *inputs, concurrency=settings['concurrency'])
+            wall = time.monotonic() - start
+
+        return {
+            'scenario' : name,
+            'wall_s' : round(wall, 4),
+            'requests' : len(server.requests),
+            'operations' : recorder.summary()
+        }
+
+
+def run_lambda_warm(name, settings):
+
+    ##
+    ## the first invocation pays for the client, token and file reads ...
+    ## only the second, warm, invocation is measured
+    ##
+    event = {
+        'branding_json' : os.path.join(EXAMPLES, 'branding', 'default_rev1.json'),
+        'prompts_json' : os.path.join(EXAMPLES, 'prompts', 'prompts.json'),
+        'html_template' : os.path.join(EXAMPLES, 'templates', 'default_combined.liquid'),
+        'delete_input' : False,
+        'concurrency' : settings['concurrency'],
+        'rate_limit' : settings['client_rate_limit']
+    }
+
+    with MockServer(
+        latency_ms=settings['latency_ms'],
+        rate_limit=settings['rate_limit'],
+        failure_rate=settings['failure_rate']
+    ) as server:
+
+        event['client_id'] = 'benchmark'
+        event['client_secret'] = 'benchmark'
+        event['auth0_domain'] = 'localhost'
+        event['mgmt_endpoint'] = server.mgmt_endpoint
+
+        logging.disable(logging.INFO)
+
+        try:
+            branding.lambda_handler(event, None)
+            server.reset_stats()
+
+            start = time.monotonic()
+            result = branding.lambda_handler(event, None)
+            wall = time.monotonic() - start
+
+        finally:
+            logging.disable(logging.NOTSET)
+
+        operations = dict([
+            (op, {
+                'count' : stats['count'],
+                'p50_ms' : stats['p50_ms'],
+                'p99_ms' : stats['p99_ms']
+            })
+            for op, stats in result['metrics']['resources'].items()
+        ])
+
+        return {
+            'scenario' : name,
+            'wall_s' : round(wall, 4),
+            'requests' : len(server.requests),
+            'operations' : operations
+        }
+
+
+def run_preflight(name, settings, tenants=8):
+
+    ##
+    ## a fleet of tenants sharing the same assets ... each asset should be
+    ## checked once, and a second pass inside the TTL should need nothing
+    ##
+    with MockServer(latency_ms=settings['latency_ms']) as server:
+
+        with open(os.path.join(EXAMPLES, 'branding', 'default_rev1.json'), 'r') as f:
+            branding_json = json.load(f)
+
+        branding_json['widget']['logo_url'] = server.base_url + '/assets/logo.svg'
+        branding_json['page_background']['background_image_url'] = server.base_url + '/assets/background.jpg'
+        branding_json['fonts']['font_url'] = server.base_url + '/assets/font.woff2'
+
+        html_template = '<link rel="stylesheet" href="{}/assets/site.css">'.format(server.base_url)
+
+        checker = branding.AssetChecker()
+        operations = {}
+        wall = 0
+
+        logging.disable(logging.INFO)
+
+        try:
+            for label in ['cold', 'cached']:
+
+                before = len(server.requests)
+                start = time.monotonic()
+
+                with ThreadPoolExecutor(max_workers=tenants) as executor:
+                    errors = list(executor.map(
+                        lambda i: branding.preflight_assets(branding_json, html_template, checker=checker),
+                        range(tenants)
+                    ))
+
+                elapsed = time.monotonic() - start
+                wall += elapsed
+
+                operations['preflight {} x{} tenants'.format(label, tenants)] = {
+                    'count' : len(server.requests) - before,
+                    'p50_ms' : round(elapsed * 1000, 2),
+                    'p99_ms' : round(elapsed * 1000, 2)
+                }
+
+                assert not any(errors), errors
+
+        finally:
+            logging.disable(logging.NOTSET)
+
+        return {
+            'scenario' : name,
+            'wall_s' : round(wall, 4),
+            'requests' : len(server.requests),
+            'operations' : operations
+        }
+
+
+def run_cold_start(name, budget_ms, runs=5):
+
+    ##
+    ## import branding in fresh interpreters and take the median of the
+    ## cumulative import time reported by -X importtime
+    ##
+    here = os.path.dirname(os.path.abspath(__file__))
+    samples = []
+    imports_requests = False
+
+    for i in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', 
+             'import sys, branding; print("requests" in sys.modules)'],
+            cwd=here, capture_output=True, text=True, check=True
+        )
+
+        imports_requests = imports_requests or output.stdout.strip() == 'True'
+
+        for line in output.stderr.splitlines():
+            fields = [f.strip() for f in line.split('|')]
+            if len(fields) == 3 and fields[2] == 'branding':
+                samples.append(int(fields[1]) / 1000.0)
+
+    median_ms = sorted(samples)[len(samples) // 2]
+
+    return {
+        'scenario' : name,
+        'wall_s' : round(median_ms / 1000.0, 4),
+        'requests' : 0,
+        'operations' : {},
+        'budget_ms' : budget_ms,
+        'imports_requests' : imports_requests,
+        'within_budget' : median_ms <= budget_ms and not imports_requests
+    }
+
+
+def scenarios(args):
+
+    examples = load_examples()
+
+    synthetic = tuple([
+        examples[0],
+        synthetic_prompts(
+            prompts=args.prompts[0] if args.prompts else 10,
+            languages=args.languages[0] if args.languages else 50
+        ),
+        examples[2]
+    ])
+
+    return [
+        ('examples-deploy', examples, scenario_deploy, None),
+        ('examples-diff-unchanged', examples, scenario_diff, scenario_deploy),
+        ('synthetic-deploy', synthetic, scenario_deploy, None),
+        ('synthetic-diff-unchanged', synthetic, scenario_diff, scenario_deploy),
+    ]
+
+
+###############################################################################
+###############################################################################
+##
+## Report
+##
+###############################################################################
+###############################################################################
+
+
+def print_report(results, baseline=None):
+
+    baseline = dict([(r['scenario'], r) for r in (baseline or [])])
+
+    for r in results:
+
+        line = '[+] {:<28} wall {:>9.3f}s  requests {:>5}'.format(r['scenario'], r['wall_s'], r['requests'])
+
+        if r['scenario'] in baseline and baseline[r['scenario']]['wall_s'] > 0:
+            before = baseline[r['scenario']]
+            change = (r['wall_s'] - before['wall_s']) / before['wall_s'] * 100
+            line += '  (was {:.3f}s / {} requests, {:+.1f}%)'.format(before['wall_s'], before['requests'], change)
+
+        print(line)
+
+        if 'budget_ms' in r:
+            print('      import budget {:.0f}ms ... {}{}'.format(
+                r['budget_ms'],
+                'ok' if r['within_budget'] else 'EXCEEDED',
+                ' (requests imported eagerly)' if r['imports_requests'] else ''
+            ))
+
+        for op, stats in r['operations'].items():
+            print('      {:<52} n={:<5} p50 {:>8.2f}ms  p99 {:>8.2f}ms'.format(
+                op, stats['count'], stats['p50_ms'], stats['p99_ms']))
+
+    return
+
+
+###########################################################################
+###########################################################################
+##
+## MAIN
+##
+###########################################################################
+###########################################################################
+
+if __name__ == '__main__':
+
+    a = Args()
+    args = a.parse()
+
+    logging.basicConfig(format='%(message)s')
+    branding.logger.setLevel(logging.WARNING)
+
+    settings = {
+        'latency_ms' : args.latency_ms[0] if args.latency_ms is not None else 20,
+        'rate_limit' : args.rate_limit[0] if args.rate_limit else None,
+        'failure_rate' : args.failure_rate[0] if args.failure_rate else 0,
+        'concurrency' : args.concurrency[0] if args.concurrency else 1,
+        'client_rate_limit' : args.rate_limit[0] if args.rate_limit else 1000
+    }
+
+    results = []
+
+    for name, inputs, run, seed in scenarios(args):
+
+        if args.scenario and args.scenario[0] not in name:
+            continue
+
+        results.append(run_scenario(name, inputs, run, settings, seed=seed))
+
+    baseline = None
+
+    if args.compare:
+        with open(args.compare[0], 'r') as f:
+            baseline = json.load(f)['results']
+
+    budget_ms = args.import_budget_ms[0] if args.import_budget_ms else IMPORT_BUDGET_MS
+
+    if not args.scenario or args.scenario[0] in 'lambda-warm-invocation':
+        results.append(run_lambda_warm('lambda-warm-invocation', settings))
+
+    if not args.scenario or args.scenario[0] in 'preflight-assets':
+        results.append(run_preflight('preflight-assets', settings))
+
+    if not args.scenario or args.scenario[0] in 'cold-start-import':
+        results.append(run_cold_start('cold-start-import', budget_ms))
+
+    print_report(results, baseline=baseline)
+
+    if args.json_output:
+        with open(args.json_output[0], 'w') as f:
+            json.dump({'settings' : settings, 'results' : results}, f, indent=4)
+
+    ##
+    ## a blown cold-start budget fails the run
+    ##
+    for r in results:
+        if r.get('within_budget') is False:
+            exit(1)
@@ -9,13 +9,126 @@
 '''
 
 import os
+import csv
 import argparse
-from configparser import ConfigParser, ExtendedInterpolation
 import json
-import requests
+import time
+import logging
+import hashlib
+import random
+import re
+import threading
+import contextlib
+import datetime
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from urllib.parse import urlparse
 
 
+logger = logging.getLogger('branding')
+
+
+##
+## default number of pooled keep-alive connections held open per client
+##
+DEFAULT_POOL_SIZE = 10
+
+##
+## default number of prompt/language updates sent in parallel (1 = serial)
+##
+DEFAULT_CONCURRENCY = 1
+
+##
+## cached access tokens are refreshed this many seconds before they expire
+##
+TOKEN_EXPIRY_MARGIN = 300
+
+##
+## default number of tenants deployed in parallel in fleet mode
+##
+DEFAULT_FLEET_WORKERS = 8
+
+##
+## default number of branding resources written in parallel by --parallel
+##
+DEFAULT_GRAPH_WORKERS = 4
+
+##
+## Management API requests per second allowed per tenant before the
+## X-RateLimit headers tell us otherwise
+##
+DEFAULT_RATE_LIMIT = 10
+
+##
+## retries on HTTP 429 / 5xx and the exponential backoff bounds (seconds)
+##
+DEFAULT_MAX_RETRIES = 5
+BASE_BACKOFF = 0.5
+MAX_BACKOFF = 30
+
+##
+## CloudWatch namespace for Embedded Metric Format output
+##
+EMF_NAMESPACE = 'Auth0Branding'
+
+##
+## seconds to open a connection and to wait between bytes of a response
+##
+CONNECT_TIMEOUT = 3.05
+READ_TIMEOUT = 15
+
+##
+## worker threads shared by every client for blocking HTTP calls
+##
+HTTP_WORKERS = 64
+
+##
+## seconds held back from the Lambda time budget to report before the hard kill
+##
+DEADLINE_MARGIN = 1.0
+
+##
+## prompts exported when no --prompts-json names them, in every language
+## the tenant enables ... EXPORT_LANGUAGES if its settings can't be read
+##
+EXPORT_PROMPTS = [
+    'login', 'login-id', 'login-password', 'login-email-verification',
+    'signup', 'signup-id', 'signup-password', 'reset-password', 'consent',
+    'mfa', 'mfa-push', 'mfa-otp', 'mfa-voice', 'mfa-phone', 'mfa-webauthn',
+    'mfa-sms', 'mfa-email', 'mfa-recovery-code', 'status', 'device-flow',
+    'email-verification', 'email-otp-challenge', 'organizations',
+    'invitation', 'common'
+]
+EXPORT_LANGUAGES = ['en']
+
+##
+## watch mode polls the input files every WATCH_INTERVAL seconds and waits
+## for WATCH_DEBOUNCE seconds of quiet before pushing a burst of saves
+##
+WATCH_INTERVAL = 0.2
+WATCH_DEBOUNCE = 0.3
+
+##
+## a push that failed is tried again every WATCH_RETRY seconds, even if no
+## file changes in the meantime
+##
+WATCH_RETRY = 5.0
+
+##
+## version of the compiled deployment bundle written by --build
+##
+BUNDLE_FORMAT = 1
+
+##
+## pre-flight asset checks ... results are reused for ASSET_TTL seconds,
+## an HTTP error for FAILED_ASSET_TTL at most so a fixed asset is seen soon,
+## and anything bigger than MAX_ASSET_BYTES is rejected
+##
+ASSET_TTL = 300
+FAILED_ASSET_TTL = 10
+MAX_ASSET_BYTES = 5 * 1024 * 1024
+DEFAULT_ASSET_WORKERS = 8
+
+
 ###############################################################################
 ###############################################################################
 ##
@@ -36,6 +149,13 @@ class Args(object):
         help='Path to a the JSON file containing branding configuration'
     )
 
+    parser.add_argument(
+        '--branding-overlay',
+        dest='branding_overlays',
+        nargs='+',
+        help='JSON files deep merged, in order, over the --branding-json base profile'
+    )
+
     parser.add_argument(
         '--prompts-json', 
         dest='prompts_json', 
@@ -54,7 +174,248 @@ class Args(object):
         '--delete',
         dest='delete', 
         action='store_true',
-        help='Remove both branding themes and Universal Login templates'
+        help='Remove all branding themes and the Universal Login template, and reset the prompts given by --prompts-json'
+    )
+
+    parser.add_argument(
+        '--pool-size',
+        dest='pool_size',
+        nargs=1,
+        type=int,
+        help='Number of keep-alive connections pooled for Management API calls (default: {})'.format(DEFAULT_POOL_SIZE)
+    )
+
+    parser.add_argument(
+        '--concurrency',
+        dest='concurrency',
+        nargs=1,
+        type=int,
+        help='Number of prompt custom-text updates sent in parallel (default: {})'.format(DEFAULT_CONCURRENCY)
+    )
+
+    parser.add_argument(
+        '--token-cache',
+        dest='token_cache',
+        nargs=1,
+        help='Path to a file used to cache Management API access tokens between runs'
+    )
+
+    parser.add_argument(
+        '--theme-id',
+        dest='theme_id',
+        nargs=1,
+        help='Branding theme ID to update, skips the default theme lookup'
+    )
+
+    parser.add_argument(
+        '--theme-cache',
+        dest='theme_cache',
+        nargs=1,
+        help='Path to a file used to cache the default branding theme ID between runs'
+    )
+
+    parser.add_argument(
+        '--diff',
+        dest='diff',
+        action='store_true',
+        help='Compare against the current tenant state and only write resources that changed'
+    )
+
+    parser.add_argument(
+        '--plan',
+        dest='plan',
+        action='store_true',
+        help='Show which resources would change without writing anything'
+    )
+
+    parser.add_argument(
+        '--state-file',
+        dest='state_file',
+        nargs=1,
+        help='Path to a state manifest of content hashes used to skip resources unchanged since the last deploy'
+    )
+
+    parser.add_argument(
+        '--force',
+        dest='force',
+        action='store_true',
+        help='Deploy every resource even if the state manifest says it is unchanged'
+    )
+
+    parser.add_argument(
+        '--delete-template-first',
+        dest='delete_template_first',
+        action='store_true',
+        help='Delete the Universal Login template before uploading the new one'
+    )
+
+    parser.add_argument(
+        '--tenants-file',
+        dest='tenants_file',
+        nargs=1,
+        help='Path to a JSON file listing tenants to deploy to in fleet mode'
+    )
+
+    parser.add_argument(
+        '--workers',
+        dest='workers',
+        nargs=1,
+        type=int,
+        help='Number of tenants deployed in parallel in fleet mode (default: {})'.format(DEFAULT_FLEET_WORKERS)
+    )
+
+    parser.add_argument(
+        '--worker-type',
+        dest='worker_type',
+        nargs=1,
+        choices=['thread', 'process'],
+        help='Run fleet workers as threads or processes (default: thread)'
+    )
+
+    parser.add_argument(
+        '--rate-limit',
+        dest='rate_limit',
+        nargs=1,
+        type=float,
+        help='Management API requests per second per tenant (default: {})'.format(DEFAULT_RATE_LIMIT)
+    )
+
+    parser.add_argument(
+        '--max-retries',
+        dest='max_retries',
+        nargs=1,
+        type=int,
+        help='Retries for rate limited (429) and server error (5xx) responses (default: {})'.format(DEFAULT_MAX_RETRIES)
+    )
+
+    parser.add_argument(
+        '--verbose',
+        dest='verbose',
+        action='store_true',
+        help='Log URLs, request payloads and full response bodies'
+    )
+
+    parser.add_argument(
+        '--metrics-json',
+        dest='metrics_json',
+        nargs=1,
+        help='Write a JSON report of request counts, timings and bytes to this path'
+    )
+
+    parser.add_argument(
+        '--emf',
+        dest='emf',
+        action='store_true',
+        help='Print metrics as CloudWatch Embedded Metric Format log lines'
+    )
+
+    parser.add_argument(
+        '--parallel',
+        dest='parallel',
+        action='store_true',
+        help='Write theme, global branding, prompts and template concurrently (default workers: {})'.format(DEFAULT_GRAPH_WORKERS)
+    )
+
+    parser.add_argument(
+        '--deadline',
+        dest='deadline',
+        nargs=1,
+        type=float,
+        help='Seconds the whole run may take ... work that cannot start in time is skipped and reported'
+    )
+
+    parser.add_argument(
+        '--connect-timeout',
+        dest='connect_timeout',
+        nargs=1,
+        type=float,
+        help='Seconds to wait for a Management API connection (default: {})'.format(CONNECT_TIMEOUT)
+    )
+
+    parser.add_argument(
+        '--read-timeout',
+        dest='read_timeout',
+        nargs=1,
+        type=float,
+        help='Seconds to wait for Management API response data (default: {})'.format(READ_TIMEOUT)
+    )
+
+    parser.add_argument(
+        '--journal',
+        dest='journal_dir',
+        nargs=1,
+        help='Directory where the prior state of every resource a deploy or delete changes is saved before writing'
+    )
+
+    parser.add_argument(
+        '--rollback',
+        dest='rollback',
+        action='store_true',
+        help='Restore the resources saved in the latest --journal entry (or the one given by --to)'
+    )
+
+    parser.add_argument(
+        '--to',
+        dest='rollback_to',
+        nargs=1,
+        help='Journal entry ID or path to roll back to'
+    )
+
+    parser.add_argument(
+        '--catalogs',
+        dest='catalogs',
+        nargs='+',
+        help='Translation catalogs (.csv, .po or .jsonl) streamed into prompt custom-text, one PUT per prompt/language'
+    )
+
+    parser.add_argument(
+        '--export',
+        dest='export_dir',
+        nargs=1,
+        help='Snapshot the tenant branding, prompts and template into this directory in the examples/ layout'
+    )
+
+    parser.add_argument(
+        '--watch',
+        dest='watch',
+        action='store_true',
+        help='Keep running and push each input file again as soon as it changes'
+    )
+
+    parser.add_argument(
+        '--minify',
+        dest='minify',
+        action='store_true',
+        help='Minify the HTML and CSS of the template (after including partials), leaving Liquid tags untouched'
+    )
+
+    parser.add_argument(
+        '--build',
+        dest='build',
+        nargs=1,
+        help='Validate the inputs and compile them into a deployment bundle at this path (or directory), then exit'
+    )
+
+    parser.add_argument(
+        '--preflight',
+        dest='preflight',
+        action='store_true',
+        help='Check every asset URL in the branding and template (status, content-type, size) before deploying'
+    )
+
+    parser.add_argument(
+        '--asset-ttl',
+        dest='asset_ttl',
+        nargs=1,
+        type=float,
+        help='Seconds a pre-flight asset result is reused (default: {})'.format(ASSET_TTL)
+    )
+
+    parser.add_argument(
+        '--bundle',
+        dest='bundle',
+        nargs=1,
+        help='Deploy from a bundle written by --build instead of separate input files'
     )
 
     def print_help(self):
@@ -70,624 +431,5515 @@ class Args(object):
 ###############################################################################
 ###############################################################################
 ##
-## Auth0
+## Helpers
 ##
 ###############################################################################
 ###############################################################################
 
 
-class Auth0(object):
+class LazyJSON(object):
 
-    def __init__( self, 
-                  client_id=None, 
-                  client_secret=None,
-                  auth0_domain=None ):
+    ##
+    ## defers pretty-printing until a log record is actually emitted
+    ##
+    def __init__(self, data):
+        self.data = data
 
-        if client_id is None or client_secret is None or auth0_domain is None:
-            ##
-            ## get client_id, client_secret, auth0_domain from env
-            ##
-            self.client_id = os.environ.get('AUTH0_CLIENT_ID')
-            self.client_secret = os.environ.get('AUTH0_CLIENT_SECRET')
-            self.auth0_domain = os.environ.get('AUTH0_DOMAIN')
+    def __str__(self):
+        return json.dumps(self.data, indent=4)
 
-        else:
 
-            self.client_id = client_id
-            self.client_secret = client_secret
-            self.auth0_domain = auth0_domain
+class DeadlineExceeded(Exception):
 
+    ##
+    ## raised instead of starting work that cannot finish before the deadline
+    ##
+    pass
 
-        base_url = 'https://{}'.format(self.auth0_domain)
 
-        self.mgmt_endpoint = os.environ.get('AUTH0_MGMT_API_ENDPOINT')
+def configure_logging(verbose=False):
 
-        print('[+] Auth0 Domain (reflects custom domain): {}'.format(self.auth0_domain))
-        print('[+] Base URL: {}'.format(base_url))
-        print('[+] Auth0 MGMT Endpoint: {}'.format(self.mgmt_endpoint))
+    ##
+    ## INFO gives one compact line per request ... DEBUG (--verbose) adds
+    ## URLs, payloads and full response bodies
+    ##
+    logger.setLevel(logging.DEBUG if verbose else logging.INFO)
 
+    if not logging.getLogger().handlers:
+        logging.basicConfig(format='%(message)s')
 
-        ##
-        ## use the base MGMT FQDN to get token
-        ##
-        auth0_domain = 'https://{}'.format(urlparse(self.mgmt_endpoint).netloc)
-        print('[+] Auth0 Domain (reflects MGMT domain): {}'.format(auth0_domain))
+    return logger
 
-        ##
-        ##********************************************************************
-        ##
-        ## URL Formats for Token endpoint:
-        ##
-        ##      https://[AUTH0_DOMAIN]/oauth/token
-        ##
-        ##********************************************************************
-        ##
-        if auth0_domain.endswith('/'):
-            self.token_endpoint = '{}oauth/token'.format(auth0_domain)
-        else:
-            self.token_endpoint = '{}/oauth/token'.format(auth0_domain)
 
-        print('[+] Token Endpoint: {}'.format(self.token_endpoint))
+def request_bytes(response):
 
-        ##
-        ##********************************************************************
-        ##
-        ## URL Formats for Global Branding API:
-        ##
-        ##      https://[AUTH0_DOMAIN]/api/v2/branding
-        ##
-        ##********************************************************************
-        ##
-        if self.mgmt_endpoint.endswith('/'):
-            self.global_branding_url = '{}branding'.format(self.mgmt_endpoint)
-        else:
-            self.global_branding_url = '{}/branding'.format(self.mgmt_endpoint)
+    body = response.request.body if response.request is not None else None
 
-        print('[+] Global Branding URL: {}'.format(self.global_branding_url))
+    return len(body) if body is not None else 0
 
 
-        ##
-        ##********************************************************************
-        ##
-        ## URL Formats for Branding Themes API:
-        ##
-        ##      https://[AUTH0_DOMAIN]/api/v2/branding/themes
-        ##      https://[AUTH0_DOMAIN]/api/v2/branding/themes/default
-        ##      https://[AUTH0_DOMAIN]/api/v2/branding/themes/{ID}
-        ##
-        ##********************************************************************
-        ##
-        if self.mgmt_endpoint.endswith('/'):
-            self.branding_themes_url = '{}branding/themes'.format(self.mgmt_endpoint)
-        else:
-            self.branding_themes_url = '{}/branding/themes'.format(self.mgmt_endpoint)
+def resource_type(url):
 
-        self.default_branding_themes_url = '{}/default'.format(self.branding_themes_url)
+    path = urlparse(url).path
 
-        print('[+] Branding Themes URL: {}'.format(self.branding_themes_url))
-        print('[+] Branding Themes Default URL: {}'.format(self.default_branding_themes_url))
+    if path.endswith('/oauth/token'):
+        return 'token'
+    if '/branding/templates/' in path:
+        return 'template'
+    if '/branding/themes' in path:
+        return 'theme'
+    if '/custom-text/' in path:
+        return 'prompt'
+    if path.endswith('/branding'):
+        return 'global_branding'
 
+    return 'other'
 
-        ##
-        ##********************************************************************
-        ##
-        ## URL Formats for Prompts API:
-        ##
-        ##      https://[AUTH0_DOMAIN]/api/v2/prompts
-        ##      https://[AUTH0_DOMAIN]/api/v2/prompts/{prompt}/custom-text/{language}
-        ##
-        ##********************************************************************
-        ##
 
-        if self.mgmt_endpoint.endswith('/'):
-            self.prompts_url = '{}prompts'.format(self.mgmt_endpoint)
-        else:
-            self.prompts_url = '{}/prompts'.format(self.mgmt_endpoint)
+def log_request(method, url, response, duration):
+
+    bytes_sent = request_bytes(response)
+
+    logger.info('[+] method=%s path=%s status=%s duration_ms=%d bytes_sent=%d bytes_received=%d',
+        method, urlparse(url).path, response.status_code, duration * 1000,
+        bytes_sent, len(response.content))
+
+
+def percentile(values, pct):
+
+    ##
+    ## nearest-rank percentile of an unsorted list
+    ##
+    if not values:
+        return 0.0
+
+    values = sorted(values)
+    rank = max(0, int(round(pct / 100.0 * len(values) + 0.5)) - 1)
+
+    return values[min(rank, len(values) - 1)]
+
+
+##
+## config files memoized by path, keyed on mtime and size, so warm Lambda
+## invocations don't re-read and re-parse unchanged inputs
+##
+FILE_CACHE = {}
+FILE_CACHE_LOCK = threading.Lock()
 
-        print('[+] Custom Prompts URL: {}'.format(self.prompts_url))
 
+def load_file(path, parse_json=False):
+
+    stat = os.stat(path)
+    key = tuple([os.path.abspath(path), parse_json])
+    version = tuple([stat.st_mtime_ns, stat.st_size])
+
+    with FILE_CACHE_LOCK:
+        cached = FILE_CACHE.get(key)
+
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    if parse_json is True:
+        with open(path, 'rb') as f:
+            content = json.load(f)
+    else:
+        with open(path, 'r') as f:
+            content = f.read()
+
+    with FILE_CACHE_LOCK:
+        FILE_CACHE[key] = tuple([version, content])
+
+    return content
+
+
+def load_json(path):
+    return load_file(path, parse_json=True)
+
+
+def load_text(path):
+    return load_file(path, parse_json=False)
+
+
+def response_body(response):
+
+    ##
+    ## the JSON body when there is one, otherwise the response itself ... an
+    ## error status is always kept, so a proxy's HTML page or an empty 5xx
+    ## is not mistaken for success
+    ##
+    try:
+        response_data = response.json()
+    except ValueError:
+        return response
+
+    if response.status_code >= 400:
+        if not isinstance(response_data, dict):
+            return response
+
+        response_data.setdefault('statusCode', response.status_code)
+
+    return response_data
+
+
+def response_status(response_data):
+
+    if isinstance(response_data, dict):
+        return response_data.get('statusCode')
+
+    return getattr(response_data, 'status_code', None)
+
+
+def response_error(response_data):
+
+    ##
+    ## the Management API reports failures as a JSON error body ... anything
+    ## else is judged by its HTTP status
+    ##
+    if isinstance(response_data, dict):
+        if (response_data.get('statusCode') or 0) >= 400:
+            return response_data.get('message', response_data.get('error'))
+
+        return None
+
+    status = getattr(response_data, 'status_code', None)
+
+    if status is not None and status >= 400:
+        return 'HTTP {} {}'.format(status, response_data.reason or '').strip()
+
+    return None
+
+
+def matches(desired, current, exact=False):
+
+    ##
+    ## structural comparison of local config against tenant state ... with
+    ## exact=False the tenant may carry extra keys the local config omits
+    ##
+    if isinstance(desired, dict):
+
+        if not isinstance(current, dict):
+            return False
+
+        if exact is True and set(desired) != set(current):
+            return False
+
+        for k in desired:
+            if k not in current or not matches(desired[k], current[k], exact=exact):
+                return False
+
+        return True
+
+    if isinstance(desired, list):
+
+        if not isinstance(current, list) or len(desired) != len(current):
+            return False
+
+        return all(matches(d, c, exact=exact) for d, c in zip(desired, current))
+
+    if isinstance(desired, bool) or isinstance(current, bool):
+        return desired is current
+
+    return desired == current
+
+
+def global_branding_data(json_data):
+
+    ##
+    ## the subset of a branding profile mirrored into global /branding
+    ##
+    if json_data is not None and 'widget' in json_data:
+        if 'logo_url' in json_data['widget']:
+            return {
+                'favicon_url': json_data['widget']['logo_url'],
+                'logo_url': json_data['widget']['logo_url']
+            }
+
+    return None
+
+
+def prompt_key(prompt, language):
+    return 'prompts/{}/{}'.format(prompt, language)
+
+
+def content_hash(content):
+
+    ##
+    ## JSON is hashed in canonical form so key order and whitespace in the
+    ## source files never register as a change
+    ##
+    if not isinstance(content, str):
+        content = json.dumps(content, sort_keys=True, separators=(',', ':'))
+
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def header_number(headers, name):
+
+    try:
+        return float(headers.get(name))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt):
+
+    ##
+    ## exponential backoff with full jitter
+    ##
+    return random.uniform(0, min(MAX_BACKOFF, BASE_BACKOFF * (2 ** attempt)))
+
+
+def retry_delay(response, attempt):
+
+    ##
+    ## honour Retry-After, then the rate limit reset, then fall back to
+    ## jittered exponential backoff
+    ##
+    retry_after = header_number(response.headers, 'Retry-After')
+
+    if retry_after is not None:
+        return min(MAX_BACKOFF, max(0.0, retry_after))
+
+    if response.status_code == 429:
+        reset = header_number(response.headers, 'X-RateLimit-Reset')
+
+        if reset is not None:
+            return min(MAX_BACKOFF, max(0.0, reset - time.time()) + random.uniform(0, BASE_BACKOFF))
+
+    return backoff_delay(attempt)
+
+
+def unique_tmp_file(path):
+    return '{}.{}.{}.tmp'.format(path, os.getpid(), threading.get_ident())
+
+
+def plan_changes(plan):
+
+    changes = []
+
+    for resource in ['branding', 'global_branding', 'template']:
+        entry = plan.get(resource)
+        if entry is not None:
+            changes.append(tuple([resource, entry['action']]))
+
+    for p in plan.get('prompts', []):
+        changes.append(tuple([prompt_key(p['prompt'], p['language']), p['action']]))
+
+    return changes
+
+
+def plan_summary(plan):
+
+    changes = plan_changes(plan)
+
+    unchanged = len([c for c in changes if c[1] == 'unchanged'])
+
+    return {
+        'unchanged' : unchanged,
+        'patched' : len(changes) - unchanged
+    }
+
+
+def write_if_changed(path, content):
+
+    ##
+    ## leave the file (and its mtime) alone when the content is the same
+    ##
+    try:
+        with open(path, 'r') as f:
+            if content_hash(f.read()) == content_hash(content):
+                return False
+    except OSError:
+        pass
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    tmp_file = unique_tmp_file(path)
+
+    with open(tmp_file, 'w') as f:
+        f.write(content)
+
+    os.replace(tmp_file, path)
+
+    return True
+
+
+###############################################################################
+###############################################################################
+##
+## Overlays - a base branding profile plus override layers, deep merged
+##
+##  layers are applied in order ... dicts merge key by key, anything else
+##  replaces, and null removes the key. Untouched subtrees are shared with
+##  the layer below rather than copied, so the results must be treated as
+##  read-only
+##
+###############################################################################
+###############################################################################
+
+
+##
+## layer hashes by (path, mtime, size), and merged results by the hashes of
+## every layer up to that point ... a base plus brand prefix shared by many
+## tenants is merged once
+##
+LAYER_CACHE = {}
+MERGE_CACHE = {}
+OVERLAY_LOCK = threading.Lock()
+
+
+def deep_merge(base, overlay):
+
+    if not isinstance(base, dict) or not isinstance(overlay, dict):
+        return overlay
+
+    merged = dict(base)
+
+    for k, v in overlay.items():
+        if v is None:
+            merged.pop(k, None)
+        elif k in merged:
+            merged[k] = deep_merge(merged[k], v)
+        else:
+            merged[k] = v
+
+    return merged
+
+
+def restore_patch(current, saved):
+
+    ##
+    ## the overlay that deep_merge(current, overlay) turns back into saved ...
+    ## a field added since saved was captured is sent as null to clear it
+    ##
+    if not isinstance(current, dict) or not isinstance(saved, dict):
+        return saved
+
+    patch = dict([(k, None) for k in current if k not in saved])
+
+    for k, v in saved.items():
+        patch[k] = restore_patch(current.get(k), v)
+
+    return patch
+
+
+def load_layer(path):
+
+    stat = os.stat(path)
+    key = tuple([os.path.abspath(path), stat.st_mtime_ns, stat.st_size])
+
+    with OVERLAY_LOCK:
+        cached = LAYER_CACHE.get(key)
+
+    if cached is not None:
+        return cached
+
+    data = load_json(path)
+    layer = tuple([content_hash(data), data])
+
+    with OVERLAY_LOCK:
+        LAYER_CACHE[key] = layer
+
+    return layer
+
+
+def resolve_branding(paths):
+
+    paths = [p for p in paths if p]
+
+    if not paths:
+        return None
+
+    merged = None
+    hashes = tuple()
+
+    for path in paths:
+        layer_hash, data = load_layer(path)
+        hashes = hashes + tuple([layer_hash])
+
+        with OVERLAY_LOCK:
+            cached = MERGE_CACHE.get(hashes)
+
+        if cached is not None:
+            merged = cached
+            continue
+
+        merged = data if merged is None else deep_merge(merged, data)
+
+        with OVERLAY_LOCK:
+            merged = MERGE_CACHE.setdefault(hashes, merged)
+
+    return merged
+
+
+###############################################################################
+###############################################################################
+##
+## Catalogs - translation catalogs streamed into prompt custom-text payloads
+##
+##  every catalog row is (prompt, language, screen, key, value) ... rows for
+##  one prompt must be contiguous within a file, so a payload is complete
+##  and can be sent as soon as the next prompt starts
+##
+##  CSV          prompt,screen,key,value[,language]
+##  JSON lines   {"prompt": ..., "screen": ..., "key": ..., "value": ...[, "language": ...]}
+##  PO           msgctxt "prompt/screen", msgid "key", msgstr "value"
+##
+##  the language defaults to the last dotted part of the file name, e.g.
+##  fr.csv or login.pt-BR.po, when that looks like a language tag, and a PO
+##  "Language:" header overrides it
+##
+###############################################################################
+###############################################################################
+
+
+PO_ESCAPES = {'n' : '\n', 't' : '\t', 'r' : '\r', '"' : '"', '\\' : '\\'}
+
+LANGUAGE_TAG = re.compile(r'^[a-z]{2,3}(-[A-Za-z0-9]{2,8})*$')
+
+
+def catalog_language(path):
+
+    name = os.path.basename(path).rsplit('.', 1)[0]
+    language = name.rsplit('.', 1)[-1]
+
+    ##
+    ## catalog.csv or messages.po name no language ... the rows, or the PO
+    ## header, have to
+    ##
+    if LANGUAGE_TAG.match(language) is None:
+        return None
+
+    return language
+
+
+def read_csv_catalog(path):
+
+    language = catalog_language(path)
+
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            yield tuple([row['prompt'], row.get('language') or language, row['screen'], row['key'], row['value']])
+
+
+def read_jsonl_catalog(path):
+
+    language = catalog_language(path)
+
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+
+            row = json.loads(line)
+
+            yield tuple([row['prompt'], row.get('language') or language, row['screen'], row['key'], row['value']])
+
+
+def po_string(text):
+    return re.sub(r'\\(.)', lambda m: PO_ESCAPES.get(m.group(1), m.group(1)), text.strip()[1:-1])
+
+
+def read_po_catalog(path):
+
+    language = catalog_language(path)
+
+    entry = {}
+    field = None
+
+    def flush():
+        nonlocal language
+
+        ##
+        ## the header entry (empty msgid) carries the catalog language
+        ##
+        if entry.get('msgid') == '' and 'msgctxt' not in entry:
+            match = re.search(r'^Language:\s*(\S+)', entry.get('msgstr', ''), re.M)
+            if match is not None:
+                language = match.group(1)
+            return None
+
+        if 'msgctxt' in entry and entry.get('msgstr'):
+            prompt, screen = entry['msgctxt'].split('/', 1)
+            return tuple([prompt, language, screen, entry['msgid'], entry['msgstr']])
+
+        return None
+
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+
+            if line.startswith('#'):
+                continue
+
+            ##
+            ## a blank line, or a new msgctxt, ends the entry
+            ##
+            if not line or (line.startswith('msgctxt') and 'msgid' in entry):
+                row = flush()
+
+                if row is not None:
+                    yield row
+
+                entry = {}
+                field = None
+
+                if not line:
+                    continue
+
+            if line.startswith('"'):
+                if field is not None:
+                    entry[field] += po_string(line)
+                continue
+
+            field, _, value = line.partition(' ')
+            entry[field] = po_string(value)
+
+    row = flush()
+
+    if row is not None:
+        yield row
+
+
+def read_catalog(path):
+
+    if path.endswith('.csv'):
+        return read_csv_catalog(path)
+
+    if path.endswith('.po'):
+        return read_po_catalog(path)
+
+    if path.endswith('.jsonl') or path.endswith('.ndjson'):
+        return read_jsonl_catalog(path)
+
+    raise ValueError('{}: unknown catalog format, expected .csv, .po or .jsonl'.format(path))
+
+
+def catalog_payloads(paths, errors=None, keys=None):
+
+    ##
+    ## yields (prompt, language, screens) one payload at a time ... only the
+    ## payload being assembled is held in memory. each record is checked as
+    ## it is read, the first bad one goes into errors and ends the stream.
+    ## the payload it was part of is never sent, keys holds the prompt keys
+    ## of those that were
+    ##
+    errors = errors if errors is not None else []
+    keys = keys if keys is not None else []
+    seen = {}
+
+    for path in paths:
+
+        current = None
+        screens = None
+
+        try:
+            for prompt, language, screen, key, value in read_catalog(path):
+
+                if language is None:
+                    errors.append('{}: no language for {} ... name the file after it (fr.csv) '
+                        'or add a language column'.format(path, prompt))
+                    return
+
+                if tuple([prompt, language]) != current:
+
+                    if tuple([prompt, language]) in seen:
+                        ##
+                        ## a second payload would replace the first
+                        ##
+                        if seen[tuple([prompt, language])] == path:
+                            errors.append('{}: rows for {} / {} are not contiguous'.format(path, prompt, language))
+                        else:
+                            errors.append('{}: rows for {} / {} are also in {}'.format(
+                                path, prompt, language, seen[tuple([prompt, language])]))
+                        return
+
+                    if current is not None:
+                        keys.append(prompt_key(current[0], current[1]))
+                        yield tuple([current[0], current[1], screens])
+
+                    current = tuple([prompt, language])
+                    seen[current] = path
+                    screens = {}
+
+                screens.setdefault(screen, {})[key] = value
+
+        except (OSError, ValueError, KeyError, csv.Error) as e:
+            errors.append('{}: cannot read catalog: {}'.format(path, e))
+            return
+
+        if current is not None:
+            keys.append(prompt_key(current[0], current[1]))
+            yield tuple([current[0], current[1], screens])
+
+
+###############################################################################
+###############################################################################
+##
+## Bundle - validated, content-addressed branding / prompts / template
+##
+##  {
+##      "format": 1,
+##      "id": "<sha256 of hashes>",
+##      "hashes": { "branding": "...", "prompts/login/en": "...", "template": "..." },
+##      "branding": { ... },
+##      "prompts": { ... },
+##      "template": "..."
+##  }
+##
+###############################################################################
+###############################################################################
+
+
+HEX_COLOR = re.compile(r'^#([0-9a-fA-F]{3}|[0-9a-fA-F]{6})$')
+
+LIQUID_TAGS = {
+    'auth0:head' : re.compile(r'\{%-?\s*auth0:head\s*-?%\}'),
+    'auth0:widget' : re.compile(r'\{%-?\s*auth0:widget\s*-?%\}')
+}
+
+STYLES = ['sharp', 'rounded', 'pill']
+ALIGNMENTS = ['left', 'right', 'center']
+
+##
+## mirrors the option tables in README.md
+##
+BRANDING_SCHEMA = {
+    'borders' : {
+        'button_border_weight' : 'int',
+        'buttons_style' : STYLES,
+        'button_border_radius' : 'int',
+        'input_border_weight' : 'int',
+        'inputs_style' : STYLES,
+        'input_border_radius' : 'int',
+        'widget_corner_radius' : 'int',
+        'widget_border_weight' : 'int',
+        'show_widget_shadow' : 'bool'
+    },
+    'colors' : {
+        'primary_button' : 'hex',
+        'primary_button_label' : 'hex',
+        'secondary_button_border' : 'hex',
+        'secondary_button_label' : 'hex',
+        'base_focus_color' : 'hex',
+        'base_hover_color' : 'hex',
+        'links_focused_components' : 'hex',
+        'header' : 'hex',
+        'body_text' : 'hex',
+        'widget_background' : 'hex',
+        'widget_border' : 'hex',
+        'input_labels_placeholders' : 'hex',
+        'input_filled_text' : 'hex',
+        'input_border' : 'hex',
+        'input_background' : 'hex',
+        'icons' : 'hex',
+        'error' : 'hex',
+        'success' : 'hex'
+    },
+    'displayName' : 'string',
+    'fonts' : {
+        'font_url' : 'uri',
+        'reference_text_size' : 'int',
+        'title' : 'font',
+        'subtitle' : 'font',
+        'body_text' : 'font',
+        'buttons_text' : 'font',
+        'input_labels' : 'font',
+        'links' : 'font',
+        'links_style' : ['normal', 'underlined']
+    },
+    'page_background' : {
+        'page_layout' : ALIGNMENTS,
+        'background_color' : 'hex',
+        'background_image_url' : 'uri'
+    },
+    'widget' : {
+        'logo_position' : ALIGNMENTS,
+        'logo_url' : 'uri',
+        'logo_height' : 'int',
+        'header_text_alignment' : ALIGNMENTS,
+        'social_buttons_layout' : ['top', 'bottom']
+    }
+}
+
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def check_value(path, kind, value):
+
+    if isinstance(kind, dict):
+        if not isinstance(value, dict):
+            return ['{}: expected an object'.format(path)]
+
+        errors = []
+
+        for k in value:
+            if k not in kind:
+                errors.append('{}.{}: unknown option'.format(path, k))
+            else:
+                errors.extend(check_value('{}.{}'.format(path, k), kind[k], value[k]))
+
+        return errors
+
+    ##
+    ## an empty string resets a string option (enum, hex color or URL) to
+    ## the tenant default, as in examples/branding/default_BLANK.json
+    ##
+    if value == '' and (isinstance(kind, list) or kind in ['hex', 'uri']):
+        return []
+
+    if isinstance(kind, list):
+        if value not in kind:
+            return ['{}: expected one of {}, got {!r}'.format(path, kind, value)]
+
+    elif kind == 'int':
+        if not isinstance(value, int) or isinstance(value, bool):
+            return ['{}: expected an int, got {!r}'.format(path, value)]
+
+    elif kind == 'bool':
+        if not isinstance(value, bool):
+            return ['{}: expected true or false, got {!r}'.format(path, value)]
+
+    elif kind == 'string':
+        if not isinstance(value, str):
+            return ['{}: expected a string, got {!r}'.format(path, value)]
+
+    elif kind == 'hex':
+        if not isinstance(value, str) or HEX_COLOR.match(value) is None:
+            return ['{}: expected a hex color like #1e212a, got {!r}'.format(path, value)]
+
+    elif kind == 'uri':
+        if not isinstance(value, str):
+            return ['{}: expected a URL, got {!r}'.format(path, value)]
+
+        parsed = urlparse(value)
+
+        if (parsed.scheme not in ['http', 'https'] or not parsed.netloc):
+            return ['{}: expected an http(s) URL, got {!r}'.format(path, value)]
+
+    elif kind == 'font':
+        if not isinstance(value, dict):
+            return ['{}: expected a font object'.format(path)]
+
+        errors = []
+
+        for k in value:
+            if k not in ['bold', 'size']:
+                errors.append('{}.{}: unknown option'.format(path, k))
+
+        if 'bold' in value and not isinstance(value['bold'], bool):
+            errors.append('{}.bold: expected true or false, got {!r}'.format(path, value['bold']))
+
+        if 'size' in value and not is_number(value['size']):
+            errors.append('{}.size: expected a number, got {!r}'.format(path, value['size']))
+
+        return errors
+
+    return []
+
+
+def validate_branding(json_data):
+    return check_value('branding', BRANDING_SCHEMA, json_data)
+
+
+def validate_prompts(json_data):
+
+    ##
+    ## PROMPT -> LANGUAGE -> SCREEN -> KEY -> "VALUE"
+    ##
+    if not isinstance(json_data, dict):
+        return ['prompts: expected an object']
+
+    errors = []
+
+    for prompt, languages in json_data.items():
+
+        if not isinstance(languages, dict):
+            errors.append('prompts.{}: expected an object of languages'.format(prompt))
+            continue
+
+        for language, screens in languages.items():
+            path = 'prompts.{}.{}'.format(prompt, language)
+
+            if not isinstance(screens, dict):
+                errors.append('{}: expected an object of screens'.format(path))
+                continue
+
+            for screen, texts in screens.items():
+
+                if not isinstance(texts, dict):
+                    errors.append('{}.{}: expected an object of text keys'.format(path, screen))
+                    continue
+
+                for k, v in texts.items():
+                    if not isinstance(v, str):
+                        errors.append('{}.{}.{}: expected a string, got {!r}'.format(path, screen, k, v))
+
+    return errors
+
+
+def validate_template(html_data):
+
+    if not isinstance(html_data, str):
+        return ['template: expected text']
+
+    errors = []
+
+    for tag, pattern in LIQUID_TAGS.items():
+        if pattern.search(html_data) is None:
+            errors.append('template: missing required {{%- {} -%}} tag'.format(tag))
+
+    ##
+    ## match whole {% %} and {{ }} tokens ... CSS like "width:100%}" has a
+    ## closing delimiter of its own, so only an opener left over outside a
+    ## token (or one nested inside another token) is unbalanced
+    ##
+    tokens = LIQUID_MARKUP.findall(html_data)
+    rest = LIQUID_MARKUP.sub('', html_data)
+
+    if '{%' in rest or any('{%' in t[2:] or '{{' in t[2:] for t in tokens if t.startswith('{%')):
+        errors.append('template: unbalanced {% %} Liquid tags')
+
+    if '{{' in rest or any('{%' in t[2:] or '{{' in t[2:] for t in tokens if t.startswith('{{')):
+        errors.append('template: unbalanced {{ }} Liquid output tags')
+
+    return errors
+
+
+def resource_keys(branding_json=None, prompts_json=None, html_template=None):
+
+    ##
+    ## every tenant resource a deploy of these inputs would write
+    ##
+    keys = []
+
+    if branding_json is not None:
+        keys.append('branding')
+
+        if global_branding_data(branding_json) is not None:
+            keys.append('global_branding')
+
+    for prompt in (prompts_json or {}):
+        for language in prompts_json[prompt]:
+            keys.append(prompt_key(prompt, language))
+
+    if html_template is not None:
+        keys.append('template')
+
+    return keys
+
+
+def resource_hashes(branding_json=None, prompts_json=None, html_template=None):
+
+    hashes = {}
+
+    if branding_json is not None:
+        hashes['branding'] = content_hash(branding_json)
+
+    if prompts_json is not None:
+        for prompt in prompts_json:
+            for language in prompts_json[prompt]:
+                hashes[prompt_key(prompt, language)] = content_hash(prompts_json[prompt][language])
+
+    if html_template is not None:
+        hashes['template'] = content_hash(html_template)
+
+    return hashes
+
+
+def build_bundle(branding_json=None, prompts_json=None, html_template=None):
+
+    errors = []
+
+    if branding_json is not None:
+        errors.extend(validate_branding(branding_json))
+
+    if prompts_json is not None:
+        errors.extend(validate_prompts(prompts_json))
+
+    if html_template is not None:
+        errors.extend(validate_template(html_template))
+
+    if errors:
+        raise ValueError('\n'.join(errors))
+
+    hashes = resource_hashes(branding_json, prompts_json, html_template)
+
+    return {
+        'format' : BUNDLE_FORMAT,
+        'id' : content_hash(hashes),
+        'hashes' : hashes,
+        'branding' : branding_json,
+        'prompts' : prompts_json,
+        'template' : html_template
+    }
+
+
+def write_bundle(bundle, path):
+
+    ##
+    ## a directory gets a content-addressed file name
+    ##
+    if os.path.isdir(path):
+        path = os.path.join(path, 'bundle-{}.json'.format(bundle['id'][:16]))
+
+    tmp_file = unique_tmp_file(path)
+
+    with open(tmp_file, 'w') as f:
+        json.dump(bundle, f, sort_keys=True, separators=(',', ':'))
+
+    os.replace(tmp_file, path)
+
+    return path
+
+
+##
+## bundles already verified, by path ... warm invocations skip re-hashing
+## as long as load_file hands back the same parsed object
+##
+VERIFIED_BUNDLES = {}
+
+
+def load_bundle(path):
+
+    bundle = load_file(path, parse_json=True)
+    key = os.path.abspath(path)
+
+    if VERIFIED_BUNDLES.get(key) is bundle:
+        return bundle
+
+    if not isinstance(bundle, dict) or bundle.get('format') != BUNDLE_FORMAT:
+        raise ValueError('{}: not a version {} deployment bundle'.format(path, BUNDLE_FORMAT))
+
+    hashes = resource_hashes(bundle.get('branding'), bundle.get('prompts'), bundle.get('template'))
+
+    if hashes != bundle.get('hashes') or content_hash(hashes) != bundle.get('id'):
+        raise ValueError('{}: bundle content does not match its hashes'.format(path))
+
+    logger.debug('[+] Loaded bundle %s from %s', bundle['id'], path)
+
+    VERIFIED_BUNDLES[key] = bundle
+
+    return bundle
+
+
+###############################################################################
+###############################################################################
+##
+## Template build - compose partials and minify, leaving Liquid untouched
+##
+##  a line holding only an include directive is replaced by the partial,
+##  resolved relative to the including file and indented to match
+##
+##      /* include: partials/footer.css */
+##      <!-- include: partials/footer.html -->
+##
+###############################################################################
+###############################################################################
+
+
+INCLUDE_DIRECTIVE = re.compile(r'^([ \t]*)(?:<!--|/\*)\s*include:\s*(\S+?)\s*(?:-->|\*/)[ \t]*$', re.M)
+
+LIQUID_MARKUP = re.compile(r'\{%.*?%\}|\{\{.*?\}\}', re.S)
+LIQUID_PLACEHOLDER = re.compile('\x00[TO](\\d+)\x00')
+CSS_STRING = re.compile(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'')
+CSS_PLACEHOLDER = re.compile('\x01(\\d+)\x01')
+
+RAW_BLOCK = re.compile(r'(<(script|style|pre|textarea)\b[^>]*>)(.*?)(</\2\s*>)', re.S | re.I)
+HTML_COMMENT = re.compile(r'<!--(?!\[if).*?-->', re.S)
+
+##
+## whitespace with a line break between two tags (or Liquid tags) is
+## indentation ... anything else collapses to a single space
+##
+BLOCK_GAP = re.compile('(>|\x00T\\d+\x00|^)[ \\t]*\\n\\s*(?=<|\x00T\\d+\x00|$)')
+
+##
+## built templates keyed by (hash of the composed source, minify)
+##
+TEMPLATE_CACHE = {}
+TEMPLATE_CACHE_LOCK = threading.Lock()
+
+
+def compose_template(path, parents=None, sources=None):
+
+    ##
+    ## sources, when given, collects every file the template was built from
+    ##
+    path = os.path.abspath(path)
+    parents = parents or []
+
+    if path in parents:
+        raise ValueError('{}: include cycle through {}'.format(parents[0], path))
+
+    if sources is not None:
+        sources.append(path)
+
+    text = load_text(path)
+    base = os.path.dirname(path)
+
+    def include(m):
+        indent, name = m.group(1), m.group(2)
+
+        try:
+            partial = compose_template(os.path.join(base, name), parents + [path], sources)
+        except OSError as e:
+            raise ValueError('{}: cannot include {}: {}'.format(path, name, e))
+
+        lines = partial.rstrip('\n').split('\n')
+
+        return '\n'.join([indent + line if line else line for line in lines])
+
+    return INCLUDE_DIRECTIVE.sub(include, text)
+
+
+def minify_css(css):
+
+    strings = []
+
+    def protect(m):
+        strings.append(m.group(0))
+        return '\x01{}\x01'.format(len(strings) - 1)
+
+    css = CSS_STRING.sub(protect, css)
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{};,>])\s*', r'\1', css)
+    css = re.sub(r':\s+', ':', css)
+    css = css.replace(';}', '}')
+
+    return CSS_PLACEHOLDER.sub(lambda m: strings[int(m.group(1))], css.strip())
+
+
+def minify_markup(html):
+
+    html = HTML_COMMENT.sub('', html)
+    html = BLOCK_GAP.sub(r'\1', html)
+
+    return re.sub(r'\s+', ' ', html)
+
+
+def minify_html(html):
+
+    ##
+    ## Liquid is swapped out for placeholders first so nothing below can
+    ## touch it ... T for {% tags %}, O for {{ output }}
+    ##
+    liquid = []
+
+    def protect(m):
+        liquid.append(m.group(0))
+        kind = 'T' if m.group(0).startswith('{%') else 'O'
+        return '\x00{}{}\x00'.format(kind, len(liquid) - 1)
+
+    html = LIQUID_MARKUP.sub(protect, html)
+
+    parts = []
+    pos = 0
+
+    for m in RAW_BLOCK.finditer(html):
+        parts.append(minify_markup(html[pos:m.start()]))
+
+        body = m.group(3)
+
+        if m.group(2).lower() == 'style':
+            body = minify_css(body)
+
+        parts.append(m.group(1) + body + m.group(4))
+        pos = m.end()
+
+    parts.append(minify_markup(html[pos:]))
+
+    return LIQUID_PLACEHOLDER.sub(lambda m: liquid[int(m.group(1))], ''.join(parts))
+
+
+def build_template(path, minify=False, sources=None):
+
+    composed = compose_template(path, sources=sources)
+    key = tuple([content_hash(composed), minify])
+
+    with TEMPLATE_CACHE_LOCK:
+        cached = TEMPLATE_CACHE.get(key)
+
+    if cached is not None:
+        return cached
+
+    html = minify_html(composed) if minify is True else composed
+
+    logger.debug('[+] Built template %s: %s -> %s bytes', path, len(composed), len(html))
+
+    with TEMPLATE_CACHE_LOCK:
+        TEMPLATE_CACHE[key] = html
+
+    return html
+
+
+def load_inputs(event):
+
+    ##
+    ## a bundle replaces the three separate input files
+    ##
+    if event.get('bundle'):
+        bundle = load_bundle(event['bundle'])
+        return tuple([bundle['branding'], bundle['prompts'], bundle['template']])
+
+    branding_json = resolve_branding([event.get('branding_json')] + (event.get('branding_overlays') or []))
+    prompts_json = load_json(event['prompts_json']) if event.get('prompts_json') else None
+    html_template = build_template(event['html_template'], minify=event.get('minify', False)) \
+        if event.get('html_template') else None
+
+    return tuple([branding_json, prompts_json, html_template])
+
+
+###############################################################################
+###############################################################################
+##
+## Token Cache - access tokens keyed by (mgmt endpoint, client_id, audience)
+##
+###############################################################################
+###############################################################################
+
+
+class TokenCache(object):
+
+    def __init__(self, cache_file=None, margin=TOKEN_EXPIRY_MARGIN):
+
+        self.cache_file = cache_file
+        self.margin = margin
+        self.tokens = {}
+        self.removed = set()
+        self.lock = threading.Lock()
+
+        if self.cache_file is not None:
+            self.load()
+
+
+    def key_string(self, key):
+        return '|'.join([str(k) for k in key])
+
+
+    def get(self, key):
+
+        with self.lock:
+            entry = self.tokens.get(self.key_string(key))
+
+        if entry is None:
+            return None
+
+        ##
+        ## refresh early ... never hand out a token inside the safety margin
+        ##
+        if entry['expires_at'] - self.margin <= time.time():
+            return None
+
+        return entry['access_token']
+
+
+    def expires_at(self, key):
+
+        with self.lock:
+            entry = self.tokens.get(self.key_string(key))
+
+        return entry['expires_at'] if entry is not None else None
+
+
+    def put(self, key, access_token, expires_in=None):
+
+        ##
+        ## without a lifetime there is nothing safe to cache
+        ##
+        if expires_in is None:
+            return
+
+        entry = {
+            'access_token' : access_token,
+            'expires_at' : time.time() + int(expires_in)
+        }
+
+        with self.lock:
+            self.tokens[self.key_string(key)] = entry
+            self.removed.discard(self.key_string(key))
+
+        self.save()
+
+
+    def invalidate(self, key):
+
+        with self.lock:
+            self.tokens.pop(self.key_string(key), None)
+            self.removed.add(self.key_string(key))
+
+        self.save()
+
+
+    def load(self):
+
+        try:
+            with open(self.cache_file, 'r') as f:
+                tokens = json.load(f)
+        except (OSError, ValueError):
+            return
+
+        now = time.time()
+
+        with self.lock:
+            for k, entry in tokens.items():
+                if entry.get('expires_at', 0) > now:
+                    self.tokens[k] = entry
+
+
+    def save(self):
+
+        if self.cache_file is None:
+            return
+
+        with file_lock(self.cache_file):
+
+            ##
+            ## other clients (fleet workers) may share the file ... merge our
+            ## entries into what is on disk rather than overwriting theirs
+            ##
+            try:
+                with open(self.cache_file, 'r') as f:
+                    tokens = json.load(f)
+            except (OSError, ValueError):
+                tokens = {}
+
+            with self.lock:
+                for k in self.removed:
+                    tokens.pop(k, None)
+                tokens.update(self.tokens)
+
+            now = time.time()
+            tokens = dict([(k, v) for k, v in tokens.items() if v.get('expires_at', 0) > now])
+
+            ##
+            ## tokens are credentials ... keep the cache file owner-only and
+            ## replace it atomically so a concurrent reader never sees half a file
+            ##
+            tmp_file = unique_tmp_file(self.cache_file)
+            fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+
+            with os.fdopen(fd, 'w') as f:
+                json.dump(tokens, f)
+
+            os.replace(tmp_file, self.cache_file)
+
+
+##
+## in-memory token cache shared by every client in this process
+##
+TOKEN_CACHE = TokenCache()
+
+##
+## serializes read-merge-write of cache and state files between threads
+##
+FILE_LOCK = threading.Lock()
+
+
+@contextlib.contextmanager
+def file_lock(path):
+
+    ##
+    ## FILE_LOCK only covers threads ... process workers and concurrent runs
+    ## also take an exclusive flock on a sidecar file, since the shared file
+    ## itself is swapped out by os.replace
+    ##
+    try:
+        import fcntl
+    except ImportError:
+        fcntl = None
+
+    with FILE_LOCK:
+
+        if fcntl is None:
+            yield
+            return
+
+        fd = os.open(path + '.lock', os.O_RDWR | os.O_CREAT, 0o600)
+
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+
+###############################################################################
+###############################################################################
+##
+## Theme Cache - default branding theme ID per tenant
+##
+###############################################################################
+###############################################################################
+
+
+class ThemeCache(object):
+
+    def __init__(self, cache_file=None):
+
+        self.cache_file = cache_file
+        self.themes = {}
+        self.removed = set()
+        self.lock = threading.Lock()
+
+        if self.cache_file is not None:
+            try:
+                with open(self.cache_file, 'r') as f:
+                    self.themes = json.load(f)
+            except (OSError, ValueError):
+                self.themes = {}
+
+
+    def get(self, tenant):
+
+        with self.lock:
+            return self.themes.get(tenant)
+
+
+    def put(self, tenant, theme_id):
+
+        with self.lock:
+            self.themes[tenant] = theme_id
+            self.removed.discard(tenant)
+
+        self.save()
+
+
+    def invalidate(self, tenant):
+
+        with self.lock:
+            self.themes.pop(tenant, None)
+            self.removed.add(tenant)
+
+        self.save()
+
+
+    def save(self):
+
+        if self.cache_file is None:
+            return
+
+        with file_lock(self.cache_file):
+
+            try:
+                with open(self.cache_file, 'r') as f:
+                    themes = json.load(f)
+            except (OSError, ValueError):
+                themes = {}
+
+            with self.lock:
+                for k in self.removed:
+                    themes.pop(k, None)
+                themes.update(self.themes)
+
+            tmp_file = unique_tmp_file(self.cache_file)
+
+            with open(tmp_file, 'w') as f:
+                json.dump(themes, f, indent=4, sort_keys=True)
+
+            os.replace(tmp_file, self.cache_file)
+
+
+##
+## in-memory theme ID cache shared by every client in this process
+##
+THEME_CACHE = ThemeCache()
+
+
+###############################################################################
+###############################################################################
+##
+## Asset Pre-flight - every URL the branding and template reference is
+## checked before anything is pushed to the tenant
+##
+###############################################################################
+###############################################################################
+
+
+##
+## where each branding field ends up and what it has to serve
+##
+BRANDING_ASSETS = [
+    (('widget', 'logo_url'), 'image'),
+    (('page_background', 'background_image_url'), 'image'),
+    (('fonts', 'font_url'), 'font')
+]
+
+ASSET_TYPES = {
+    'image' : ['image/'],
+    'font' : ['font/', 'application/font', 'application/x-font', 'application/vnd.ms-fontobject', 'text/css'],
+    'stylesheet' : ['text/css'],
+    'script' : ['application/javascript', 'text/javascript', 'application/x-javascript'],
+    'asset' : []
+}
+
+CSS_URL = re.compile(r'url\(\s*([\'"]?)(.*?)\1\s*\)', re.S)
+HTML_ASSET = re.compile(r'<(img|script|link|source)\b([^>]*)>', re.S | re.I)
+HTML_ATTRIBUTE = r'\b{}\s*=\s*([\'"])(.*?)\1'
+
+
+def asset_urls(branding_json=None, html_template=None):
+
+    ##
+    ## (source, url, kind) for every absolute http(s) URL ... Liquid
+    ## variables like {{ branding.logo_url }} are resolved by Auth0 and
+    ## are covered by the branding fields themselves
+    ##
+    found = []
+
+    for path, kind in BRANDING_ASSETS:
+
+        value = branding_json or {}
+        for key in path:
+            value = value.get(key) if isinstance(value, dict) else None
+
+        if value:
+            found.append(tuple(['branding.' + '.'.join(path), value, kind]))
+
+    if html_template:
+
+        for m in CSS_URL.finditer(html_template):
+            kind = 'font' if re.search(r'\.(woff2?|ttf|otf|eot)(\?|#|$)', m.group(2), re.I) else 'image'
+            found.append(tuple(['template url()', m.group(2), kind]))
+
+        for m in HTML_ASSET.finditer(html_template):
+            tag = m.group(1).lower()
+            url = re.search(HTML_ATTRIBUTE.format('href' if tag == 'link' else 'src'), m.group(2), re.S | re.I)
+
+            if url is None:
+                continue
+
+            if tag == 'link':
+                rel = re.search(HTML_ATTRIBUTE.format('rel'), m.group(2), re.I)
+                rel = rel.group(2).lower() if rel else ''
+
+                if 'stylesheet' in rel:
+                    kind = 'stylesheet'
+                elif 'icon' in rel:
+                    kind = 'image'
+                else:
+                    continue
+
+            elif tag == 'script':
+                kind = 'script'
+
+            else:
+                kind = 'image' if tag == 'img' else 'asset'
+
+            found.append(tuple(['template <{}>'.format(tag), url.group(2), kind]))
+
+    assets = []
+    seen = set()
+
+    for source, url, kind in found:
+
+        url = url.strip()
+
+        if '{{' in url or '{%' in url or not re.match(r'^https?://', url, re.I):
+            continue
+
+        if (url, kind) in seen:
+            continue
+
+        seen.add(tuple([url, kind]))
+        assets.append(tuple([source, url, kind]))
+
+    return assets
+
+
+class AssetChecker(object):
+
+    def __init__(self, ttl=ASSET_TTL, max_bytes=MAX_ASSET_BYTES,
+            connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT):
+
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.timeout = tuple([connect_timeout, read_timeout])
+        self.results = {}
+        self.pending = {}
+        self.session = None
+        self.lock = threading.Lock()
+
+
+    def get_session(self):
+
+        with self.lock:
+
+            if self.session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                self.session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=DEFAULT_POOL_SIZE, pool_maxsize=DEFAULT_POOL_SIZE)
+                self.session.mount('https://', adapter)
+                self.session.mount('http://', adapter)
+
+            return self.session
+
+
+    def fetch(self, url):
+
+        ##
+        ## HEAD first ... fall back to a streamed GET, read no further than
+        ## max_bytes, when the server refuses HEAD or leaves out the length
+        ##
+        session = self.get_session()
+
+        response = session.head(url, allow_redirects=True, timeout=self.timeout)
+        content_type = response.headers.get('content-type', '')
+        length = header_number(response.headers, 'content-length')
+
+        if response.status_code in [405, 501] or (response.status_code < 400 and length is None):
+
+            response = session.get(url, allow_redirects=True, stream=True, timeout=self.timeout)
+
+            try:
+                content_type = response.headers.get('content-type', '')
+                length = header_number(response.headers, 'content-length')
+
+                if length is None and response.status_code < 400:
+                    length = 0
+                    for chunk in response.iter_content(chunk_size=65536):
+                        length += len(chunk)
+                        if length > self.max_bytes:
+                            break
+
+            finally:
+                response.close()
+
+        return {
+            'status' : response.status_code,
+            'content_type' : content_type.split(';')[0].strip().lower(),
+            'bytes' : int(length) if length is not None else None
+        }
+
+
+    def fresh(self, cached, ttl):
+
+        ##
+        ## results are kept with the time they were fetched, so each caller
+        ## applies its own TTL. network errors are never reused
+        ##
+        fetched, result = cached
+
+        if 'error' in result:
+            return False
+
+        if result['status'] >= 400:
+            ttl = min(ttl, FAILED_ASSET_TTL)
+
+        return fetched + ttl > time.time()
+
+
+    def check(self, url, ttl=None):
+
+        ##
+        ## one request per URL per TTL, however many tenants or threads
+        ## ask ... later callers wait on the check already in flight
+        ##
+        ttl = ttl if ttl is not None else self.ttl
+        owner = False
+
+        with self.lock:
+
+            cached = self.results.get(url)
+            if cached is not None and self.fresh(cached, ttl):
+                return cached[1]
+
+            event = self.pending.get(url)
+            if event is None:
+                event = threading.Event()
+                self.pending[url] = event
+                owner = True
+
+        if owner is False:
+            event.wait()
+            with self.lock:
+                return self.results[url][1]
+
+        try:
+            result = self.fetch(url)
+        except Exception as e:
+            result = {'status' : None, 'content_type' : '', 'bytes' : None, 'error' : str(e)}
+
+        with self.lock:
+            self.results[url] = tuple([time.time(), result])
+            self.pending.pop(url, None)
+
+        event.set()
+
+        return result
+
+
+    def check_all(self, urls, workers=DEFAULT_ASSET_WORKERS, ttl=None):
+
+        urls = list(dict.fromkeys(urls))
+
+        if not urls:
+            return {}
+
+        with ThreadPoolExecutor(max_workers=min(workers, len(urls))) as executor:
+            return dict(zip(urls, executor.map(lambda url: self.check(url, ttl=ttl), urls)))
+
+
+    def invalidate(self, url=None):
+
+        with self.lock:
+            if url is None:
+                self.results.clear()
+            else:
+                self.results.pop(url, None)
+
+
+def asset_errors(source, url, kind, result, max_bytes=MAX_ASSET_BYTES):
+
+    if 'error' in result:
+        return ['{} {}: {}'.format(source, url, result['error'])]
+
+    if result['status'] >= 400:
+        return ['{} {}: HTTP {}'.format(source, url, result['status'])]
+
+    errors = []
+    prefixes = ASSET_TYPES.get(kind, [])
+
+    if prefixes and not any(result['content_type'].startswith(p) for p in prefixes):
+        errors.append('{} {}: content-type {} where {} expected'.format(
+            source, url, result['content_type'] or '(none)', kind))
+
+    if result['bytes'] is not None and result['bytes'] > max_bytes:
+        errors.append('{} {}: {} bytes exceeds the {} byte limit'.format(
+            source, url, result['bytes'], max_bytes))
+
+    return errors
+
+
+def preflight_assets(branding_json=None, html_template=None, checker=None, workers=DEFAULT_ASSET_WORKERS, ttl=None):
+
+    ##
+    ## ttl applies to this call only ... the checker is shared by every
+    ## tenant in the process, each with its own asset_ttl
+    ##
+    checker = checker if checker is not None else ASSET_CHECKER
+
+    assets = asset_urls(branding_json=branding_json, html_template=html_template)
+    results = checker.check_all([url for source, url, kind in assets], workers=workers, ttl=ttl)
+
+    errors = []
+
+    for source, url, kind in assets:
+        errors += asset_errors(source, url, kind, results[url], max_bytes=checker.max_bytes)
+
+    logger.info('[+] Pre-flight checked %s assets: %s problems', len(assets), len(errors))
+
+    return errors
+
+
+##
+## shared by every tenant in this process so a fleet checks each asset once
+##
+ASSET_CHECKER = AssetChecker()
+
+
+###############################################################################
+###############################################################################
+##
+## Task Graph - runs tasks as soon as their dependencies finish and reports
+## the critical path through the run
+##
+###############################################################################
+###############################################################################
+
+
+class TaskGraph(object):
+
+    def __init__(self):
+
+        self.tasks = {}
+        self.order = []
+
+
+    def add(self, name, func, deps=None):
+
+        ##
+        ## func receives the results of its dependencies as keyword arguments.
+        ## dependencies must be added first, so the graph can't wait on a task
+        ## that never runs or hold a cycle
+        ##
+        missing = [d for d in deps or [] if d not in self.tasks]
+
+        if missing:
+            raise ValueError('Task {} depends on unknown tasks: {}'.format(name, ', '.join(missing)))
+
+        self.tasks[name] = {
+            'func' : func,
+            'deps' : list(deps or []),
+            'result' : None,
+            'error' : None,
+            'start' : None,
+            'end' : None
+        }
+        self.order.append(name)
+
+        return name
+
+
+    def run_task(self, name):
+
+        task = self.tasks[name]
+        kwargs = dict([(d, self.tasks[d]['result']) for d in task['deps']])
+
+        task['start'] = time.monotonic()
+
+        try:
+            task['result'] = task['func'](**kwargs)
+        except Exception as e:
+            task['error'] = '{}: {}'.format(type(e).__name__, e)
+
+        task['end'] = time.monotonic()
+
+        return name
+
+
+    def run(self, max_workers=DEFAULT_GRAPH_WORKERS):
+
+        self.started = time.monotonic()
+
+        pending = dict([(name, set(self.tasks[name]['deps'])) for name in self.order])
+        done = set()
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+
+            while pending or running:
+
+                for name in list(pending):
+                    deps = pending[name]
+
+                    failed = [d for d in deps if d in done and self.tasks[d]['error'] is not None]
+
+                    if failed:
+                        ##
+                        ## a failed dependency means this task can't run
+                        ##
+                        self.tasks[name]['error'] = 'skipped: {} failed'.format(', '.join(failed))
+                        del pending[name]
+                        done.add(name)
+
+                    elif deps <= done:
+                        running[executor.submit(self.run_task, name)] = name
+                        del pending[name]
+
+                if not running:
+                    if pending:
+                        raise ValueError('Tasks can never run: {}'.format(', '.join(pending)))
+                    continue
+
+                finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+
+                for future in finished:
+                    done.add(running.pop(future))
+
+        self.finished = time.monotonic()
+
+        return self
+
+
+    def critical_path(self):
+
+        ##
+        ## walk back from the last task to finish through whichever
+        ## dependency finished last ... that chain bounds the run time
+        ##
+        ran = [n for n in self.order if self.tasks[n]['end'] is not None]
+
+        if not ran:
+            return []
+
+        name = max(ran, key=lambda n: self.tasks[n]['end'])
+        path = []
+
+        while name is not None:
+            task = self.tasks[name]
+            path.append({
+                'task' : name,
+                'start_ms' : round((task['start'] - self.started) * 1000, 2),
+                'duration_ms' : round((task['end'] - task['start']) * 1000, 2)
+            })
+
+            deps = [d for d in task['deps'] if self.tasks[d]['end'] is not None]
+            name = max(deps, key=lambda d: self.tasks[d]['end']) if deps else None
+
+        return list(reversed(path))
+
+
+    def report(self):
+
+        return {
+            'wall_ms' : round((self.finished - self.started) * 1000, 2),
+            'critical_path' : self.critical_path(),
+            'errors' : dict([
+                (n, self.tasks[n]['error']) for n in self.order 
+                if self.tasks[n]['error'] is not None
+            ])
+        }
+
+
+###############################################################################
+###############################################################################
+##
+## Metrics - per-request timings aggregated by resource type
+##
+###############################################################################
+###############################################################################
+
+
+class Metrics(object):
+
+    def __init__(self):
+
+        self.requests = []
+        self.lock = threading.Lock()
+        self.started = time.time()
+
+
+    def record( self, resource, method, status, duration, 
+                retries=0, bytes_sent=0, bytes_received=0 ):
+
+        with self.lock:
+            self.requests.append({
+                'resource' : resource,
+                'method' : method,
+                'status' : status,
+                'duration_ms' : duration * 1000,
+                'retries' : retries,
+                'bytes_sent' : bytes_sent,
+                'bytes_received' : bytes_received
+            })
+
+
+    def summarize(self, requests):
+
+        durations = [r['duration_ms'] for r in requests]
+
+        return {
+            'count' : len(requests),
+            'errors' : len([r for r in requests if r['status'] is None or r['status'] >= 400]),
+            'retries' : sum(r['retries'] for r in requests),
+            'bytes_sent' : sum(r['bytes_sent'] for r in requests),
+            'bytes_received' : sum(r['bytes_received'] for r in requests),
+            'total_ms' : round(sum(durations), 2),
+            'p50_ms' : round(percentile(durations, 50), 2),
+            'p90_ms' : round(percentile(durations, 90), 2),
+            'p99_ms' : round(percentile(durations, 99), 2),
+            'max_ms' : round(max(durations) if durations else 0.0, 2)
+        }
+
+
+    def report(self):
+
+        with self.lock:
+            requests = list(self.requests)
+
+        resources = {}
+
+        for r in requests:
+            resources.setdefault(r['resource'], []).append(r)
+
+        return {
+            'wall_ms' : round((time.time() - self.started) * 1000, 2),
+            'totals' : self.summarize(requests),
+            'resources' : dict([(k, self.summarize(v)) for k, v in sorted(resources.items())])
+        }
+
+
+def emit_emf(report, tenant=None, namespace=EMF_NAMESPACE):
+
+    ##
+    ## CloudWatch Embedded Metric Format ... printed straight to stdout since
+    ## the Lambda log handler's prefix would stop CloudWatch parsing it
+    ##
+    metric_names = [
+        ('Requests', 'Count', 'count'),
+        ('Errors', 'Count', 'errors'),
+        ('Retries', 'Count', 'retries'),
+        ('BytesSent', 'Bytes', 'bytes_sent'),
+        ('BytesReceived', 'Bytes', 'bytes_received'),
+        ('TotalDuration', 'Milliseconds', 'total_ms'),
+        ('P50Duration', 'Milliseconds', 'p50_ms'),
+        ('P99Duration', 'Milliseconds', 'p99_ms')
+    ]
+
+    timestamp = int(time.time() * 1000)
+
+    for resource, stats in report['resources'].items():
+
+        line = {
+            '_aws' : {
+                'Timestamp' : timestamp,
+                'CloudWatchMetrics' : [{
+                    'Namespace' : namespace,
+                    'Dimensions' : [['Tenant', 'Resource']],
+                    'Metrics' : [{'Name' : n, 'Unit' : u} for n, u, _ in metric_names]
+                }]
+            },
+            'Tenant' : tenant,
+            'Resource' : resource
+        }
+
+        for name, unit, key in metric_names:
+            line[name] = stats[key]
+
+        print(json.dumps(line, separators=(',', ':')))
+
+    print(json.dumps({
+        '_aws' : {
+            'Timestamp' : timestamp,
+            'CloudWatchMetrics' : [{
+                'Namespace' : namespace,
+                'Dimensions' : [['Tenant']],
+                'Metrics' : [{'Name' : 'DeployDuration', 'Unit' : 'Milliseconds'}]
+            }]
+        },
+        'Tenant' : tenant,
+        'DeployDuration' : report['wall_ms']
+    }, separators=(',', ':')))
+
+    return
+
+
+###############################################################################
+###############################################################################
+##
+## Rate Limiter - token bucket shared by every client for a tenant, paced by
+## the X-RateLimit-Limit / X-RateLimit-Remaining / X-RateLimit-Reset headers
+##
+###############################################################################
+###############################################################################
+
+
+class RateLimiter(object):
+
+    def __init__(self, rate=DEFAULT_RATE_LIMIT, burst=None):
+
+        self.rate = float(rate)
+        self.capacity = float(burst if burst is not None else rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+
+    def refill(self, now):
+
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+    def reserve(self):
+
+        ##
+        ## take a token if one is free ... otherwise how long to wait before
+        ## asking again
+        ##
+        with self.lock:
+            now = time.monotonic()
+            self.refill(now)
+
+            if now < self.paused_until:
+                return self.paused_until - now
+
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+
+            return (1 - self.tokens) / self.rate
+
+
+    def next_wait(self, give_up):
+
+        wait = self.reserve()
+
+        ##
+        ## a wait that cannot end before the deadline is not worth starting
+        ##
+        if wait > 0 and give_up is not None and time.monotonic() + wait >= give_up:
+            raise DeadlineExceeded('Deadline reached, rate limit wait of {:.2f}s not started'.format(wait))
+
+        return wait
+
+
+    def acquire(self, remaining=None):
+
+        give_up = None if remaining is None else time.monotonic() + remaining
+
+        while True:
+            wait = self.next_wait(give_up)
+
+            if wait <= 0:
+                return
+
+            time.sleep(wait)
+
+
+    async def acquire_async(self, remaining=None):
+
+        import asyncio
+
+        give_up = None if remaining is None else time.monotonic() + remaining
+
+        ##
+        ## the same bucket, waited on without blocking the event loop
+        ##
+        while True:
+            wait = self.next_wait(give_up)
+
+            if wait <= 0:
+                return
+
+            await asyncio.sleep(wait)
+
+
+    def pause(self, delay):
+
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + delay)
+
+
+    def update(self, headers):
+
+        ##
+        ## the server knows the real budget ... never hold more tokens than
+        ## it says remain, and stop entirely until the reset when it is spent
+        ##
+        limit = header_number(headers, 'X-RateLimit-Limit')
+        remaining = header_number(headers, 'X-RateLimit-Remaining')
+        reset = header_number(headers, 'X-RateLimit-Reset')
+
+        with self.lock:
+
+            if limit is not None and limit > 0:
+                self.capacity = min(self.capacity, limit)
+
+            if remaining is not None:
+                self.tokens = min(self.tokens, remaining)
+
+                if remaining <= 0 and reset is not None:
+                    ##
+                    ## X-RateLimit-Reset is a UNIX timestamp in seconds ...
+                    ## capped like any other backoff, a far-off or skewed
+                    ## reset must not stall every worker on the tenant
+                    ##
+                    delay = min(MAX_BACKOFF, max(0.0, reset - time.time()))
+                    self.paused_until = max(self.paused_until, time.monotonic() + delay)
+
+
+RATE_LIMITERS = {}
+RATE_LIMITERS_LOCK = threading.Lock()
+
+
+def get_rate_limiter(key, rate=None):
+
+    with RATE_LIMITERS_LOCK:
+
+        if key not in RATE_LIMITERS:
+            RATE_LIMITERS[key] = RateLimiter(rate=rate if rate else DEFAULT_RATE_LIMIT)
+
+        return RATE_LIMITERS[key]
+
+
+###############################################################################
+###############################################################################
+##
+## State Manifest - content hashes of the last successful deploy per tenant
+##
+###############################################################################
+###############################################################################
+
+
+class StateManifest(object):
+
+    def __init__(self, state_file=None):
+
+        self.state_file = state_file
+        self.state = {}
+        self.touched = set()
+
+        try:
+            with open(self.state_file, 'r') as f:
+                self.state = json.load(f)
+        except (OSError, ValueError):
+            self.state = {}
+
+
+    def resource_hashes(self, branding_json=None, prompts_json=None, html_template=None):
+        return resource_hashes(branding_json, prompts_json, html_template)
+
+
+    def filter(self, tenant=None, branding_json=None, prompts_json=None, html_template=None):
+
+        ##
+        ## drop every resource whose hash matches the last deploy ... returns
+        ## the remaining inputs plus the number of resources skipped
+        ##
+        deployed = self.state.get(tenant, {})
+        hashes = self.resource_hashes(branding_json, prompts_json, html_template)
+
+        skipped = 0
+
+        if branding_json is not None and deployed.get('branding') == hashes['branding']:
+            branding_json = None
+            skipped += 1
+
+        if prompts_json is not None:
+            changed_prompts = {}
+
+            for prompt in prompts_json:
+                for language in prompts_json[prompt]:
+                    key = prompt_key(prompt, language)
+
+                    if deployed.get(key) == hashes[key]:
+                        skipped += 1
+                    else:
+                        changed_prompts.setdefault(prompt, {})[language] = prompts_json[prompt][language]
+
+            prompts_json = changed_prompts
+
+        if html_template is not None and deployed.get('template') == hashes['template']:
+            html_template = None
+            skipped += 1
+
+        logger.info('[+] State manifest: %s resources unchanged since last deploy', skipped)
+
+        return tuple([branding_json, prompts_json, html_template, skipped])
+
+
+    def record(self, tenant=None, branding_json=None, prompts_json=None, html_template=None, failed=None):
+
+        failed = failed if failed is not None else []
+
+        hashes = self.resource_hashes(branding_json, prompts_json, html_template)
+
+        ##
+        ## the theme and global branding both come from the branding JSON
+        ##
+        if 'global_branding' in failed:
+            failed = failed + ['branding']
+
+        deployed = self.state.setdefault(tenant, {})
+        self.touched.add(tenant)
+
+        for key in hashes:
+            if key in failed:
+                deployed.pop(key, None)
+            else:
+                deployed[key] = hashes[key]
+
+        self.save()
+
+
+    def forget(self, tenant=None, keys=None):
+
+        ##
+        ## resources changed behind the manifest's back (e.g. a rollback)
+        ## must be deployed again next time
+        ##
+        deployed = self.state.setdefault(tenant, {})
+        self.touched.add(tenant)
+
+        for key in keys or []:
+            deployed.pop(key, None)
+
+        self.save()
+
+
+    def save(self):
+
+        with file_lock(self.state_file):
+
+            ##
+            ## fleet workers share one manifest ... only replace the tenants
+            ## this instance recorded and keep everyone else's entries
+            ##
+            try:
+                with open(self.state_file, 'r') as f:
+                    state = json.load(f)
+            except (OSError, ValueError):
+                state = {}
+
+            for tenant in self.touched:
+                state[tenant] = self.state[tenant]
+
+            tmp_file = unique_tmp_file(self.state_file)
+
+            with open(tmp_file, 'w') as f:
+                json.dump(state, f, indent=4, sort_keys=True)
+
+            os.replace(tmp_file, self.state_file)
+
+
+###############################################################################
+###############################################################################
+##
+## Journal - tenant state captured before each deploy, for rollback
+##
+##  JOURNAL_DIR/20240101T120000-1a2b3c4d.json
+##
+##  {
+##      "id": "20240101T120000-1a2b3c4d",
+##      "tenant": "https://acme.us.auth0.com/api/v2",
+##      "created": 1704110400.0,
+##      "resources": {
+##          "branding": { ... } | null,
+##          "global_branding": { ... },
+##          "prompts/login/en": { ... },
+##          "template": "..." | null
+##      }
+##  }
+##
+##  null means the resource did not exist, so rolling back deletes it.
+##  an entry journaled by a rollback also holds "rollback_of", the ID of
+##  the entry it restored
+##
+###############################################################################
+###############################################################################
+
+
+class Journal(object):
+
+    def __init__(self, journal_dir=None):
+        self.journal_dir = journal_dir
+
+
+    def record(self, tenant=None, resources=None, rollback_of=None):
+
+        created = time.time()
+
+        entry = {
+            'id' : '{}-{}'.format(
+                time.strftime('%Y%m%dT%H%M%S', time.gmtime(created)),
+                content_hash([tenant, created, resources])[:8]
+            ),
+            'tenant' : tenant,
+            'created' : created,
+            'resources' : resources
+        }
+
+        if rollback_of is not None:
+            entry['rollback_of'] = rollback_of
+
+        os.makedirs(self.journal_dir, exist_ok=True)
+
+        path = os.path.join(self.journal_dir, '{}.json'.format(entry['id']))
+        tmp_file = unique_tmp_file(path)
+
+        with open(tmp_file, 'w') as f:
+            json.dump(entry, f, indent=4)
+
+        os.replace(tmp_file, path)
+
+        logger.info('[+] Journaled %s resources as %s', len(resources), entry['id'])
+
+        return entry['id']
+
+
+    def entries(self, tenant=None):
+
+        try:
+            names = [n for n in os.listdir(self.journal_dir) if n.endswith('.json')]
+        except OSError:
+            return []
+
+        entries = []
+
+        for name in names:
+            try:
+                with open(os.path.join(self.journal_dir, name), 'r') as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                continue
+
+            if tenant is None or entry.get('tenant') == tenant:
+                entries.append(entry)
+
+        ##
+        ## newest first
+        ##
+        return sorted(entries, key=lambda e: e.get('created', 0), reverse=True)
+
+
+    def load(self, tenant=None, entry_id=None):
+
+        if entry_id is not None and os.path.isfile(entry_id):
+            with open(entry_id, 'r') as f:
+                return json.load(f)
+
+        ##
+        ## the latest entry is the newest deploy ... rollbacks are only loaded
+        ## by ID, so rolling back twice never toggles between two states
+        ##
+        for entry in self.entries(tenant=tenant):
+            if entry_id is None and 'rollback_of' not in entry:
+                return entry
+
+            if entry['id'] == entry_id:
+                return entry
+
+        raise ValueError('No journal entry {}for {} in {}'.format(
+            '{} '.format(entry_id) if entry_id else '', tenant, self.journal_dir))
+
+
+###############################################################################
+###############################################################################
+##
+## Async HTTP - requests does the HTTP (pooling, proxies, CA bundles) on a
+## shared worker pool, so coroutines await it without blocking the loop
+##
+###############################################################################
+###############################################################################
+
+
+HTTP_EXECUTOR = None
+HTTP_EXECUTOR_LOCK = threading.Lock()
+
+
+def http_executor():
+
+    global HTTP_EXECUTOR
+
+    ##
+    ## one pool for every client in the process ... each client's own
+    ## semaphore keeps it to pool_size requests in flight
+    ##
+    with HTTP_EXECUTOR_LOCK:
+
+        if HTTP_EXECUTOR is None:
+            HTTP_EXECUTOR = ThreadPoolExecutor(max_workers=HTTP_WORKERS, thread_name_prefix='auth0-http')
+
+        return HTTP_EXECUTOR
+
+
+def reset_after_fork():
+
+    global HTTP_EXECUTOR, CLIENT_LOOP, CLIENTS
+
+    ##
+    ## a forked fleet worker inherits the pool and loop but not their
+    ## threads, and pooled sockets it must not share ... start over
+    ##
+    HTTP_EXECUTOR = None
+    CLIENT_LOOP = None
+    CLIENTS = {}
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset_after_fork)
+
+
+class AsyncSession(object):
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE):
+
+        self.pool_size = pool_size
+        self.session = None
+        self.semaphore = None
+        self.loop = None
+        self.lock = threading.Lock()
+        self.hooks = {'response' : []}
+
+
+    def get_session(self):
+
+        with self.lock:
+
+            if self.session is None:
+                ##
+                ## requests and its dependency tree are imported on first use
+                ## so --help and the Lambda cold start don't pay for them ...
+                ## no transport retries, a dropped connection is reported to
+                ## send_request, which never repeats a POST
+                ##
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                self.session = requests.Session()
+                self.session.hooks = self.hooks
+
+                adapter = HTTPAdapter(
+                    pool_connections=self.pool_size,
+                    pool_maxsize=self.pool_size,
+                    max_retries=0
+                )
+
+                self.session.mount('https://', adapter)
+                self.session.mount('http://', adapter)
+
+            return self.session
+
+
+    def bind(self):
+
+        import asyncio
+
+        ##
+        ## asyncio primitives belong to the loop that made them ... a session
+        ## reused from another loop gets a fresh semaphore
+        ##
+        loop = asyncio.get_running_loop()
+
+        if loop is not self.loop:
+            self.loop = loop
+            self.semaphore = asyncio.Semaphore(self.pool_size)
+
+        return self.semaphore
+
+
+    async def request(self, method, url, headers=None, json_data=None, data=None, timeout=None):
+
+        import asyncio
+
+        session = self.get_session()
+
+        def send():
+            return session.request(method, url, headers=headers, json=json_data, data=data, timeout=timeout)
+
+        async with self.bind():
+            return await asyncio.get_running_loop().run_in_executor(http_executor(), send)
+
+
+    async def close(self):
+
+        ##
+        ## only drops pooled connections ... a closed session can still be
+        ## used and simply reconnects
+        ##
+        with self.lock:
+            session = self.session
+            self.session = None
+
+        if session is not None:
+            session.close()
+
+
+###############################################################################
+###############################################################################
+##
+## Async Auth0 - the Management API client itself, as coroutines on the
+## non-blocking session ... Auth0 below is a blocking facade over it
+##
+###############################################################################
+###############################################################################
+
+
+class AsyncAuth0(object):
+
+    def __init__( self,
+                  client_id=None,
+                  client_secret=None,
+                  auth0_domain=None,
+                  pool_size=DEFAULT_POOL_SIZE,
+                  token_cache_file=None,
+                  theme_cache_file=None,
+                  mgmt_endpoint=None,
+                  rate_limit=None,
+                  max_retries=None,
+                  connect_timeout=None,
+                  read_timeout=None ):
+
+
+        if client_id is None or client_secret is None or auth0_domain is None:
+            ##
+            ## get client_id, client_secret, auth0_domain from env
+            ##
+            self.client_id = os.environ.get('AUTH0_CLIENT_ID')
+            self.client_secret = os.environ.get('AUTH0_CLIENT_SECRET')
+            self.auth0_domain = os.environ.get('AUTH0_DOMAIN')
+
+        else:
+
+            self.client_id = client_id
+            self.client_secret = client_secret
+            self.auth0_domain = auth0_domain
+
+
+        base_url = 'https://{}'.format(self.auth0_domain)
+
+        if mgmt_endpoint is None:
+            self.mgmt_endpoint = os.environ.get('AUTH0_MGMT_API_ENDPOINT')
+        else:
+            self.mgmt_endpoint = mgmt_endpoint
+
+        logger.debug('[+] Auth0 Domain (reflects custom domain): %s', self.auth0_domain)
+        logger.debug('[+] Base URL: %s', base_url)
+        logger.debug('[+] Auth0 MGMT Endpoint: %s', self.mgmt_endpoint)
+
+
+        ##
+        ## use the base MGMT FQDN to get token ... keeping the endpoint's
+        ## scheme so a local mock API over plain HTTP works too
+        ##
+        mgmt_url = urlparse(self.mgmt_endpoint)
+        auth0_domain = '{}://{}'.format(mgmt_url.scheme or 'https', mgmt_url.netloc)
+        logger.debug('[+] Auth0 Domain (reflects MGMT domain): %s', auth0_domain)
+
+        ##
+        ##********************************************************************
+        ##
+        ## URL Formats for Token endpoint:
+        ##
+        ##      https://[AUTH0_DOMAIN]/oauth/token
+        ##
+        ##********************************************************************
+        ##
+        if auth0_domain.endswith('/'):
+            self.token_endpoint = '{}oauth/token'.format(auth0_domain)
+        else:
+            self.token_endpoint = '{}/oauth/token'.format(auth0_domain)
+
+        logger.debug('[+] Token Endpoint: %s', self.token_endpoint)
+
+        ##
+        ##********************************************************************
+        ##
+        ## URL Formats for Global Branding API:
+        ##
+        ##      https://[AUTH0_DOMAIN]/api/v2/branding
+        ##
+        ##********************************************************************
+        ##
+        if self.mgmt_endpoint.endswith('/'):
+            self.global_branding_url = '{}branding'.format(self.mgmt_endpoint)
+        else:
+            self.global_branding_url = '{}/branding'.format(self.mgmt_endpoint)
+
+        logger.debug('[+] Global Branding URL: %s', self.global_branding_url)
+
+
+        ##
+        ##********************************************************************
+        ##
+        ## URL Formats for Branding Themes API:
+        ##
+        ##      https://[AUTH0_DOMAIN]/api/v2/branding/themes
+        ##      https://[AUTH0_DOMAIN]/api/v2/branding/themes/default
+        ##      https://[AUTH0_DOMAIN]/api/v2/branding/themes/{ID}
+        ##
+        ##********************************************************************
+        ##
+        if self.mgmt_endpoint.endswith('/'):
+            self.branding_themes_url = '{}branding/themes'.format(self.mgmt_endpoint)
+        else:
+            self.branding_themes_url = '{}/branding/themes'.format(self.mgmt_endpoint)
+
+        self.default_branding_themes_url = '{}/default'.format(self.branding_themes_url)
+
+        logger.debug('[+] Branding Themes URL: %s', self.branding_themes_url)
+        logger.debug('[+] Branding Themes Default URL: %s', self.default_branding_themes_url)
+
+
+        ##
+        ##********************************************************************
+        ##
+        ## URL Formats for Prompts API:
+        ##
+        ##      https://[AUTH0_DOMAIN]/api/v2/prompts
+        ##      https://[AUTH0_DOMAIN]/api/v2/prompts/{prompt}/custom-text/{language}
+        ##
+        ##********************************************************************
+        ##
+
+        if self.mgmt_endpoint.endswith('/'):
+            self.prompts_url = '{}prompts'.format(self.mgmt_endpoint)
+        else:
+            self.prompts_url = '{}/prompts'.format(self.mgmt_endpoint)
+
+        logger.debug('[+] Custom Prompts URL: %s', self.prompts_url)
+
+
+        ##
+        ##********************************************************************
+        ##
+        ## URL Format for Tenant Settings:
+        ##
+        ##      GET /api/v2/tenants/settings
+        ##
+        ##********************************************************************
+        ##
+        if self.mgmt_endpoint.endswith('/'):
+            self.tenant_settings_url = '{}tenants/settings'.format(self.mgmt_endpoint)
+        else:
+            self.tenant_settings_url = '{}/tenants/settings'.format(self.mgmt_endpoint)
+
+        logger.debug('[+] Tenant Settings URL: %s', self.tenant_settings_url)
+
+
+        ##
+        ##********************************************************************
+        ##
+        ## URL Formats for Universal Login Templates:
+        ##
+        ##      PUT /api/v2/branding/templates/universal-login
+        ##
+        ##********************************************************************
+        ##
+        if self.mgmt_endpoint.endswith('/'):
+            self.template_url = '{}branding/templates/universal-login'.format(self.mgmt_endpoint)
+        else:
+            self.template_url = '{}/branding/templates/universal-login'.format(self.mgmt_endpoint)
+
+        logger.debug('[+] Universal Login Template URL: %s', self.template_url)
+
+
+        ##
+        ## one pooled, keep-alive, non-blocking session shared by every call
+        ## this client makes ... at most pool_size requests in flight
+        ##
+        self.pool_size = pool_size if pool_size else DEFAULT_POOL_SIZE
+        self.session = AsyncSession(pool_size=self.pool_size)
+
+        logger.debug('[+] HTTP connection pool size: %s', self.pool_size)
+
+
+        ##
+        ## per-request timings for the metrics report
+        ##
+        self.metrics = Metrics()
+
+
+        ##
+        ## all clients for the same tenant share one token bucket so
+        ## concurrent workers pace themselves against the same limit
+        ##
+        self.rate_limiter = get_rate_limiter(self.mgmt_endpoint, rate=rate_limit)
+        self.max_retries = max_retries if max_retries is not None else DEFAULT_MAX_RETRIES
+
+        ##
+        ## every request is bounded ... and by the deadline (epoch seconds)
+        ## when one is set for the invocation
+        ##
+        self.connect_timeout = connect_timeout if connect_timeout else CONNECT_TIMEOUT
+        self.read_timeout = read_timeout if read_timeout else READ_TIMEOUT
+        self.deadline = None
+        self.deadline_hit = False
+
+        logger.debug('[+] Rate limit: %s requests/second, %s retries',
+            self.rate_limiter.rate, self.max_retries)
+
+
+        ##
+        ##********************************************************************
+        ##
+        ## Audience for client credentials tokens:
+        ##
+        ##      https://[AUTH0_DOMAIN]/api/v2/
+        ##
+        ##********************************************************************
+        ##
+        if self.mgmt_endpoint.endswith('/'):
+            self.audience = '{}'.format(self.mgmt_endpoint)
+        else:
+            self.audience = '{}/'.format(self.mgmt_endpoint)
+
+        ##
+        ## tokens are shared through the module level cache so warm Lambda
+        ## invocations reuse them ... the CLI can also persist them to disk
+        ##
+        if token_cache_file is not None:
+            self.token_cache = TokenCache(cache_file=token_cache_file)
+            logger.debug('[+] Token cache file: %s', token_cache_file)
+        else:
+            self.token_cache = TOKEN_CACHE
+
+        if theme_cache_file is not None:
+            self.theme_cache = ThemeCache(cache_file=theme_cache_file)
+            logger.debug('[+] Theme cache file: %s', theme_cache_file)
+        else:
+            self.theme_cache = THEME_CACHE
+
+
+        ##
+        ## the token is fetched on first use ... a run with nothing to
+        ## deploy never touches the network
+        ##
+        self._access_token = None
+        self.token_expires_at = None
+        self.token_lock = None
+
+
+    async def close(self):
+        await self.session.close()
+
+
+    async def __aenter__(self):
+        return self
+
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+        return False
+
+
+    ##########################################################################
+    ##########################################################################
+    ##
+    ## access token - fetched lazily on first use
+    ##
+    ##########################################################################
+    ##########################################################################
+
+
+    def token_expired(self):
+
+        if self._access_token is None:
+            return True
+
+        ##
+        ## warm clients outlive their token ... refresh it inside the same
+        ## margin as the token cache instead of waiting for a 401
+        ##
+        if self.token_expires_at is None:
+            return False
+
+        return self.token_expires_at - self.token_cache.margin <= time.time()
+
+
+    def get_token_lock(self):
+
+        import asyncio
+
+        ##
+        ## created on first use so it binds to the running loop
+        ##
+        if self.token_lock is None:
+            self.token_lock = asyncio.Lock()
+
+        return self.token_lock
+
+
+    async def token(self):
+
+        if self.token_expired():
+
+            ##
+            ## one coroutine refreshes, the rest wait and reuse its token
+            ##
+            async with self.get_token_lock():
+                if self.token_expired():
+                    await self.get_token()
+
+        return self._access_token
+
+
+    async def headers(self):
+        return {'Authorization' : 'Bearer {}'.format(await self.token())}
+
+
+    async def get_token(self, force_refresh=False):
+
+        token_key = tuple([self.mgmt_endpoint, self.client_id, self.audience])
+
+        if force_refresh is True:
+            self.token_cache.invalidate(token_key)
+
+        else:
+            access_token = self.token_cache.get(token_key)
+
+            if access_token is not None:
+                logger.debug('[+] Using cached access token for: %s', self.audience)
+                self._access_token = access_token
+                self.token_expires_at = self.token_cache.expires_at(token_key)
+                return self._access_token
+
+        token_data = {
+            'client_id' : self.client_id,
+            'client_secret' : self.client_secret,
+            'audience' : self.audience,
+            'grant_type' : 'client_credentials'
+        }
+
+        logger.debug('[+] Getting access token from : %s', self.token_endpoint)
+
+        timeout = self.request_timeout('POST', self.token_endpoint)
+
+        start = time.monotonic()
+        token_response = await self.session.request('POST', self.token_endpoint, json_data=token_data, timeout=timeout)
+        log_request('POST', self.token_endpoint, token_response, time.monotonic() - start)
+
+        self.metrics.record(
+            'token', 'POST', token_response.status_code, time.monotonic() - start,
+            bytes_sent=request_bytes(token_response), bytes_received=len(token_response.content)
+        )
+
+        logger.debug('[+] Token response: %s', token_response)
+
+        if response_error(response_body(token_response)) is not None:
+            raise ValueError('Token request to {} failed: {}'.format(
+                self.token_endpoint, response_error(response_body(token_response))))
+
+        token_json = token_response.json()
+
+        self._access_token = token_json['access_token']
+
+        expires_in = token_json.get('expires_in')
+        self.token_expires_at = time.time() + int(expires_in) if expires_in is not None else None
+
+        self.token_cache.put(
+            token_key,
+            self._access_token,
+            expires_in=expires_in
+        )
+
+        return self._access_token
+
+
+    ##########################################################################
+    ##########################################################################
+    ##
+    ## deadline - timeouts for the next request, and sleeps that would
+    ## outlive the invocation
+    ##
+    ##########################################################################
+    ##########################################################################
+
+
+    def remaining(self):
+
+        if self.deadline is None:
+            return None
+
+        return self.deadline - time.time()
+
+
+    def request_timeout(self, method, url):
+
+        remaining = self.remaining()
+
+        if remaining is None:
+            return tuple([self.connect_timeout, self.read_timeout])
+
+        if remaining <= 0:
+            self.deadline_hit = True
+            raise DeadlineExceeded('Deadline reached, skipping {} {}'.format(method, url))
+
+        return tuple([min(self.connect_timeout, remaining), min(self.read_timeout, remaining)])
+
+
+    async def sleep(self, delay, method, url):
+
+        import asyncio
+
+        remaining = self.remaining()
+
+        if remaining is not None and delay >= remaining:
+            self.deadline_hit = True
+            raise DeadlineExceeded('Deadline reached, not retrying {} {} in {:.2f}s'.format(method, url, delay))
+
+        await asyncio.sleep(delay)
+
+
+    ##########################################################################
+    ##########################################################################
+    ##
+    ## send request - one HTTP call, refreshing the token once on a 401
+    ##
+    ##########################################################################
+    ##########################################################################
+
+
+    async def send_request(self, method, url, headers, json_data=None, data=None):
+
+        import requests
+
+        refreshed = False
+        attempt = 0
+        request_start = time.monotonic()
+
+        while True:
+
+            ##
+            ## wait for a slot in the tenant's shared token bucket
+            ##
+            try:
+                await self.rate_limiter.acquire_async(remaining=self.remaining())
+            except DeadlineExceeded:
+                self.deadline_hit = True
+                raise
+
+            timeout = self.request_timeout(method, url)
+
+            try:
+                start = time.monotonic()
+                response = await self.session.request(
+                    method, url, headers=headers, json_data=json_data, data=data, timeout=timeout
+                )
+                log_request(method, url, response, time.monotonic() - start)
+
+            except (requests.ConnectionError, requests.Timeout) as e:
+                ##
+                ## connection errors and timeouts ... a POST may have landed
+                ## before the connection dropped, only retry methods that are
+                ## safe to repeat
+                ##
+                if method == 'POST' or attempt >= self.max_retries:
+                    self.metrics.record(
+                        resource_type(url), method, None,
+                        time.monotonic() - request_start, retries=attempt
+                    )
+                    raise
+
+                delay = backoff_delay(attempt)
+                logger.warning('[-] HTTP %s %s failed (%s) ... retrying in %.2fs',
+                    method, url, e, delay)
+
+                await self.sleep(delay, method, url)
+                attempt += 1
+                continue
+
+            self.rate_limiter.update(response.headers)
+
+            if response.status_code == 401 and 'Authorization' in headers and refreshed is False:
+                ##
+                ## a cached token may have been revoked or rotated ... drop it,
+                ## fetch a fresh one and retry the call exactly once
+                ##
+                logger.warning('[-] HTTP 401 from %s ... refreshing access token and retrying', url)
+
+                ##
+                ## concurrent requests that failed with the same token share
+                ## one refresh
+                ##
+                async with self.get_token_lock():
+                    if headers['Authorization'] == 'Bearer {}'.format(self._access_token):
+                        await self.get_token(force_refresh=True)
+
+                headers = dict(headers)
+                headers['Authorization'] = 'Bearer {}'.format(await self.token())
+
+                refreshed = True
+                continue
+
+            retryable = response.status_code == 429 or (
+                response.status_code >= 500 and method != 'POST'
+            )
+
+            if retryable is False or attempt >= self.max_retries:
+                self.metrics.record(
+                    resource_type(url), method, response.status_code,
+                    time.monotonic() - request_start, retries=attempt,
+                    bytes_sent=request_bytes(response), bytes_received=len(response.content)
+                )
+                return response
+
+            delay = retry_delay(response, attempt)
+
+            if response.status_code == 429:
+                ##
+                ## back off every worker sharing this tenant, not just this one
+                ##
+                self.rate_limiter.pause(delay)
+
+            logger.warning('[-] HTTP %s from %s ... retrying in %.2fs (attempt %s of %s)',
+                response.status_code, url, delay, attempt + 1, self.max_retries)
+
+            await self.sleep(delay, method, url)
+            attempt += 1
+
+
+    ##########################################################################
+    ##########################################################################
+    ##
+    ## create request - the JSON body of the response, or the response
+    ## itself when there is none
+    ##
+    ##########################################################################
+    ##########################################################################
+
+
+    async def create_request(
+        self, url=None, headers=None, get=False,
+        put=False, post=False, patch=False, delete=False,
+        json_data=None, data=None, theme_id=None
+    ):
+
+        if url is None or headers is None:
+            return None
+
+        if get is True:
+            method = 'GET'
+        elif put is True:
+            method = 'PUT'
+        elif post is True:
+            method = 'POST'
+        elif patch is True:
+            method = 'PATCH'
+        elif delete is True:
+            method = 'DELETE'
+        else:
+            return None
+
+        ##
+        ## writes need something to send
+        ##
+        if method in ['PUT', 'POST', 'PATCH'] and json_data is None and data is None:
+            return None
+
+        logger.debug('[+] HTTP %s: %s', method, url)
+
+        response = await self.send_request(
+            method, url, headers,
+            json_data=json_data if method in ['PUT', 'POST', 'PATCH'] else None,
+            data=data if json_data is None and method in ['PUT', 'POST', 'PATCH'] else None
+        )
+
+        response_data = response_body(response)
+
+        if response_data is response:
+            logger.debug('[-] HTTP response is not JSON')
+            logger.debug('[+] HTTP response body: \n %s', response_data)
+        else:
+            logger.debug('[+] HTTP response body is JSON: \n %s', LazyJSON(response_data))
+
+        return response_data
+
+
+    async def conditional_get(self, url, headers, etag=None):
+
+        if etag is not None:
+            headers = dict(headers)
+            headers['If-None-Match'] = etag
+
+        response = await self.send_request('GET', url, headers)
+
+        if response.status_code == 304:
+            return tuple([None, etag, True])
+
+        response_data = response_body(response)
+
+        if response_data is response and response.status_code < 400:
+            response_data = None
+
+        return tuple([response_data, response.headers.get('ETag'), False])
+
+
+    ##########################################################################
+    ##########################################################################
+    ##
+    ## branding themes
+    ##
+    ##########################################################################
+    ##########################################################################
+
+
+    async def get_default_branding(self, headers=None):
+
+        headers = headers if headers is not None else await self.headers()
+
+        default_branding_response = await self.create_request(
+            url = self.default_branding_themes_url,
+            headers=headers,
+            get=True
+        )
+
+        default_json = default_branding_response
+        default_brand_id = default_branding_response['themeId']
+
+        logger.debug('[+] Default branding theme ID: %s', default_brand_id)
+
+        return tuple([default_json, default_brand_id])
+
+
+    async def get_theme_id(self, headers=None):
+
+        theme_id = self.theme_cache.get(self.mgmt_endpoint)
+
+        if theme_id is not None:
+            logger.debug('[+] Using cached branding theme ID: %s', theme_id)
+            return tuple([theme_id, True])
+
+        try:
+            theme_id = (await self.get_default_branding(headers=headers))[1]
+        except Exception as e:
+            logger.info('[-] Default branding theme not found: %s', e)
+            return tuple([None, False])
+
+        self.theme_cache.put(self.mgmt_endpoint, theme_id)
+
+        return tuple([theme_id, False])
+
+
+    async def write_theme(self, json_data=None, theme_id=None, headers=None, from_cache=False):
+
+        if theme_id is None:
+            ##
+            ## didn't find the default branding theme and don't have
+            ## a theme ID ... so create a new theme using HTTP POST
+            ##
+            branding_response = await self.create_request(
+                url = self.branding_themes_url,
+                headers=headers,
+                json_data=json_data,
+                post=True
+            )
+
+            if isinstance(branding_response, dict) and 'themeId' in branding_response:
+                self.theme_cache.put(self.mgmt_endpoint, branding_response['themeId'])
+
+            return branding_response
+
+        ##
+        ## update branding theme using HTTP PATCH
+        ##
+        branding_response = await self.create_request(
+            url = '{}/{}'.format(self.branding_themes_url, theme_id),
+            headers=headers,
+            json_data=json_data,
+            patch=True
+        )
+
+        if from_cache is True and response_status(branding_response) == 404:
+            ##
+            ## the cached theme is gone ... forget it and look again
+            ##
+            logger.warning('[-] Cached branding theme %s not found ... looking up default theme', theme_id)
+
+            self.theme_cache.invalidate(self.mgmt_endpoint)
+
+            theme_id, from_cache = await self.get_theme_id(headers=headers)
+
+            return await self.write_theme(
+                json_data=json_data,
+                theme_id=theme_id,
+                headers=headers,
+                from_cache=False
+            )
+
+        return branding_response
+
+
+    async def create_branding(self, json_data=None, theme_id=None, global_branding=True):
+
+        if json_data is None:
+            return None
+
+        headers = await self.headers()
+        from_cache = False
+
+        if theme_id is None:
+            ##
+            ## no theme ID provided ... use the default theme ID, from the
+            ## theme cache when we have seen this tenant before
+            ##
+            theme_id, from_cache = await self.get_theme_id(headers=headers)
+
+        logger.debug('[+] Using branding profile: \n%s', LazyJSON(json_data))
+
+        branding_response = await self.write_theme(
+            json_data=json_data,
+            theme_id=theme_id,
+            headers=headers,
+            from_cache=from_cache
+        )
+
+        ##
+        ## if a Logo URL is in the JSON data it needs to be updated
+        ## in the global branding profile as well as the branding theme
+        ## otherwise the page temaplate variable '{{ branding.logo_url }}'
+        ## does not contain the correct logo path
+        ##
+        if global_branding is True:
+            await self.set_global_branding(json_data=json_data)
+
+        return branding_response
+
+
+    async def set_global_branding(self, json_data=None):
+
+        branding_data = global_branding_data(json_data)
+
+        if branding_data is None:
+            return None
+
+        logger.debug('[+] Global branding logo URL needs to be updated')
+
+        return await self.create_request(
+            url = self.global_branding_url,
+            headers=await self.headers(),
+            json_data=branding_data,
+            patch=True
+        )
+
+
+    async def delete_branding(self, theme_id=None):
+
+        headers = await self.headers()
+
+        if theme_id is None:
+
+            ##
+            ## no theme ID provided ... use default profile ID
+            ##
+            theme_id, from_cache = await self.get_theme_id(headers=headers)
+
+            if theme_id is None:
+                return None
+
+        logger.info('[+] Deleting branding profile: %s', theme_id)
+
+        branding_response = await self.create_request(
+            url='{}/{}'.format(self.branding_themes_url, theme_id),
+            headers=headers,
+            delete=True
+        )
+
+        self.theme_cache.invalidate(self.mgmt_endpoint)
+
+        return branding_response
+
+
+    ##########################################################################
+    ##########################################################################
+    ##
+    ## prompts
+    ##
+    ##########################################################################
+    ##########################################################################
+
+
+    async def set_prompt(self, prompt=None, language=None, screens=None, headers=None):
+
+        result = {
+            'prompt' : prompt,
+            'language' : language,
+            'response' : None,
+            'error' : None
+        }
+
+        prompts_url = '{}/{}/custom-text/{}'.format(self.prompts_url, prompt, language)
+
+        logger.debug('[+] Using prompt update URL: %s', prompts_url)
+        logger.debug('[+] Using prompt update paylaod: \n%s', screens)
+
+        try:
+
+            prompts_response = await self.create_request(
+                url = prompts_url,
+                headers=headers if headers is not None else await self.headers(),
+                json_data=screens,
+                put=True
+            )
+
+            result['response'] = prompts_response
+            result['error'] = response_error(prompts_response)
+
+        except Exception as e:
+            result['error'] = str(e)
+
+        logger.debug('[+] Prompts response: %s', result['response'])
+
+        return result
+
+
+    async def set_prompts(self, json_data=None, concurrency=DEFAULT_CONCURRENCY):
+
+        import asyncio
+
+        if json_data is None:
+            return None
+
+        headers = await self.headers()
+
+        jobs = []
+
+        for prompt in json_data:
+            for language in json_data[prompt]:
+                jobs.append(tuple([prompt, language, json_data[prompt][language]]))
+
+        concurrency = concurrency if concurrency else DEFAULT_CONCURRENCY
+
+        if concurrency > 1 and len(jobs) > 1:
+            logger.info('[+] Updating %s prompt/language pairs with concurrency %s',
+                len(jobs), concurrency)
+
+        ##
+        ## each prompt/language PUT is independent of the others ... at most
+        ## concurrency of them in flight, results in the order of the JSON
+        ##
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def put(prompt, language, screens):
+            async with semaphore:
+                return await self.set_prompt(prompt, language, screens, headers)
+
+        prompts_results = list(await asyncio.gather(*[
+            put(prompt, language, screens) for prompt, language, screens in jobs
+        ]))
+
+        failed = [r for r in prompts_results if r['error'] is not None]
+
+        logger.info('[+] Prompts updated: %s succeeded, %s failed',
+            len(prompts_results) - len(failed), len(failed))
+
+        for r in failed:
+            logger.warning('[-] Prompt update failed (%s / %s): %s',
+                r['prompt'], r['language'], r['error'])
+
+        return prompts_results
+
+
+    ##########################################################################
+    ##########################################################################
+    ##
+    ## Universal Login template
+    ##
+    ##########################################################################
+    ##########################################################################
+
+
+    async def get_template(self, headers=None):
+
+        template_response = await self.create_request(
+            url=self.template_url,
+            headers=headers if headers is not None else await self.headers(),
+            get=True
+        )
+
+        if isinstance(template_response, dict) and response_error(template_response) is None:
+            return template_response.get('body')
+
+        return None
+
+
+    async def create_template(self, html_data=None, delete_first=False, skip_unchanged=True):
+
+        if html_data is None:
+            return None
+
+        authorization = (await self.headers())['Authorization']
+
+        headers = {
+            'Authorization' : authorization,
+            'content-type':'text/html'
+        }
+
+        if delete_first is True:
+            ##
+            ## opt-in only ... logins render without a custom template
+            ## between the DELETE and the PUT
+            ##
+            await self.delete_template()
+
+        elif skip_unchanged is True:
+
+            current_template = await self.get_template(headers={'Authorization' : authorization})
+
+            if current_template == html_data:
+                logger.info('[+] HTML Template unchanged ... skipping update')
+                return None
+
+        ##
+        ## PUT replaces the current template in a single write
+        ##
+        return await self.create_request(
+            url = self.template_url,
+            headers=headers,
+            data=html_data,
+            put=True
+        )
+
+
+    async def delete_template(self):
+
+        logger.info('[+] Deleting current HTML Template')
+
+        return await self.create_request(url=self.template_url, headers=await self.headers(), delete=True)
+
+
+###############################################################################
+###############################################################################
+##
+## Auth0
+##
+###############################################################################
+###############################################################################
+
+
+CLIENT_LOOP = None
+CLIENT_LOOP_LOCK = threading.Lock()
+
+
+def client_loop():
+
+    global CLIENT_LOOP
+
+    ##
+    ## started on first use ... one daemon thread however many clients a
+    ## warm Lambda or fleet run creates
+    ##
+    with CLIENT_LOOP_LOCK:
+
+        if CLIENT_LOOP is None:
+            import asyncio
+
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name='auth0-loop', daemon=True)
+            thread.start()
+
+            CLIENT_LOOP = tuple([loop, thread])
+
+        return CLIENT_LOOP
+
+
+def client_attribute(name):
+
+    ##
+    ## settings and per-invocation state (metrics, deadline, caches) live on
+    ## the async client ... the blocking facade reads and writes through
+    ##
+    return property(
+        lambda self: getattr(self.client, name),
+        lambda self, value: setattr(self.client, name, value)
+    )
+
+
+class Auth0(object):
+
+    client_id = client_attribute('client_id')
+    client_secret = client_attribute('client_secret')
+    auth0_domain = client_attribute('auth0_domain')
+    mgmt_endpoint = client_attribute('mgmt_endpoint')
+    audience = client_attribute('audience')
+    token_endpoint = client_attribute('token_endpoint')
+    global_branding_url = client_attribute('global_branding_url')
+    branding_themes_url = client_attribute('branding_themes_url')
+    default_branding_themes_url = client_attribute('default_branding_themes_url')
+    prompts_url = client_attribute('prompts_url')
+    tenant_settings_url = client_attribute('tenant_settings_url')
+    template_url = client_attribute('template_url')
+    token_cache = client_attribute('token_cache')
+    theme_cache = client_attribute('theme_cache')
+    pool_size = client_attribute('pool_size')
+    metrics = client_attribute('metrics')
+    rate_limiter = client_attribute('rate_limiter')
+    max_retries = client_attribute('max_retries')
+    connect_timeout = client_attribute('connect_timeout')
+    read_timeout = client_attribute('read_timeout')
+    deadline = client_attribute('deadline')
+    deadline_hit = client_attribute('deadline_hit')
+    token_expires_at = client_attribute('token_expires_at')
+    session = client_attribute('session')
+
+    def __init__( self,
+                  client_id=None,
+                  client_secret=None,
+                  auth0_domain=None,
+                  pool_size=DEFAULT_POOL_SIZE,
+                  token_cache_file=None,
+                  theme_cache_file=None,
+                  mgmt_endpoint=None,
+                  rate_limit=None,
+                  max_retries=None,
+                  connect_timeout=None,
+                  read_timeout=None ):
+
+        ##
+        ## every request goes through AsyncAuth0 on the shared client loop, so
+        ## the blocking and async paths share one transport, token, retry,
+        ## rate limit and deadline implementation
+        ##
+        self.client = AsyncAuth0(
+            client_id=client_id,
+            client_secret=client_secret,
+            auth0_domain=auth0_domain,
+            pool_size=pool_size,
+            token_cache_file=token_cache_file,
+            theme_cache_file=theme_cache_file,
+            mgmt_endpoint=mgmt_endpoint,
+            rate_limit=rate_limit,
+            max_retries=max_retries,
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout
+        )
+
+
+    ##########################################################################
+    ##########################################################################
+    ##
+    ## event loop - every Auth0 client in the process shares one loop thread
+    ##
+    ##########################################################################
+    ##########################################################################
+
+
+    def run(self, coroutine):
+
+        import asyncio
+
+        loop, thread = client_loop()
+
+        if threading.current_thread() is thread:
+            coroutine.close()
+            raise RuntimeError('Auth0 called from its own event loop ... use the AsyncAuth0 client instead')
+
+        return asyncio.run_coroutine_threadsafe(coroutine, loop).result()
+
+
+    def close(self):
+
+        ##
+        ## drops this client's pooled connections ... the shared loop keeps
+        ## running for the other clients
+        ##
+        if CLIENT_LOOP is not None:
+            self.run(self.client.close())
+
+        return
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+    ##########################################################################
+    ##########################################################################
+    ##
+    ## access token - fetched lazily on first use
+    ##
+    ##########################################################################
+    ##########################################################################
+
+
+    def token_expired(self):
+        return self.client.token_expired()
+
+
+    @property
+    def access_token(self):
+
+        if self.client.token_expired():
+            return self.run(self.client.token())
+
+        return self.client._access_token
+
+
+    @access_token.setter
+    def access_token(self, access_token):
+        self.client._access_token = access_token
+
+
+    def get_token(self, force_refresh=False):
+        return self.run(self.client.get_token(force_refresh=force_refresh))
+
+
+    ##########################################################################
+    ##########################################################################
+    ##
+    ## deadline - timeouts for the next request
+    ##
+    ##########################################################################
+    ##########################################################################
+
+
+    def remaining(self):
+        return self.client.remaining()
+
+
+    def request_timeout(self, method, url):
+        return self.client.request_timeout(method, url)
+
+
+    ##########################################################################
+    ##########################################################################
+    ##
+    ## requests
+    ##
+    ##########################################################################
+    ##########################################################################
+
+
+    def create_request(
+        self, url=None, headers=None, get=False,
+        put=False, post=False, patch=False, delete=False,
+        json_data=None, data=None, theme_id=None
+    ):
+
+        return self.run(self.client.create_request(
+            url=url, headers=headers, get=get,
+            put=put, post=post, patch=patch, delete=delete,
+            json_data=json_data, data=data, theme_id=theme_id
+        ))
+
+
+    def send_request(self, method, url, headers, json_data=None, data=None):
+        return self.run(self.client.send_request(method, url, headers, json_data=json_data, data=data))
+
+
+    def conditional_get(self, url, headers, etag=None):
+        return self.run(self.client.conditional_get(url, headers, etag=etag))
+
+
+    ##########################################################################
+    ##########################################################################
+    ##
+    ## branding themes
+    ##
+    ##########################################################################
+    ##########################################################################
+
+
+    def get_default_branding(self, headers=None):
+
+        if headers is None:
+            return None
+
+        return self.run(self.client.get_default_branding(headers=headers))
+
+
+    def get_theme_id(self, headers=None):
+        return self.run(self.client.get_theme_id(headers=headers))
+
+
+    def write_theme(self, json_data=None, theme_id=None, headers=None, from_cache=False):
+        return self.run(self.client.write_theme(
+            json_data=json_data, theme_id=theme_id, headers=headers, from_cache=from_cache))
+
+
+    def create_branding(self, json_data=None, theme_id=None, global_branding=True):
+        return self.run(self.client.create_branding(
+            json_data=json_data, theme_id=theme_id, global_branding=global_branding))
+
+
+    def set_global_branding(self, json_data=None):
+        return self.run(self.client.set_global_branding(json_data=json_data))
+
+
+    def delete_branding(self, theme_id=None):
+        return self.run(self.client.delete_branding(theme_id=theme_id))
+
+
+    ##########################################################################
+    ##########################################################################
+    ##
+    ## prompts
+    ##
+    ##########################################################################
+    ##########################################################################
+
+
+    def set_prompts(self, json_data=None, concurrency=DEFAULT_CONCURRENCY):
+        return self.run(self.client.set_prompts(json_data=json_data, concurrency=concurrency))
+
+
+    def set_prompt(self, prompt=None, language=None, screens=None, headers=None):
+        return self.run(self.client.set_prompt(prompt, language, screens, headers))
+
+
+    ##########################################################################
+    ##########################################################################
+    ##
+    ## Universal Login template
+    ##
+    ##########################################################################
+    ##########################################################################
+
+
+    def get_template(self, headers=None):
+        return self.run(self.client.get_template(headers=headers))
+
+
+    def create_template(self, html_data=None, delete_first=False, skip_unchanged=True):
+        return self.run(self.client.create_template(
+            html_data=html_data, delete_first=delete_first, skip_unchanged=skip_unchanged))
+
+
+    def delete_template(self):
+        return self.run(self.client.delete_template())
+
+
+    ##########################################################################
+    ##########################################################################
+    ##
+    ## stream prompts - send payloads as an iterator produces them, with a
+    ## bounded number in flight so a slow API never buffers the catalog
+    ##
+    ##########################################################################
+    ##########################################################################
+
+
+    def stream_prompts(self, payloads=None, concurrency=DEFAULT_CONCURRENCY, state=None):
+
+        headers = {'Authorization' : 'Bearer {}'.format(self.access_token)}
+
+        ##
+        ## with state, each prompt is captured by its worker just before it
+        ## is written ... a prompt that cannot be captured is not written
+        ##
+        def send(prompt, language, screens):
+            if state is not None:
+                key = prompt_key(prompt, language)
+
+                try:
+                    state[key] = self.capture_resource(key, headers=headers)
+                except ValueError as e:
+                    return {'prompt' : prompt, 'language' : language, 'error' : str(e)}
+
+            return self.set_prompt(prompt, language, screens, headers)
+
+        workers = concurrency if concurrency and concurrency > 1 else DEFAULT_GRAPH_WORKERS
+
+        sent = 0
+        failed = []
+        running = set()
+
+        def collect(done):
+            for future in done:
+                r = future.result()
+
+                if r['error'] is not None:
+                    failed.append(prompt_key(r['prompt'], r['language']))
+                    logger.warning('[-] Prompt update failed (%s / %s): %s',
+                        r['prompt'], r['language'], r['error'])
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+
+            for prompt, language, screens in payloads:
+
+                if len(running) >= workers * 2:
+                    done, running = wait(running, return_when=FIRST_COMPLETED)
+                    collect(done)
+
+                running.add(executor.submit(send, prompt, language, screens))
+                sent += 1
+
+            done, running = wait(running)
+            collect(done)
+
+        logger.info('[+] Prompts streamed: %s succeeded, %s failed', sent - len(failed), len(failed))
+
+        ##
+        ## only writes that went through count as patched
+        ##
+        return {
+            'unchanged' : 0,
+            'patched' : sent - len(failed),
+            'failed' : failed
+        }
+
+
+    ##########################################################################
+    ##########################################################################
+    ##
+    ## list themes - every branding theme ID on the tenant
+    ##
+    ##########################################################################
+    ##########################################################################
+
+
+    def list_themes(self, headers=None):
+
+        themes_response = self.create_request(url=self.branding_themes_url, headers=headers, get=True)
+
+        if isinstance(themes_response, list):
+            return [t['themeId'] for t in themes_response if 'themeId' in t]
+
+        ##
+        ## no theme listing on this tenant ... the default theme is the only
+        ## one we can find
+        ##
+        logger.debug('[-] Cannot list branding themes: %s', response_error(themes_response))
+
+        theme_id, from_cache = self.get_theme_id(headers=headers)
+
+        return [theme_id] if theme_id is not None else []
+
+
+    ##########################################################################
+    ##########################################################################
+    ##
+    ## teardown - delete every theme and the template and reset prompts,
+    ## all at once on one rate limited pool
+    ##
+    ##########################################################################
+    ##########################################################################
+
+
+    def teardown_themes(self, theme_id=None):
+
+        headers = {'Authorization' : 'Bearer {}'.format(self.access_token)}
+
+        theme_ids = self.list_themes(headers=headers)
+
+        if theme_id is not None and theme_id not in theme_ids:
+            theme_ids.append(theme_id)
+
+        return theme_ids
+
+
+    def teardown(self, prompts_json=None, theme_id=None, concurrency=DEFAULT_CONCURRENCY, theme_ids=None):
+
+        headers = {'Authorization' : 'Bearer {}'.format(self.access_token)}
+
+        ##
+        ## a caller that journaled the themes first passes the same list in,
+        ## so exactly what was captured is deleted
+        ##
+        if theme_ids is None:
+            theme_ids = self.teardown_themes(theme_id=theme_id)
+
+        graph = TaskGraph()
+
+        for t in theme_ids:
+            graph.add('themes/{}'.format(t), lambda t=t: self.create_request(
+                url='{}/{}'.format(self.branding_themes_url, t), headers=headers, delete=True))
+
+        graph.add('template', lambda: self.create_request(url=self.template_url, headers=headers, delete=True))
+
+        ##
+        ## custom text is reset by writing the blank values of the reset file
+        ##
+        for prompt in (prompts_json or {}):
+            for language in prompts_json[prompt]:
+                graph.add(
+                    prompt_key(prompt, language),
+                    lambda p=prompt, l=language: self.set_prompt(p, l, prompts_json[p][l], headers)
+                )
+
+        workers = concurrency if concurrency and concurrency > 1 else DEFAULT_GRAPH_WORKERS
+
+        logger.info('[+] Tearing down %s themes, the template and %s prompt/language pairs',
+            len(theme_ids), len(graph.order) - len(theme_ids) - 1)
+
+        graph.run(max_workers=workers)
+
+        self.theme_cache.invalidate(self.mgmt_endpoint)
+
+        failed = []
+
+        for name in graph.order:
+            task = graph.tasks[name]
+
+            if task['error'] is not None:
+                failed.append(name)
+
+            elif name.startswith('prompts/'):
+                if task['result']['error'] is not None:
+                    failed.append(name)
+
+            elif response_error(task['result']) is not None:
+                ##
+                ## already gone is as good as deleted
+                ##
+                if response_status(task['result']) != 404:
+                    failed.append(name)
+
+        logger.info('[+] Teardown complete: %s deleted or reset, %s failed',
+            len(graph.order) - len(failed), len(failed))
+
+        for name in failed:
+            logger.warning('[-] Teardown of %s failed: %s', name, graph.tasks[name]['error'] or graph.tasks[name]['result'])
+
+        return {
+            'deleted' : len(graph.order) - len(failed),
+            'failed' : failed
+        }
+
+
+    ##########################################################################
+    ##########################################################################
+    ##
+    ## get prompt - current custom-text for a prompt/language pair
+    ##
+    ##########################################################################
+    ##########################################################################
+
+
+    def get_prompt(self, prompt=None, language=None, headers=None):
+
+        prompts_url = '{}/{}/custom-text/{}'.format(self.prompts_url, prompt, language)
+
+        return self.create_request(url=prompts_url, headers=headers, get=True)
+
+
+    ##########################################################################
+    ##########################################################################
+    ##
+    ## plan deployment
+    ##
+    ##  fetch what the tenant currently serves and compare it to the local
+    ##  branding JSON, prompts JSON and HTML template ... each resource gets
+    ##  an action of 'unchanged', 'patch' or 'create'
+    ##
+    ##########################################################################
+    ##########################################################################
+
+
+    def plan_deployment(
+        self, branding_json=None, prompts_json=None, 
+        html_template=None, concurrency=DEFAULT_CONCURRENCY,
+        theme_id=None
+    ):
+
+        headers = {'Authorization' : 'Bearer {}'.format(self.access_token)}
+
+        plan = {
+            'branding' : None,
+            'global_branding' : None,
+            'prompts' : [],
+            'template' : None
+        }
+
+        concurrency = concurrency if concurrency else DEFAULT_CONCURRENCY
+
+        with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+
+            ##
+            ## every GET is independent ... issue them all up front
+            ##
+            theme_future = None
+            global_future = None
+            template_future = None
+            prompt_futures = []
+
+            if branding_json is not None:
+                if theme_id is not None:
+                    theme_url = '{}/{}'.format(self.branding_themes_url, theme_id)
+                else:
+                    theme_url = self.default_branding_themes_url
+
+                theme_future = executor.submit(
+                    self.create_request, url=theme_url, 
+                    headers=headers, get=True
+                )
+
+                if global_branding_data(branding_json) is not None:
+                    global_future = executor.submit(
+                        self.create_request, url=self.global_branding_url, 
+                        headers=headers, get=True
+                    )
+
+            if html_template is not None:
+                template_future = executor.submit(self.get_template, headers=headers)
+
+            if prompts_json is not None:
+                for prompt in prompts_json:
+                    for language in prompts_json[prompt]:
+                        prompt_futures.append(tuple([
+                            prompt, 
+                            language, 
+                            executor.submit(self.get_prompt, prompt, language, headers)
+                        ]))
+
+            ##
+            ## branding theme ... PATCH merges, so only the keys we send matter
+            ##
+            if theme_future is not None:
+                current = theme_future.result()
+
+                if isinstance(current, dict) and response_error(current) is None and 'themeId' in current:
+                    action = 'unchanged' if matches(branding_json, current) else 'patch'
+                    theme_id = current['themeId']
+                    self.theme_cache.put(self.mgmt_endpoint, theme_id)
+                else:
+                    action = 'create'
+                    theme_id = None
+
+                plan['branding'] = {
+                    'action' : action, 
+                    'theme_id' : theme_id, 
+                    'data' : branding_json
+                }
+
+            if global_future is not None:
+                desired = global_branding_data(branding_json)
+                current = global_future.result()
+
+                plan['global_branding'] = {
+                    'action' : 'unchanged' if matches(desired, current) else 'patch',
+                    'data' : branding_json
+                }
+
+            ##
+            ## prompts ... PUT replaces the custom-text, so it must match exactly
+            ##
+            for prompt, language, future in prompt_futures:
+                desired = prompts_json[prompt][language]
+                current = future.result()
+
+                plan['prompts'].append({
+                    'prompt' : prompt,
+                    'language' : language,
+                    'action' : 'unchanged' if matches(desired, current, exact=True) else 'patch',
+                    'data' : desired
+                })
+
+            if template_future is not None:
+                current = template_future.result()
+
+                if current is None:
+                    action = 'create'
+                else:
+                    action = 'unchanged' if current == html_template else 'patch'
+
+                plan['template'] = {
+                    'action' : action, 
+                    'data' : html_template
+                }
+
+        summary = plan_summary(plan)
+
+        logger.info('[+] Plan: %s unchanged, %s patched', summary['unchanged'], summary['patched'])
+
+        for resource, action in plan_changes(plan):
+            if action != 'unchanged':
+                logger.info('[+] Plan: %s %s', action, resource)
+
+        return plan
+
+
+    ##########################################################################
+    ##########################################################################
+    ##
+    ## apply plan - write only the resources that changed
+    ##
+    ##########################################################################
+    ##########################################################################
+
+
+    def apply_plan(self, plan=None, concurrency=DEFAULT_CONCURRENCY):
+
+        if plan is None:
+            return None
+
+        branding = plan.get('branding')
+        global_branding = plan.get('global_branding')
+        template = plan.get('template')
+
+        failed = []
+
+        ##
+        ## as in deploy, a write cut off by the deadline is reported as
+        ## failed and the rest are still attempted
+        ##
+        if branding is not None and branding['action'] != 'unchanged':
+            try:
+                branding_response = self.create_branding(
+                    json_data=branding['data'], 
+                    theme_id=branding['theme_id'],
+                    global_branding=False
+                )
+
+                if response_error(branding_response) is not None:
+                    failed.append('branding')
+
+            except DeadlineExceeded as e:
+                logger.warning('[-] Branding not deployed: %s', e)
+                failed.append('branding')
+
+        if global_branding is not None and global_branding['action'] != 'unchanged':
+            try:
+                global_branding_response = self.set_global_branding(json_data=global_branding['data'])
+
+                if response_error(global_branding_response) is not None:
+                    failed.append('global_branding')
+
+            except DeadlineExceeded as e:
+                logger.warning('[-] Global branding not deployed: %s', e)
+                failed.append('global_branding')
+
+        changed_prompts = {}
+
+        for p in plan.get('prompts', []):
+            if p['action'] != 'unchanged':
+                changed_prompts.setdefault(p['prompt'], {})[p['language']] = p['data']
+
+        if changed_prompts:
+            prompts_results = self.set_prompts(json_data=changed_prompts, concurrency=concurrency)
+
+            for r in prompts_results:
+                if r['error'] is not None:
+                    failed.append(prompt_key(r['prompt'], r['language']))
+
+        if template is not None and template['action'] != 'unchanged':
+            ##
+            ## the plan already compared the template ... no need to fetch again
+            ##
+            try:
+                template_response = self.create_template(
+                    html_data=template['data'],
+                    skip_unchanged=False
+                )
+
+                if response_error(template_response) is not None:
+                    failed.append('template')
+
+            except DeadlineExceeded as e:
+                logger.warning('[-] Template not deployed: %s', e)
+                failed.append('template')
+
+        summary = plan_summary(plan)
+        summary['failed'] = failed
+
+        logger.info('[+] Applied: %s unchanged, %s patched',
+            summary['unchanged'], summary['patched'])
+
+        return summary
+
+
+    ##########################################################################
+    ##########################################################################
+    ##
+    ## deploy - push every resource given, without comparing first
+    ##
+    ##########################################################################
+    ##########################################################################
+
+
+    def deploy(
+        self, branding_json=None, prompts_json=None, 
+        html_template=None, concurrency=DEFAULT_CONCURRENCY,
+        delete_template_first=False, theme_id=None
+    ):
+
+        patched = 0
+        failed = []
+
+        ##
+        ## a resource cut off by the deadline is reported as failed and the
+        ## rest are still attempted ... each is skipped fast once time is up
+        ##
+        if branding_json is not None:
+            try:
+                branding_response = self.create_branding(json_data=branding_json, theme_id=theme_id)
+
+                if response_error(branding_response) is not None:
+                    failed.append('branding')
+                else:
+                    patched += 1
+
+            except DeadlineExceeded as e:
+                logger.warning('[-] Branding not deployed: %s', e)
+                failed.append('branding')
+
+        if prompts_json:
+            try:
+                prompts_results = self.set_prompts(json_data=prompts_json, concurrency=concurrency)
+
+                for r in prompts_results:
+                    if r['error'] is not None:
+                        failed.append(prompt_key(r['prompt'], r['language']))
+                    else:
+                        patched += 1
+
+            except DeadlineExceeded as e:
+                logger.warning('[-] Prompts not deployed: %s', e)
+                failed.extend([prompt_key(p, l) for p in prompts_json for l in prompts_json[p]])
+
+        if html_template is not None:
+            try:
+                template_response = self.create_template(
+                    html_data=html_template,
+                    delete_first=delete_template_first
+                )
+
+                if response_error(template_response) is not None:
+                    failed.append('template')
+                else:
+                    patched += 1
+
+            except DeadlineExceeded as e:
+                logger.warning('[-] Template not deployed: %s', e)
+                failed.append('template')
+
+        return {
+            'unchanged' : 0,
+            'patched' : patched,
+            'failed' : failed
+        }
+
+
+    ##########################################################################
+    ##########################################################################
+    ##
+    ## export - snapshot the tenant into the examples/ layout
+    ##
+    ##  OUT_DIR/branding/default.json
+    ##  OUT_DIR/prompts/prompts.json
+    ##  OUT_DIR/templates/universal_login.liquid
+    ##  OUT_DIR/global_branding.json
+    ##  OUT_DIR/.export.json            ETags from the last export
+    ##
+    ##########################################################################
+    ##########################################################################
+
+
+    def export(self, out_dir=None, prompts_json=None, concurrency=DEFAULT_CONCURRENCY):
+
+        headers = {'Authorization' : 'Bearer {}'.format(self.access_token)}
+
+        files = {
+            'branding' : os.path.join(out_dir, 'branding', 'default.json'),
+            'global_branding' : os.path.join(out_dir, 'global_branding.json'),
+            'prompts' : os.path.join(out_dir, 'prompts', 'prompts.json'),
+            'template' : os.path.join(out_dir, 'templates', 'universal_login.liquid')
+        }
+        state_file = os.path.join(out_dir, '.export.json')
+
+        try:
+            with open(state_file, 'r') as f:
+                etags = json.load(f)
+        except (OSError, ValueError):
+            etags = {}
+
+        try:
+            with open(files['prompts'], 'r') as f:
+                exported_prompts = json.load(f)
+        except (OSError, ValueError):
+            exported_prompts = None
+
+        ##
+        ## an ETag only helps if the file it describes is still on disk
+        ##
+        for resource in ['branding', 'global_branding', 'template']:
+            if not os.path.exists(files[resource]):
+                etags.pop(resource, None)
+
+        if exported_prompts is None:
+            etags = dict([(k, v) for k, v in etags.items() if not k.startswith('prompts/')])
+            exported_prompts = {}
+
+        if prompts_json is not None:
+            pairs = [tuple([p, l]) for p in prompts_json for l in prompts_json[p]]
+        else:
+            languages = self.export_languages(headers)
+            pairs = [tuple([p, l]) for p in EXPORT_PROMPTS for l in languages]
+
+        urls = {
+            'branding' : self.default_branding_themes_url,
+            'global_branding' : self.global_branding_url,
+            'template' : self.template_url
+        }
+
+        for prompt, language in pairs:
+            urls[prompt_key(prompt, language)] = '{}/{}/custom-text/{}'.format(self.prompts_url, prompt, language)
+
+        workers = concurrency if concurrency and concurrency > 1 else DEFAULT_GRAPH_WORKERS
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = dict([
+                (k, executor.submit(self.conditional_get, url, headers, etags.get(k)))
+                for k, url in urls.items()
+            ])
+
+        summary = {
+            'written' : 0,
+            'unchanged' : 0,
+            'not_modified' : 0,
+            'removed' : 0,
+            'failed' : []
+        }
+
+        contents = {}
+
+        for k, future in futures.items():
+            try:
+                data, etag, not_modified = future.result()
+            except Exception as e:
+                summary['failed'].append(k)
+                logger.warning('[-] Export of %s failed: %s', k, e)
+                continue
+
+            if not_modified is True:
+                summary['not_modified'] += 1
+                continue
+
+            if response_error(data) is not None:
+                ##
+                ## a 404 just means the tenant has nothing there ... an
+                ## earlier export of it would deploy something that's gone
+                ##
+                if response_status(data) != 404:
+                    summary['failed'].append(k)
+                    logger.warning('[-] Export of %s failed: %s', k, response_error(data))
+
+                elif k in files and os.path.exists(files[k]):
+                    os.remove(files[k])
+                    summary['removed'] += 1
+                    logger.info('[+] Removed %s ... %s is gone from the tenant', files[k], k)
+
+                etags.pop(k, None)
+                continue
+
+            if etag is not None:
+                etags[k] = etag
+            else:
+                etags.pop(k, None)
+
+            contents[k] = data
+
+        ##
+        ## prompts are one file ... merge fresh pairs over the ones the
+        ## server said were not modified
+        ##
+        prompts_changed = False
+
+        for prompt, language in pairs:
+            k = prompt_key(prompt, language)
+
+            if k not in contents:
+                continue
+
+            prompts_changed = True
+
+            if contents[k]:
+                exported_prompts.setdefault(prompt, {})[language] = contents[k]
+            elif language in exported_prompts.get(prompt, {}):
+                del exported_prompts[prompt][language]
+
+                if not exported_prompts[prompt]:
+                    del exported_prompts[prompt]
+
+        writes = []
+
+        if 'branding' in contents:
+            theme = dict([(k, v) for k, v in contents['branding'].items() if k != 'themeId'])
+            writes.append(tuple([files['branding'], json.dumps(theme, indent=4)]))
+
+        if 'global_branding' in contents:
+            writes.append(tuple([files['global_branding'], json.dumps(contents['global_branding'], indent=4)]))
+
+        if prompts_changed is True:
+            writes.append(tuple([files['prompts'], json.dumps(exported_prompts, indent=4)]))
+
+        if 'template' in contents:
+            writes.append(tuple([files['template'], contents['template'].get('body', '')]))
+
+        for path, content in writes:
+            if write_if_changed(path, content) is True:
+                summary['written'] += 1
+                logger.info('[+] Exported %s', path)
+            else:
+                summary['unchanged'] += 1
+
+        os.makedirs(out_dir, exist_ok=True)
+
+        with open(state_file, 'w') as f:
+            json.dump(etags, f, indent=4, sort_keys=True)
+
+        logger.info('[+] Export to %s: %s written, %s unchanged, %s not modified, %s removed, %s failed',
+            out_dir, summary['written'], summary['unchanged'], summary['not_modified'],
+            summary['removed'], len(summary['failed']))
+
+        return summary
+
+
+    def export_languages(self, headers=None):
+
+        headers = headers or {'Authorization' : 'Bearer {}'.format(self.access_token)}
+
+        settings = self.create_request(url=self.tenant_settings_url, headers=headers, get=True)
+
+        if response_error(settings) is not None or not isinstance(settings, dict):
+            logger.warning('[-] Cannot read tenant languages, exporting %s: %s',
+                ', '.join(EXPORT_LANGUAGES), response_error(settings) or 'unexpected response')
+            return EXPORT_LANGUAGES
+
+        return settings.get('enabled_locales') or EXPORT_LANGUAGES
+
+
+    ##########################################################################
+    ##########################################################################
+    ##
+    ## capture state - current value of each resource key, fetched in
+    ## parallel ... None for a resource the tenant does not have
+    ##
+    ##########################################################################
+    ##########################################################################
+
+
+    def capture_resource(self, key, headers=None):
+
+        headers = headers or {'Authorization' : 'Bearer {}'.format(self.access_token)}
+
+        if key == 'branding':
+            url = self.default_branding_themes_url
+        elif key == 'global_branding':
+            url = self.global_branding_url
+        elif key == 'template':
+            url = self.template_url
+        elif key.startswith('themes/'):
+            url = '{}/{}'.format(self.branding_themes_url, key.split('/', 1)[1])
+        elif key.startswith('prompts/'):
+            prompt, language = key.split('/')[1:3]
+            url = '{}/{}/custom-text/{}'.format(self.prompts_url, prompt, language)
+        else:
+            raise ValueError('Cannot capture {}: unknown resource'.format(key))
+
+        current = self.create_request(url=url, headers=headers, get=True)
+
+        if response_status(current) == 404:
+            return None
+
+        if response_error(current) is not None:
+            ##
+            ## never write without a way back
+            ##
+            raise ValueError('Cannot capture {}: {}'.format(key, response_error(current)))
+
+        if not isinstance(current, dict):
+            raise ValueError('Cannot capture {}: unexpected response {}'.format(key, current))
+
+        if key == 'template':
+            return current.get('body')
+
+        if key == 'branding':
+            self.theme_cache.put(self.mgmt_endpoint, current['themeId'])
+            return dict([(n, v) for n, v in current.items() if n != 'themeId'])
+
+        if key.startswith('themes/'):
+            return dict([(n, v) for n, v in current.items() if n != 'themeId'])
+
+        if key == 'global_branding':
+            return dict([(n, v) for n, v in current.items() if v is not None])
+
+        return current
+
+
+    def capture_state(self, keys=None, concurrency=DEFAULT_CONCURRENCY):
+
+        headers = {'Authorization' : 'Bearer {}'.format(self.access_token)}
+
+        workers = concurrency if concurrency and concurrency > 1 else DEFAULT_GRAPH_WORKERS
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = dict([
+                (k, executor.submit(self.capture_resource, k, headers))
+                for k in keys or []
+            ])
+
+        return dict([(k, future.result()) for k, future in futures.items()])
+
+
+    ##########################################################################
+    ##########################################################################
+    ##
+    ## restore state - write captured resources back in parallel
+    ##
+    ##########################################################################
+    ##########################################################################
+
+
+    def restore_state(self, state=None, concurrency=DEFAULT_CONCURRENCY):
+
+        headers = {'Authorization' : 'Bearer {}'.format(self.access_token)}
+
+        def restore_theme(theme_id, value):
+
+            url = '{}/{}'.format(self.branding_themes_url, theme_id)
+
+            if value is None:
+                response = self.create_request(url=url, headers=headers, delete=True)
+
+                ##
+                ## already gone is as good as deleted
+                ##
+                return {} if response_status(response) == 404 else response
+
+            response = self.write_theme(json_data=value, theme_id=theme_id, headers=headers)
+
+            if response_status(response) == 404:
+                ##
+                ## a torn down theme cannot be brought back under its old ID
+                ## ... recreate it with the captured settings
+                ##
+                logger.info('[+] Branding theme %s is gone ... recreating it', theme_id)
+
+                response = self.write_theme(json_data=value, headers=headers)
+
+            return response
+
+        def restore_global_branding(value):
+
+            ##
+            ## a PATCH only sets fields ... anything added after the capture
+            ## is cleared explicitly
+            ##
+            current = self.create_request(url=self.global_branding_url, headers=headers, get=True)
+
+            if response_error(current) is not None:
+                return current
+
+            return self.create_request(url=self.global_branding_url, headers=headers,
+                json_data=restore_patch(current, value or {}), patch=True)
+
+        graph = TaskGraph()
+
+        for k, value in (state or {}).items():
+
+            if k == 'branding':
+                if value is None:
+                    graph.add(k, lambda: self.delete_branding())
+                else:
+                    graph.add(k, lambda v=value: self.create_branding(json_data=v, global_branding=False))
+
+            elif k == 'global_branding':
+                graph.add(k, lambda v=value: restore_global_branding(v))
+
+            elif k == 'template':
+                if value is None:
+                    graph.add(k, lambda: self.delete_template())
+                else:
+                    graph.add(k, lambda v=value: self.create_template(html_data=v, skip_unchanged=False))
+
+            elif k.startswith('themes/'):
+                graph.add(k, lambda t=k.split('/', 1)[1], v=value: restore_theme(t, v))
+
+            elif k.startswith('prompts/'):
+                prompt, language = k.split('/')[1:3]
+                graph.add(k, lambda p=prompt, l=language, v=value: self.set_prompt(p, l, v or {}, headers))
+
+        workers = concurrency if concurrency and concurrency > 1 else DEFAULT_GRAPH_WORKERS
+
+        graph.run(max_workers=workers)
+
+        failed = []
+
+        for name in graph.order:
+            task = graph.tasks[name]
+
+            if task['error'] is not None:
+                failed.append(name)
+
+            elif name.startswith('prompts/'):
+                if task['result']['error'] is not None:
+                    failed.append(name)
+
+            elif response_error(task['result']) is not None:
+                failed.append(name)
+
+        logger.info('[+] Restored %s resources, %s failed', len(graph.order) - len(failed), len(failed))
+
+        return {
+            'restored' : len(graph.order) - len(failed),
+            'failed' : failed
+        }
+
+
+    ##########################################################################
+    ##########################################################################
+    ##
+    ## deploy graph - push every resource given, independent writes in
+    ## parallel ... the only ordering is theme lookup before theme write
+    ##
+    ##########################################################################
+    ##########################################################################
+
+
+    def deploy_graph(
+        self, branding_json=None, prompts_json=None, 
+        html_template=None, concurrency=DEFAULT_CONCURRENCY,
+        delete_template_first=False, theme_id=None
+    ):
+
+        headers = {'Authorization' : 'Bearer {}'.format(self.access_token)}
+
+        graph = TaskGraph()
+
+        def lookup_theme():
+            return self.get_theme_id(headers=headers)
+
+        def write_theme(lookup_theme=None):
+            return self.write_theme(
+                json_data=branding_json,
+                theme_id=lookup_theme[0],
+                headers=headers,
+                from_cache=lookup_theme[1]
+            )
+
+        if branding_json is not None:
+
+            if theme_id is not None:
+                graph.add('theme', lambda: self.create_branding(
+                    json_data=branding_json, theme_id=theme_id, global_branding=False))
+            else:
+                graph.add('lookup_theme', lookup_theme)
+                graph.add('theme', write_theme, deps=['lookup_theme'])
+
+            if global_branding_data(branding_json) is not None:
+                graph.add('global_branding', lambda: self.set_global_branding(json_data=branding_json))
+
+        for prompt in (prompts_json or {}):
+            for language in prompts_json[prompt]:
+                graph.add(
+                    prompt_key(prompt, language), 
+                    lambda p=prompt, l=language: self.set_prompt(p, l, prompts_json[p][l], headers)
+                )
+
+        if html_template is not None:
+            graph.add('template', lambda: self.create_template(
+                html_data=html_template, delete_first=delete_template_first))
+
+        workers = concurrency if concurrency and concurrency > 1 else DEFAULT_GRAPH_WORKERS
+
+        graph.run(max_workers=workers)
+
+        failed = []
+
+        for name in graph.order:
+            task = graph.tasks[name]
+
+            if name == 'lookup_theme':
+                continue
+
+            if task['error'] is not None:
+                failed.append(name)
+
+            elif name.startswith('prompts/'):
+                if task['result']['error'] is not None:
+                    failed.append(name)
+
+            elif response_error(task['result']) is not None:
+                failed.append(name)
+
+        report = graph.report()
+
+        logger.info('[+] Deployed %s resources in %.0fms, critical path: %s',
+            len(graph.order), report['wall_ms'],
+            ' -> '.join(['{} ({:.0f}ms)'.format(t['task'], t['duration_ms']) for t in report['critical_path']]))
+
+        return {
+            'unchanged' : 0,
+            'patched' : len([n for n in graph.order if n != 'lookup_theme' and n not in failed]),
+            'failed' : failed,
+            'critical_path' : report['critical_path'],
+            'wall_ms' : report['wall_ms']
+        }
+
+
+###########################################################################
+###########################################################################
+##
+## lambda handler
+##
+###########################################################################
+###########################################################################
+
+
+def lambda_handler(event, context):
+    ##
+    ## Lambda handler
+    ##
+    event = with_deadline(event, context)
+
+    if event.get('tenants_file'):
+        return deploy_fleet(event)
+
+    return deploy_tenant(event)
+
+
+def with_deadline(event, context):
+
+    ##
+    ## the Lambda time budget (less a margin to report in) wins over the
+    ## --deadline seconds given on the CLI ... as epoch seconds, so it means
+    ## the same thing in fleet worker processes
+    ##
+    seconds = None
+
+    if context is not None and hasattr(context, 'get_remaining_time_in_millis'):
+        seconds = context.get_remaining_time_in_millis() / 1000.0 - DEADLINE_MARGIN
+
+    elif event.get('deadline'):
+        seconds = float(event['deadline'])
+
+    if seconds is None:
+        return event
+
+    logger.debug('[+] Deadline in %.2fs', seconds)
+
+    event = dict(event)
+    event['deadline_at'] = time.time() + seconds
+
+    return event
+
+
+###########################################################################
+###########################################################################
+##
+## client cache - Auth0 clients reused across warm Lambda invocations
+##
+###########################################################################
+###########################################################################
+
+
+CLIENTS = {}
+CLIENTS_LOCK = threading.Lock()
+
+##
+## clients kept for reuse ... one per tenant and settings
+##
+MAX_CLIENTS = 16
+
+
+def get_client(event):
+
+    concurrency = event.get('concurrency', DEFAULT_CONCURRENCY)
+
+    ##
+    ## credentials default to the AUTH0_* environment variables ... keep
+    ## enough pooled connections for every concurrent worker
+    ##
+    settings = tuple([
+        event.get('client_id'),
+        event.get('client_secret'),
+        event.get('auth0_domain'),
+        event.get('mgmt_endpoint') or os.environ.get('AUTH0_MGMT_API_ENDPOINT'),
+        max(event.get('pool_size', DEFAULT_POOL_SIZE), concurrency),
+        event.get('token_cache'),
+        event.get('theme_cache'),
+        event.get('rate_limit'),
+        event.get('max_retries'),
+        event.get('connect_timeout'),
+        event.get('read_timeout')
+    ])
+
+    with CLIENTS_LOCK:
+
+        if settings not in CLIENTS:
+
+            logger.debug('[+] Creating Auth0 management client')
+
+            client_id, client_secret, auth0_domain, mgmt_endpoint, \
+                pool_size, token_cache, theme_cache, rate_limit, max_retries, \
+                connect_timeout, read_timeout = settings
+
+            CLIENTS[settings] = Auth0( client_id=client_id, 
+                                       client_secret=client_secret,
+                                       auth0_domain=auth0_domain,
+                                       pool_size=pool_size,
+                                       token_cache_file=token_cache,
+                                       theme_cache_file=theme_cache,
+                                       mgmt_endpoint=mgmt_endpoint,
+                                       rate_limit=rate_limit,
+                                       max_retries=max_retries,
+                                       connect_timeout=connect_timeout,
+                                       read_timeout=read_timeout )
+
+        ##
+        ## least recently used first ... a long fleet run or warm Lambda
+        ## keeps at most MAX_CLIENTS, the oldest lose their pooled connections
+        ##
+        client = CLIENTS.pop(settings)
+        CLIENTS[settings] = client
+
+        evicted = []
+
+        while len(CLIENTS) > MAX_CLIENTS:
+            evicted.append(CLIENTS.pop(next(iter(CLIENTS))))
+
+    for old_client in evicted:
+        old_client.close()
+
+    return client
+
+
+###########################################################################
+###########################################################################
+##
+## deploy tenant - a single tenant deployment driven by an event
+##
+###########################################################################
+###########################################################################
+
+
+def deploy_tenant(event):
+
+    configure_logging(verbose=event.get('verbose', False))
+
+    branding_json, prompts_json, html_template = load_inputs(event)
+
+    concurrency = event.get('concurrency', DEFAULT_CONCURRENCY)
+
+    auth0_tenant = get_client(event)
+
+    ##
+    ## the client outlives the invocation ... metrics are per invocation
+    ##
+    auth0_tenant.metrics = Metrics()
+    auth0_tenant.deadline = event.get('deadline_at')
+    auth0_tenant.deadline_hit = False
+
+    try:
+
+        if event.get('export_dir'):
+            result = auth0_tenant.export(
+                out_dir=event['export_dir'],
+                prompts_json=prompts_json,
+                concurrency=concurrency
+            )
+
+        elif event.get('rollback'):
+            result = rollback(auth0_tenant, event)
+
+        elif event.get('catalogs'):
+            result = deploy_catalogs(auth0_tenant, event)
+
+        elif event['delete_input']:
+            journal_id = None
+            keys = ['branding', 'template'] + resource_keys(prompts_json=prompts_json)
+
+            ##
+            ## teardown deletes every theme on the tenant, not just the
+            ## default ... journal each one it is about to delete
+            ##
+            theme_ids = auth0_tenant.teardown_themes(theme_id=event.get('theme_id'))
+
+            if event.get('journal_dir'):
+                journal_id = journal_state(
+                    auth0_tenant, event,
+                    ['themes/{}'.format(t) for t in theme_ids] + ['template'] + resource_keys(prompts_json=prompts_json)
+                )
+
+            result = auth0_tenant.teardown(
+                prompts_json=prompts_json,
+                concurrency=concurrency,
+                theme_ids=theme_ids
+            )
+
+            if event.get('state_file'):
+                ##
+                ## the deleted and reset resources no longer match the last
+                ## deploy ... the next deploy must push them again
+                ##
+                StateManifest(state_file=event['state_file']).forget(
+                    tenant=auth0_tenant.mgmt_endpoint,
+                    keys=keys + ['global_branding']
+                )
+
+            if journal_id is not None:
+                result['journal'] = journal_id
+
+        elif event.get('plan_input'):
+            plan = auth0_tenant.plan_deployment(
+                branding_json=branding_json,
+                prompts_json=prompts_json,
+                html_template=html_template,
+                concurrency=concurrency,
+                theme_id=event.get('theme_id')
+            )
+
+            result = plan_summary(plan)
+
+        else:
+
+            result = deploy_resources(auth0_tenant, event, branding_json, prompts_json, html_template)
 
+    except DeadlineExceeded as e:
         ##
-        ##********************************************************************
-        ##
-        ## URL Formats for Universal Login Templates:
+        ## stop here with what was done rather than be killed mid-request
+        ## ... the metrics show what completed before the cut-off
         ##
-        ##      PUT /api/v2/branding/templates/universal-login
+        result = {'unchanged' : 0, 'patched' : 0, 'failed' : [], 'error' : str(e)}
+        auth0_tenant.deadline_hit = True
+        logger.error('[-] %s', e)
+
+    if auth0_tenant.deadline_hit is True:
         ##
-        ##********************************************************************
+        ## skipped work is a failure, even when every resource that was
+        ## attempted went through
         ##
-        if self.mgmt_endpoint.endswith('/'):
-            self.template_url = '{}branding/templates/universal-login'.format(self.mgmt_endpoint)
-        else:
-            self.template_url = '{}/branding/templates/universal-login'.format(self.mgmt_endpoint)
+        result['deadline_exceeded'] = True
+        result.setdefault('failed', [])
+
+        if 'deadline' not in result['failed']:
+            result['failed'].append('deadline')
+
+        logger.error('[-] Deadline exceeded ... remaining work was skipped, see metrics for what completed')
+
+    report = auth0_tenant.metrics.report()
+
+    if event.get('emf'):
+        emit_emf(report, tenant=auth0_tenant.mgmt_endpoint)
+
+    result['metrics'] = report
+
+    return result
 
-        print('[+] Universal Login Template URL: {}'.format(self.template_url))
 
+def deploy_resources(auth0_tenant, event, branding_json, prompts_json, html_template):
 
+    skipped = 0
+    manifest = None
+    tenant = auth0_tenant.mgmt_endpoint
+    concurrency = event.get('concurrency', DEFAULT_CONCURRENCY)
+
+    deploy_branding = branding_json
+    deploy_prompts = prompts_json
+    deploy_template = html_template
+
+    if event.get('state_file'):
+        manifest = StateManifest(state_file=event['state_file'])
+
+        if not event.get('force'):
+            deploy_branding, deploy_prompts, deploy_template, skipped = manifest.filter(
+                tenant=tenant,
+                branding_json=branding_json,
+                prompts_json=prompts_json,
+                html_template=html_template
+            )
+
+    if deploy_branding is None and not deploy_prompts and deploy_template is None:
+        logger.info('[+] Nothing to deploy: %s unchanged, 0 patched', skipped)
+        return {'unchanged' : skipped, 'patched' : 0, 'failed' : []}
+
+    if event.get('preflight'):
         ##
-        ## now go get a token
+        ## a broken logo or font is cheaper to catch here than on the
+        ## login page ... nothing is written if any asset fails
         ##
-        self.get_token()
-
+        errors = preflight_assets(
+            branding_json=deploy_branding,
+            html_template=deploy_template,
+            ttl=event.get('asset_ttl')
+        )
+
+        if errors:
+            for e in errors:
+                logger.error('[-] Pre-flight: %s', e)
+
+            return {'unchanged' : skipped, 'patched' : 0, 'failed' : ['preflight'], 'preflight' : errors}
+
+    journal_id = None
+
+    if event.get('diff_input'):
+        plan = auth0_tenant.plan_deployment(
+            branding_json=deploy_branding,
+            prompts_json=deploy_prompts,
+            html_template=deploy_template,
+            concurrency=concurrency,
+            theme_id=event.get('theme_id')
+        )
+
+        if event.get('journal_dir'):
+            ##
+            ## the plan knows exactly which resources are about to change
+            ##
+            keys = [k for k, action in plan_changes(plan) if action != 'unchanged']
+            journal_id = journal_state(auth0_tenant, event, keys)
 
-    ##########################################################################
-    ##########################################################################
-    ##
-    ## get token
-    ##
-    ##########################################################################
-    ##########################################################################
+        result = auth0_tenant.apply_plan(plan=plan, concurrency=concurrency)
 
+    else:
 
-    def get_token(self):
+        if event.get('journal_dir'):
+            keys = resource_keys(deploy_branding, deploy_prompts, deploy_template)
+            journal_id = journal_state(auth0_tenant, event, keys)
+
+        if event.get('parallel'):
+            result = auth0_tenant.deploy_graph(
+                branding_json=deploy_branding,
+                prompts_json=deploy_prompts,
+                html_template=deploy_template,
+                concurrency=concurrency,
+                delete_template_first=event.get('delete_template_first', False),
+                theme_id=event.get('theme_id')
+            )
 
-        if self.mgmt_endpoint.endswith('/'):
-            audience = '{}'.format(self.mgmt_endpoint)
         else:
-            audience = '{}/'.format(self.mgmt_endpoint)
+            result = auth0_tenant.deploy(
+                branding_json=deploy_branding,
+                prompts_json=deploy_prompts,
+                html_template=deploy_template,
+                concurrency=concurrency,
+                delete_template_first=event.get('delete_template_first', False),
+                theme_id=event.get('theme_id')
+            )
 
-        token_data = {
-            'client_id' : self.client_id,
-            'client_secret' : self.client_secret,
-            'audience' : audience,
-            'grant_type' : 'client_credentials'
-        }
+    result['unchanged'] += skipped
 
-        print('[+] Getting access token from : {}'.format(self.token_endpoint))
+    if journal_id is not None:
+        result['journal'] = journal_id
 
-        token_response = requests.post(self.token_endpoint, json=token_data)
+    if manifest is not None:
+        manifest.record(
+            tenant=tenant,
+            branding_json=deploy_branding,
+            prompts_json=deploy_prompts,
+            html_template=deploy_template,
+            failed=result['failed']
+        )
 
-        print('[+] Token response: {}'.format(token_response))
+    return result
 
-        self.access_token = token_response.json()['access_token']
 
-        return self.access_token
+def deploy_catalogs(auth0_tenant, event):
 
+    tenant = auth0_tenant.mgmt_endpoint
 
-    ##########################################################################
-    ##########################################################################
     ##
-    ## create request
+    ## records are checked as they stream ... a bad one stops the stream and
+    ## the payloads already sent are still journaled and reported
     ##
-    ##########################################################################
-    ##########################################################################
+    errors = []
+    keys = []
+    state = {} if event.get('journal_dir') else None
+
+    try:
+        result = auth0_tenant.stream_prompts(
+            payloads=catalog_payloads(event['catalogs'], errors=errors, keys=keys),
+            concurrency=event.get('concurrency', DEFAULT_CONCURRENCY),
+            state=state
+        )
+
+    finally:
+        if state:
+            journal_id = Journal(event['journal_dir']).record(tenant=tenant, resources=state)
+
+        if event.get('state_file') and keys:
+            ##
+            ## streamed payloads are never held whole to hash ... the next
+            ## deploy must push these prompts again
+            ##
+            StateManifest(state_file=event['state_file']).forget(tenant=tenant, keys=keys)
 
+    if errors:
+        for e in errors:
+            logger.error('[-] Catalogs: %s', e)
 
-    def create_request(
-        self, url=None, headers=None, get=False, 
-        put=False, post=False, patch=False, delete=False,
-        json_data=None, data=None, theme_id=None 
-    ):
+        result['failed'].append('catalogs')
+        result['catalogs'] = errors
 
-        if url is None or headers is None:
-            return None
-        else:
+    if state:
+        result['journal'] = journal_id
 
-            response = None
+    return result
 
-            if get is True:
-                ##
-                ## HTTP GET
-                ##
-                print('[+] HTTP GET: {}'.format(url))
-                response = requests.get(url, headers=headers)
 
-            elif put is True:
-                ##
-                ## HTTP PUT
-                ##
-                print('[+] HTTP PUT: {}'.format(url))
-                if json_data is not None:
-                    response = requests.put(url, headers=headers, json=json_data)
-                elif data is not None:
-                    response = requests.put(url, headers=headers, data=data)
-                else:
-                    return None
+def journal_state(auth0_tenant, event, keys, rollback_of=None):
 
-            elif post is True:
-                ##
-                ## HTTP POST
-                ##
-                print('[+] HTTP POST: {}'.format(url))
-                if json_data is not None:
-                    response = requests.post(url, headers=headers, json=json_data)
-                elif data is not None:
-                    response = requests.post(url, headers=headers, data=data)
-                else:
-                    return None
+    ##
+    ## capture the resources about to be written ... nothing to keep if
+    ## nothing is about to change
+    ##
+    if not keys:
+        return None
 
-            elif patch is True:
-                ##
-                ## HTTP PATCH
-                ##
-                print('[+] HTTP PATCH: {}'.format(url))
-                if json_data is not None:
-                    response = requests.patch(url, headers=headers, json=json_data)
-                elif data is not None:
-                    response = requests.patch(url, headers=headers, data=data)
-                else:
-                    return None
+    state = auth0_tenant.capture_state(keys=keys, concurrency=event.get('concurrency', DEFAULT_CONCURRENCY))
 
-            elif delete is True:
-                ##
-                ## HTTP DELETE
-                ##
-                print('[+] HTTP DELETE: {}'.format(url))
-                response = requests.delete(url, headers=headers)
+    return Journal(event['journal_dir']).record(
+        tenant=auth0_tenant.mgmt_endpoint, resources=state, rollback_of=rollback_of)
 
 
-            try:
-                response_data = response.json()
-                print('[+] HTTP response body is JSON: \n {}'.format(json.dumps(response_data, indent=4)))
-            except Exception as e:
-                print('[-] HTTP response is not JSON')
-                response_data = response
-                print('[+] HTTP response body: \n {}'.format(response_data))
+def rollback(auth0_tenant, event):
 
-            return response_data
+    tenant = auth0_tenant.mgmt_endpoint
+    journal = Journal(event['journal_dir'])
 
+    entry = journal.load(tenant=tenant, entry_id=event.get('rollback_to'))
+    keys = list(entry['resources'])
+
+    logger.info('[+] Rolling back %s resources to %s', len(keys), entry['id'])
 
-    ##########################################################################
-    ##########################################################################
     ##
-    ## get default branding
+    ## the rollback is journaled too, so it can itself be rolled back with
+    ## --to ... tagged so a plain --rollback skips it
     ##
-    ##########################################################################
-    ##########################################################################
+    journal_id = journal_state(auth0_tenant, event, keys, rollback_of=entry['id'])
 
+    result = auth0_tenant.restore_state(
+        state=entry['resources'],
+        concurrency=event.get('concurrency', DEFAULT_CONCURRENCY)
+    )
 
-    def get_default_branding(self, headers=None):
-
-        if headers is not None:
+    if event.get('state_file'):
+        StateManifest(state_file=event['state_file']).forget(tenant=tenant, keys=keys)
 
-            default_branding_response = self.create_request(
-                url = self.default_branding_themes_url, 
-                headers=headers,
-                get=True
-            )
+    result['rolled_back_to'] = entry['id']
+    result['journal'] = journal_id
 
-            default_json = default_branding_response
-            default_brand_id = default_branding_response['themeId']
+    return result
 
-            print('[+] Default branding theme ID: {}'.format(default_brand_id))
 
-        else:
+###########################################################################
+###########################################################################
+##
+## fleet deployment - many tenants from a tenants file
+##
+##  {
+##      "tenants": [
+##          {
+##              "name": "acme-dev",
+##              "domain": "login.acme.com",
+##              "mgmt_endpoint": "https://acme-dev.us.auth0.com/api/v2",
+##              "credentials": "ACME_DEV",
+##              "overrides": { "branding_json": "...", "concurrency": 4 }
+##          }
+##      ]
+##  }
+##
+##  "credentials" names the env var prefix holding the client credentials,
+##  i.e. ACME_DEV_CLIENT_ID and ACME_DEV_CLIENT_SECRET
+##
+###########################################################################
+###########################################################################
 
-            return None
 
-        return tuple([default_json, default_brand_id])
+def tenant_event(event, tenant):
 
+    ##
+    ## start from the base event and layer the tenant on top
+    ##
+    t_event = dict(event)
+    t_event.pop('tenants_file', None)
 
-    ##########################################################################
-    ##########################################################################
     ##
-    ## set prompts
+    ## a theme ID only means something on one tenant ... set it per
+    ## tenant via overrides
     ##
-    ##########################################################################
-    ##########################################################################
+    t_event.pop('theme_id', None)
 
+    if t_event.get('export_dir'):
+        t_event['export_dir'] = os.path.join(t_event['export_dir'], tenant.get('name', tenant.get('domain')))
 
-    def set_prompts(self, json_data=None):
+    credentials = tenant.get('credentials')
 
-        patch = False
-        put = False
-        post = False
-        get = False
+    t_event['auth0_domain'] = tenant.get('domain')
+    t_event['mgmt_endpoint'] = tenant.get('mgmt_endpoint')
 
-        url = None
-        prompts_response = None
-        prompts_json = None
+    if credentials is not None:
+        t_event['client_id'] = os.environ.get('{}_CLIENT_ID'.format(credentials))
+        t_event['client_secret'] = os.environ.get('{}_CLIENT_SECRET'.format(credentials))
 
-        if json_data is not None:
+    t_event.update(tenant.get('overrides', {}))
 
-            headers = {'Authorization' : 'Bearer {}'.format(self.access_token)}
+    return t_event
 
-            ##
-            ##********************************************************************
-            ##
-            ## URL Formats for Prompts API:
-            ##
-            ##      https://[AUTH0_DOMAIN]/api/v2/prompts
-            ##      https://[AUTH0_DOMAIN]/api/v2/prompts/{prompt}/custom-text/{language}
-            ##
-            ##********************************************************************
-            ##
 
-            for j in json_data:
+def run_tenant(name, event):
 
-                prompt = j
+    ##
+    ## runs in a worker thread or process ... never let one tenant's
+    ## failure escape into the rest of the fleet
+    ##
+    report = {
+        'tenant' : name,
+        'status' : 'ok',
+        'result' : None,
+        'error' : None,
+        'duration' : None
+    }
 
-                for l in json_data[j]:
-                    language = l
+    start = time.time()
 
-                    screens = json_data[j][l]
+    try:
+        report['result'] = deploy_tenant(event)
 
-                    prompts_url = '{}/{}/custom-text/{}'.format(self.prompts_url, prompt, language)
+        if isinstance(report['result'], dict) and (
+                report['result'].get('failed') or report['result'].get('deadline_exceeded')):
+            report['status'] = 'failed'
+            report['error'] = 'failed resources: {}'.format(', '.join(report['result'].get('failed') or ['deadline']))
 
-                    print('[+] Using prompt update URL: {}'.format(prompts_url))
-                    print('[+] Using prompt update paylaod: \n{}'.format(screens))
+    except Exception as e:
+        report['status'] = 'failed'
+        report['error'] = '{}: {}'.format(type(e).__name__, e)
 
-                    prompts_response = self.create_request(
-                        url = prompts_url,
-                        headers=headers,
-                        json_data=screens,
-                        put=True
-                    )
+    report['duration'] = round(time.time() - start, 3)
 
-                    print('[+] Prompts response: {}'.format(prompts_response))
+    return report
 
-        else:
-            return None
 
+def deploy_fleet(event):
 
-        return True
+    configure_logging(verbose=event.get('verbose', False))
 
+    with open(event['tenants_file'], 'rb') as f:
+        tenants = json.load(f)['tenants']
 
-    ##########################################################################
-    ##########################################################################
-    ##
-    ## create branding
-    ##
-    ##########################################################################
-    ##########################################################################
+    workers = event.get('workers', DEFAULT_FLEET_WORKERS)
+    worker_type = event.get('worker_type', 'thread')
 
+    if worker_type == 'process':
+        ##
+        ## multiprocessing is only imported when process workers are used
+        ##
+        from concurrent.futures import ProcessPoolExecutor
+        executor_class = ProcessPoolExecutor
+    else:
+        executor_class = ThreadPoolExecutor
 
-    def create_branding(self, json_data=None, theme_id=None):
+    logger.info('[+] Deploying %s tenants with %s %s workers', len(tenants), workers, worker_type)
 
-        patch = False
-        put = False
-        post = False
-        get = False
+    start = time.time()
 
-        url = None
-        branding_response = None
-        branding_json = None
+    with executor_class(max_workers=workers) as executor:
+        futures = []
 
-        if json_data is not None:
+        for i, tenant in enumerate(tenants):
+            name = tenant.get('name', tenant.get('domain', 'tenant-{}'.format(i)))
+            futures.append(executor.submit(run_tenant, name, tenant_event(event, tenant)))
 
-            headers = {'Authorization' : 'Bearer {}'.format(self.access_token)}
+        reports = [f.result() for f in futures]
 
-            if theme_id is None:
+    duration = round(time.time() - start, 3)
 
-                try:
+    failed = [r for r in reports if r['status'] != 'ok']
 
-                    ##
-                    ## no theme ID provided ... use default profile ID
-                    ##
-                    default_branding = self.get_default_branding(headers=headers)
-                    default_brand_id = default_branding[1]
+    logger.info('[+] Fleet report:')
+    for r in reports:
+        if r['status'] == 'ok':
+            logger.info('[+]   %-32s ok      %8.3fs', r['tenant'], r['duration'])
+        else:
+            logger.warning('[-]   %-32s failed  %8.3fs  %s', r['tenant'], r['duration'], r['error'])
 
-                    patch = True
-                    put = False
-                    post = False
-                    get = False
+    logger.info('[+] Fleet complete: %s succeeded, %s failed in %.3fs',
+        len(reports) - len(failed), len(failed), duration)
 
-                    url = '{}/{}'.format(self.branding_themes_url, default_brand_id)
+    return {
+        'tenants' : reports,
+        'succeeded' : len(reports) - len(failed),
+        'failed' : len(failed),
+        'duration' : duration
+    }
 
-                except Exception as e:
-                    ##
-                    ## didn't find the default branding theme and don't have
-                    ## a theme ID ... so create a new theme
-                    ##
-                    print('[-] Default branding theme not found: {}'.format(e))
-                    patch = False
-                    put = False
-                    post = True
-                    get = False
 
-                    url = self.branding_themes_url
+###########################################################################
+###########################################################################
+##
+## watch mode - one long-lived client, push only what changed on save
+##
+###########################################################################
+###########################################################################
+
 
-            else:
-                patch = True
-                put = False
-                post = False
-                get = False
+class Watcher(object):
 
-                url = '{}/{}'.format(self.branding_themes_url, theme_id)
+    def __init__(self, auth0_tenant, event):
 
+        self.auth0_tenant = auth0_tenant
+        self.event = event
+        self.theme_id = event.get('theme_id')
+        self.minify = event.get('minify', False)
 
-            print('[+] Using branding profile: \n{}'.format(json.dumps(json_data, indent=4)))
+        self.branding_file = event.get('branding_json')
+        self.branding_overlays = event.get('branding_overlays') or []
+        self.prompts_file = event.get('prompts_json')
+        self.template_file = event.get('html_template')
 
-            if post is True:
+        self.hashes = {}
+        self.global_hash = None
+        self.template_sources = []
+        self.failed = []
 
-                ##
-                ## create branding theme using HTTP POST
-                ##
-                branding_response = self.create_request(
-                    url = url,
-                    headers=headers,
-                    json_data=json_data,
-                    post=True
-                )
 
-            elif patch is True:
-                ##
-                ## create branding theme using HTTP POST
-                ##
-                branding_response = self.create_request(
-                    url = url,
-                    headers=headers,
-                    json_data=json_data,
-                    patch=True
-                )
+    def paths(self):
 
-            ##
-            ## if a Logo URL is in the JSON data it needs to be updated
-            ## in the global branding profile as well as the branding theme
-            ## otherwise the page temaplate variable '{{ branding.logo_url }}' 
-            ## does not contain the correct logo path
-            ##
-            if 'widget' in json_data:
-                if 'logo_url' in json_data['widget']:
-                    print('[+] Global branding logo URL needs to be updated')
-
-                    url = self.global_branding_url
-                    branding_data = {
-                        'favicon_url': json_data['widget']['logo_url'],
-                        'logo_url': json_data['widget']['logo_url']
-                    }
-                    global_branding_response = self.create_request(
-                        url = url,
-                        headers=headers,
-                        json_data=branding_data,
-                        patch=True
-                    )
+        paths = [p for p in [self.branding_file] + self.branding_overlays + [self.prompts_file] if p]
 
-        else:
+        ##
+        ## partials count as part of the template
+        ##
+        if self.template_file:
+            paths.extend(self.template_sources or [self.template_file])
 
-            return None
+        return paths
 
-        return branding_json
 
+    def snapshot(self):
 
-    ##########################################################################
-    ##########################################################################
-    ##
-    ## delete branding
-    ##
-    ##########################################################################
-    ##########################################################################
+        stamps = {}
 
+        for path in self.paths():
+            try:
+                stat = os.stat(path)
+                stamps[path] = tuple([stat.st_mtime_ns, stat.st_size])
+            except OSError:
+                stamps[path] = None
 
-    def delete_branding(self, theme_id=None):
+        return stamps
 
-        url = None
 
-        headers = {'Authorization' : 'Bearer {}'.format(self.access_token)}
+    def load(self):
 
-        if theme_id is None:
+        ##
+        ## hashes of what is on disk right now ... a resource is pushed only
+        ## when its hash moves
+        ##
+        branding_json = resolve_branding([self.branding_file] + self.branding_overlays)
+        prompts_json = load_json(self.prompts_file) if self.prompts_file else None
+        html_template = None
 
-            try:
+        if self.template_file:
+            sources = []
+            html_template = build_template(self.template_file, minify=self.minify, sources=sources)
+            self.template_sources = sources
 
-                ##
-                ## no theme ID provided ... use default profile ID
-                ##
-                default_branding = self.get_default_branding()
-                default_brand_id = default_branding[1]
-                url = '{}/{}'.format(self.branding_themes_url, default_brand_id)
+        hashes = resource_hashes(branding_json, prompts_json, html_template)
 
-            except Exception as e:
-                ##
-                ## didn't find the default branding theme and don't have
-                ## a theme ID ... so create a new theme
-                ##
-                print('[-] Default branding theme not found: {}'.format(e))
-                return None
+        return tuple([branding_json, prompts_json, html_template, hashes])
 
-        else:
-            url = '{}/{}'.format(url, theme_id)
 
-        print('[+] Deleting branding profile: {}'.format(theme_id))
+    def write(self, key, func, *args, **kwargs):
 
-        if url is not None:
-            branding_response = self.create_request(url=url, headers=headers, delete=True)
-        else:
-            return None
+        ##
+        ## one resource at a time ... an API error, a network error or the
+        ## deadline fails this resource only and the watch keeps going
+        ##
+        try:
+            response = func(*args, **kwargs)
+        except Exception as e:
+            logger.warning('[-] Push of %s failed: %s', key, e)
+            return False
 
+        error = response.get('error') if key.startswith('prompts/') else response_error(response)
 
-        return branding_response
+        if error is not None:
+            logger.warning('[-] Push of %s failed: %s', key, error)
+            return False
 
+        return True
 
-    ##########################################################################
-    ##########################################################################
-    ##
-    ## create template
-    ##
-    ##########################################################################
-    ##########################################################################
 
+    def push(self):
 
-    def create_template(self, html_data=None):
+        try:
+            branding_json, prompts_json, html_template, hashes = self.load()
+        except (OSError, ValueError) as e:
+            ##
+            ## usually a half-written file ... the next save retries
+            ##
+            logger.warning('[-] Skipping push, cannot read inputs: %s', e)
+            return 0
+
+        start = time.time()
+        pushed = []
+        failed = []
+
+        changed = [k for k in hashes if hashes[k] != self.hashes.get(k)]
+
+        if not changed:
+            self.failed = []
+            logger.info('[+] No resource changed')
+            return 0
+
+        try:
+            headers = {'Authorization' : 'Bearer {}'.format(self.auth0_tenant.access_token)}
+        except Exception as e:
+            logger.warning('[-] Skipping push, cannot get an access token: %s', e)
+            self.failed = changed
+            return 0
+
+        if 'branding' in changed:
+            if self.write('branding', self.auth0_tenant.create_branding,
+                    json_data=branding_json, theme_id=self.theme_id, global_branding=False):
+                pushed.append('branding')
+            else:
+                failed.append('branding')
 
-        template_response = None
+            global_hash = content_hash(global_branding_data(branding_json))
 
-        if html_data is not None:
+            if global_hash != self.global_hash:
+                if self.write('global_branding', self.auth0_tenant.set_global_branding, json_data=branding_json):
+                    self.global_hash = global_hash
+                    pushed.append('global_branding')
+                elif 'branding' not in failed:
+                    ##
+                    ## the global logo only follows the branding hash
+                    ##
+                    failed.append('branding')
 
-            headers = {
-                'Authorization' : 'Bearer {}'.format(self.access_token),
-                'content-type':'text/html'
-            }
+        for k in changed:
+            if k.startswith('prompts/'):
+                prompt, language = k.split('/')[1:3]
 
-            template_response = self.delete_template()
+                if self.write(k, self.auth0_tenant.set_prompt, prompt, language, prompts_json[prompt][language], headers):
+                    pushed.append(k)
+                else:
+                    failed.append(k)
 
-            ##
-            ## create branding theme using HTTP POST
-            ##
-            template_response = self.create_request(
-                url = self.template_url,
-                headers=headers,
-                data=html_data,
-                put=True
-            )
+        if 'template' in changed:
+            if self.write('template', self.auth0_tenant.create_template, html_data=html_template, skip_unchanged=False):
+                pushed.append('template')
+            else:
+                failed.append('template')
 
-        else:
+        ##
+        ## only what was written moves forward ... failed resources stay
+        ## changed and are pushed again
+        ##
+        self.hashes = dict([(k, v) for k, v in hashes.items() if k not in failed])
+        self.failed = failed
 
-            return None
+        if pushed:
+            logger.info('[+] Pushed %s in %.0fms', ', '.join(pushed), (time.time() - start) * 1000)
 
-        return template_response
+        if failed:
+            logger.warning('[-] %s failed, retrying in %.0fs: %s', len(failed), WATCH_RETRY, ', '.join(failed))
 
+        return len(pushed)
 
-    ##########################################################################
-    ##########################################################################
-    ##
-    ## delete template
-    ##
-    ##########################################################################
-    ##########################################################################
 
+    def run(self, interval=WATCH_INTERVAL, debounce=WATCH_DEBOUNCE):
 
-    def delete_template(self):
+        ##
+        ## the first pass pushes everything so the tenant matches the files
+        ##
+        self.push()
 
-        headers = {'Authorization' : 'Bearer {}'.format(self.access_token)}
+        stamps = self.snapshot()
 
-        print('[+] Deleting current HTML Template')
-        template_response = self.create_request(url=self.template_url, headers=headers, delete=True)
+        logger.info('[+] Watching %s files ... Ctrl-C to stop', len(stamps))
 
-        return template_response
+        retry_at = time.time() + WATCH_RETRY
 
+        while True:
+            time.sleep(interval)
 
-###########################################################################
-###########################################################################
-##
-## lambda handler
-##
-###########################################################################
-###########################################################################
+            current = self.snapshot()
 
+            if current == stamps:
 
-def lambda_handler(event, context):
-    ##
-    ## Lambda handler
-    ##
-    with open(event['branding_json'], 'rb') as f:
-        branding_json = json.load(f)
+                if self.failed and time.time() >= retry_at:
+                    self.push()
+                    retry_at = time.time() + WATCH_RETRY
+
+                continue
 
-    with open(event['prompts_json'], 'rb') as f:
-        prompts_json = json.load(f)
+            ##
+            ## wait out a burst of saves before pushing once
+            ##
+            while True:
+                time.sleep(debounce)
+                settled = self.snapshot()
 
-    with open(event['html_template'], 'r+') as f:
-        html_template = f.read()
+                if settled == current:
+                    break
 
+                current = settled
 
-    client_id = None
-    client_secret = None
-    auth0_domain = None
+            self.push()
+            retry_at = time.time() + WATCH_RETRY
 
-    print('[+] Creating Auth0 management client')
-    auth0_tenant = Auth0( client_id=client_id, 
-                          client_secret=client_secret,
-                          auth0_domain=auth0_domain )
+            stamps = self.snapshot()
 
-    if event['delete_input']:
-        branding_data = auth0_tenant.delete_branding()
-        template_data = auth0_tenant.delete_template()
 
-    else:
-        branding_data = auth0_tenant.create_branding(json_data=branding_json)
-        prompts_data = auth0_tenant.set_prompts(json_data=prompts_json)
-        template_data = auth0_tenant.create_template(html_data=html_template)
+def watch(event):
 
-    return
+    configure_logging(verbose=event.get('verbose', False))
+
+    auth0_tenant = get_client(event)
+
+    try:
+        Watcher(auth0_tenant, event).run()
+    except KeyboardInterrupt:
+        logger.info('[+] Watch stopped')
+    finally:
+        auth0_tenant.close()
 
 
 ###########################################################################
@@ -712,9 +5964,43 @@ if __name__ == '__main__':
     args = a.parse()
 
     branding_json = args.branding_json[0] if args.branding_json else None
+    branding_overlays = args.branding_overlays if args.branding_overlays else None
     prompts_json = args.prompts_json[0] if args.prompts_json else None
     html_template = args.html_template[0] if args.html_template else None
     delete_input = args.delete if args.delete else False
+    pool_size = args.pool_size[0] if args.pool_size else DEFAULT_POOL_SIZE
+    concurrency = args.concurrency[0] if args.concurrency else DEFAULT_CONCURRENCY
+    token_cache = args.token_cache[0] if args.token_cache else None
+    theme_id = args.theme_id[0] if args.theme_id else None
+    theme_cache = args.theme_cache[0] if args.theme_cache else None
+    diff_input = args.diff if args.diff else False
+    plan_input = args.plan if args.plan else False
+    state_file = args.state_file[0] if args.state_file else None
+    force = args.force if args.force else False
+    delete_template_first = args.delete_template_first if args.delete_template_first else False
+    tenants_file = args.tenants_file[0] if args.tenants_file else None
+    workers = args.workers[0] if args.workers else DEFAULT_FLEET_WORKERS
+    worker_type = args.worker_type[0] if args.worker_type else 'thread'
+    rate_limit = args.rate_limit[0] if args.rate_limit else DEFAULT_RATE_LIMIT
+    max_retries = args.max_retries[0] if args.max_retries is not None else DEFAULT_MAX_RETRIES
+    verbose = args.verbose if args.verbose else False
+    metrics_json = args.metrics_json[0] if args.metrics_json else None
+    emf = args.emf if args.emf else False
+    parallel = args.parallel if args.parallel else False
+    minify = args.minify if args.minify else False
+    watch_input = args.watch if args.watch else False
+    export_dir = args.export_dir[0] if args.export_dir else None
+    catalogs = args.catalogs if args.catalogs else None
+    journal_dir = args.journal_dir[0] if args.journal_dir else None
+    deadline = args.deadline[0] if args.deadline else None
+    connect_timeout = args.connect_timeout[0] if args.connect_timeout else None
+    read_timeout = args.read_timeout[0] if args.read_timeout else None
+    rollback_input = args.rollback if args.rollback else False
+    rollback_to = args.rollback_to[0] if args.rollback_to else None
+    build = args.build[0] if args.build else None
+    bundle = args.bundle[0] if args.bundle else None
+    preflight = args.preflight if args.preflight else False
+    asset_ttl = args.asset_ttl[0] if args.asset_ttl is not None else None
 
 
     ##########################################################################
@@ -726,22 +6012,74 @@ if __name__ == '__main__':
     ##########################################################################
 
 
-    if branding_json is None:
+    if rollback_input is True and journal_dir is None:
+        print('[-] --rollback requires the journal directory via --journal argument')
+        a.print_help()
+        exit(1)
+
+    needs_inputs = bundle is None and export_dir is None and rollback_input is False \
+        and delete_input is False and catalogs is None
+
+    if branding_json is None and needs_inputs:
         print('[-] Requires a JSON file via --branding-json argument')
         a.print_help()
         exit(1)
 
-    if prompts_json is None:
+    if prompts_json is None and needs_inputs:
         print('[-] Requires a JSON file via --prompts-json argument')
         a.print_help()
         exit(1)
 
-    if html_template is None:
+    if html_template is None and needs_inputs:
         print('[-] Requires an HTML file via --html-template argument')
         a.print_help()
         exit(1)
 
 
+    ##########################################################################
+    ##########################################################################
+    ##
+    ## build a bundle ... no API calls
+    ##
+    ##########################################################################
+    ##########################################################################
+
+    if build is not None:
+
+        configure_logging(verbose=verbose)
+
+        try:
+            compiled = build_bundle(
+                branding_json=resolve_branding([branding_json] + (branding_overlays or [])),
+                prompts_json=load_json(prompts_json),
+                html_template=build_template(html_template, minify=minify)
+            )
+        except ValueError as e:
+            for line in str(e).splitlines():
+                logger.error('[-] %s', line)
+            exit(1)
+
+        if preflight is True:
+
+            errors = preflight_assets(
+                branding_json=compiled['branding'],
+                html_template=compiled['template'],
+                ttl=asset_ttl
+            )
+
+            if errors:
+                for e in errors:
+                    logger.error('[-] Pre-flight: %s', e)
+                exit(1)
+
+        bundle_file = write_bundle(compiled, build)
+
+        logger.info('[+] Wrote bundle %s (%s resources) to %s',
+            compiled['id'], len(compiled['hashes']), bundle_file)
+
+        exit(0)
+
+
     ##########################################################################
     ##########################################################################
     ##
@@ -753,9 +6091,66 @@ if __name__ == '__main__':
     context = None
     event = {
         'branding_json' : branding_json,
+        'branding_overlays' : branding_overlays,
         'prompts_json' : prompts_json,
         'html_template' : html_template,
-        'delete_input' : delete_input
+        'bundle' : bundle,
+        'minify' : minify,
+        'preflight' : preflight,
+        'asset_ttl' : asset_ttl,
+        'export_dir' : export_dir,
+        'catalogs' : catalogs,
+        'journal_dir' : journal_dir,
+        'deadline' : deadline,
+        'connect_timeout' : connect_timeout,
+        'read_timeout' : read_timeout,
+        'rollback' : rollback_input,
+        'rollback_to' : rollback_to,
+        'delete_input' : delete_input,
+        'pool_size' : pool_size,
+        'concurrency' : concurrency,
+        'token_cache' : token_cache,
+        'theme_id' : theme_id,
+        'theme_cache' : theme_cache,
+        'diff_input' : diff_input,
+        'plan_input' : plan_input,
+        'state_file' : state_file,
+        'force' : force,
+        'delete_template_first' : delete_template_first,
+        'tenants_file' : tenants_file,
+        'workers' : workers,
+        'worker_type' : worker_type,
+        'rate_limit' : rate_limit,
+        'max_retries' : max_retries,
+        'verbose' : verbose,
+        'emf' : emf,
+        'parallel' : parallel
     }
 
-    lambda_handler(event, context)
+    if watch_input is True:
+
+        if bundle is not None or tenants_file is not None:
+            print('[-] --watch works on --branding-json, --prompts-json and --html-template files of one tenant')
+            exit(1)
+
+        watch(event)
+        exit(0)
+
+    result = lambda_handler(event, context)
+
+    if metrics_json is not None:
+
+        if 'tenants' in result:
+            metrics = dict([(r['tenant'], (r['result'] or {}).get('metrics')) for r in result['tenants']])
+        else:
+            metrics = result.get('metrics')
+
+        with open(metrics_json, 'w') as f:
+            json.dump(metrics, f, indent=4)
+
+    ##
+    ## a failed pre-flight, deadline or resource write fails the run, so CI
+    ## stops here rather than carrying on
+    ##
+    if result.get('failed') or result.get('deadline_exceeded'):
+        exit(1)
@@ -0,0 +1,801 @@
+#!/usr/bin/env python3
+
+'''
+
+    Local stand-in for the parts of the Auth0 Management API used by
+    branding.py, with configurable latency, rate limits and failure
+    injection ... used by benchmark.py and for testing without a tenant
+
+'''
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+
+###############################################################################
+###############################################################################
+##
+## Arguments - allows user to call from command line
+##
+###############################################################################
+###############################################################################
+
+
+class Args(object):
+
+    parser = argparse.ArgumentParser(description='Mock Auth0 Management API')
+
+    parser.add_argument(
+        '--port',
+        dest='port',
+        nargs=1,
+        type=int,
+        help='Port to listen on (default: 8080)'
+    )
+
+    parser.add_argument(
+        '--latency-ms',
+        dest='latency_ms',
+        nargs=1,
+        type=float,
+        help='Latency added to every response in milliseconds (default: 0)'
+    )
+
+    parser.add_argument(
+        '--jitter-ms',
+        dest='jitter_ms',
+        nargs=1,
+        type=float,
+        help='Random latency added on top of --latency-ms in milliseconds (default: 0)'
+    )
+
+    parser.add_argument(
+        '--rate-limit',
+        dest='rate_limit',
+        nargs=1,
+        type=float,
+        help='Requests per second before answering HTTP 429 (default: unlimited)'
+    )
+
+    parser.add_argument(
+        '--failure-rate',
+        dest='failure_rate',
+        nargs=1,
+        type=float,
+        help='Fraction of API requests answered with HTTP 503 (default: 0)'
+    )
+
+    def parse(self):
+        args = self.parser.parse_args()
+        return args
+
+
+###############################################################################
+###############################################################################
+##
+## Mock tenant state
+##
+###############################################################################
+###############################################################################
+
+
+class MockTenant(object):
+
+    def __init__(self):
+
+        self.lock = threading.Lock()
+        self.themes = {}
+        self.default_theme_id = None
+        self.global_branding = {}
+        self.custom_text = {}
+        self.template = None
+        self.enabled_locales = ['en']
+
+
+###############################################################################
+###############################################################################
+##
+## Mock API server
+##
+##  POST   /oauth/token
+##  GET    /api/v2/branding
+##  PATCH  /api/v2/branding
+##  GET    /api/v2/branding/themes
+##  POST   /api/v2/branding/themes
+##  GET    /api/v2/branding/themes/default
+##  GET    /api/v2/branding/themes/{id}
+##  PATCH  /api/v2/branding/themes/{id}
+##  DELETE /api/v2/branding/themes/{id}
+##  GET    /api/v2/prompts/{prompt}/custom-text/{language}
+##  PUT    /api/v2/prompts/{prompt}/custom-text/{language}
+##  GET    /api/v2/branding/templates/universal-login
+##  PUT    /api/v2/branding/templates/universal-login
+##  DELETE /api/v2/branding/templates/universal-login
+##  GET    /api/v2/tenants/settings
+##
+##  GET    /assets/{name}           static asset stand-in (also HEAD)
+##
+##  every successful GET returns an ETag and answers a matching
+##  If-None-Match with 304 Not Modified
+##
+###############################################################################
+###############################################################################
+
+
+ASSET_BYTES = 2048
+ASSET_LARGE = 8 * 1024 * 1024
+
+ASSET_TYPES = {
+    'png' : 'image/png',
+    'jpg' : 'image/jpeg',
+    'svg' : 'image/svg+xml',
+    'css' : 'text/css',
+    'woff2' : 'font/woff2',
+    'html' : 'text/html'
+}
+
+
+class MockServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def __init__( self,
+                  host='127.0.0.1',
+                  port=0,
+                  latency_ms=0,
+                  jitter_ms=0,
+                  rate_limit=None,
+                  failure_rate=0,
+                  failure_paths=None,
+                  token_lifetime=86400,
+                  chunked=False ):
+
+        ThreadingHTTPServer.__init__(self, (host, port), MockHandler)
+
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_limit = rate_limit
+        self.failure_rate = failure_rate
+        self.failure_paths = failure_paths
+        self.chunked = chunked
+        self.token_lifetime = token_lifetime
+
+        self.tenant = MockTenant()
+        self.tokens = set()
+
+        ##
+        ## fixed one-second rate limit window, like X-RateLimit-Reset
+        ##
+        self.window_start = int(time.time())
+        self.window_count = 0
+
+        self.lock = threading.Lock()
+        self.requests = []
+        self.connections = 0
+        self.thread = None
+
+        ##
+        ## statuses answered, in order, to the next API requests ... for
+        ## deterministic 429 / 5xx retries
+        ##
+        self.fail_next = []
+
+        ##
+        ## /assets/{name} ... the extension picks the content type, names
+        ## starting with "missing" are 404 and "large" are ASSET_LARGE bytes
+        ##
+        self.asset_bytes = ASSET_BYTES
+
+
+    @property
+    def base_url(self):
+        return 'http://{}:{}'.format(self.server_address[0], self.server_address[1])
+
+
+    @property
+    def mgmt_endpoint(self):
+        return '{}/api/v2'.format(self.base_url)
+
+
+    def start(self):
+
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+        return self
+
+
+    def stop(self):
+
+        self.shutdown()
+        self.server_close()
+
+        return
+
+
+    def __enter__(self):
+        return self.start()
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+
+    def record(self, method, path, status):
+
+        with self.lock:
+            self.requests.append(tuple([method, path, status]))
+
+
+    def reset_stats(self):
+
+        with self.lock:
+            self.requests = []
+
+
+    def rate_limit_headers(self):
+
+        ##
+        ## returns (allowed, headers) for the current one-second window
+        ##
+        if not self.rate_limit:
+            return tuple([True, {}])
+
+        limit = int(self.rate_limit)
+
+        with self.lock:
+            now = int(time.time())
+
+            if now != self.window_start:
+                self.window_start = now
+                self.window_count = 0
+
+            self.window_count += 1
+            remaining = max(0, limit - self.window_count)
+            allowed = self.window_count <= limit
+
+        headers = {
+            'X-RateLimit-Limit' : str(limit),
+            'X-RateLimit-Remaining' : str(remaining),
+            'X-RateLimit-Reset' : str(self.window_start + 1)
+        }
+
+        if not allowed:
+            headers['Retry-After'] = '1'
+
+        return tuple([allowed, headers])
+
+
+    def scripted_failure(self):
+
+        with self.lock:
+            return self.fail_next.pop(0) if self.fail_next else None
+
+
+    def should_fail(self, path):
+
+        if self.failure_paths is not None:
+            if not any(re.search(p, path) for p in self.failure_paths):
+                return False
+
+        return self.failure_rate > 0 and random.random() < self.failure_rate
+
+
+###############################################################################
+###############################################################################
+##
+## Mock API request handler
+##
+###############################################################################
+###############################################################################
+
+
+class MockHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    ##
+    ## buffer writes so headers and body go out in one segment, and skip
+    ## Nagle ... otherwise delayed ACKs add ~40ms to every keep-alive call
+    ##
+    wbufsize = 65536
+    disable_nagle_algorithm = True
+
+    routes = [
+        ('POST', r'^/oauth/token$', 'post_token'),
+        ('GET', r'^/api/v2/branding$', 'get_branding'),
+        ('PATCH', r'^/api/v2/branding$', 'patch_branding'),
+        ('GET', r'^/api/v2/branding/themes$', 'list_themes'),
+        ('POST', r'^/api/v2/branding/themes$', 'post_theme'),
+        ('GET', r'^/api/v2/branding/themes/default$', 'get_default_theme'),
+        ('GET', r'^/api/v2/branding/themes/(?P<theme_id>[^/]+)$', 'get_theme'),
+        ('PATCH', r'^/api/v2/branding/themes/(?P<theme_id>[^/]+)$', 'patch_theme'),
+        ('DELETE', r'^/api/v2/branding/themes/(?P<theme_id>[^/]+)$', 'delete_theme'),
+        ('GET', r'^/api/v2/prompts/(?P<prompt>[^/]+)/custom-text/(?P<language>[^/]+)$', 'get_custom_text'),
+        ('PUT', r'^/api/v2/prompts/(?P<prompt>[^/]+)/custom-text/(?P<language>[^/]+)$', 'put_custom_text'),
+        ('GET', r'^/api/v2/branding/templates/universal-login$', 'get_template'),
+        ('PUT', r'^/api/v2/branding/templates/universal-login$', 'put_template'),
+        ('DELETE', r'^/api/v2/branding/templates/universal-login$', 'delete_template'),
+        ('GET', r'^/api/v2/tenants/settings$', 'get_tenant_settings'),
+    ]
+
+
+    def log_message(self, format, *args):
+        return
+
+
+    def setup(self):
+
+        ##
+        ## one handler per connection ... counts how often clients reconnect
+        ##
+        BaseHTTPRequestHandler.setup(self)
+
+        with self.server.lock:
+            self.server.connections += 1
+
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_HEAD(self):
+        self.dispatch('HEAD')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def do_PUT(self):
+        self.dispatch('PUT')
+
+    def do_PATCH(self):
+        self.dispatch('PATCH')
+
+    def do_DELETE(self):
+        self.dispatch('DELETE')
+
+
+    ##########################################################################
+    ##########################################################################
+    ##
+    ## dispatch
+    ##
+    ##########################################################################
+    ##########################################################################
+
+
+    def dispatch(self, method):
+
+        server = self.server
+        path = urlparse(self.path).path
+
+        length = int(self.headers.get('content-length') or 0)
+        self.body = self.rfile.read(length) if length else b''
+
+        ##
+        ## assets live on a CDN, outside the API's auth and rate limits
+        ##
+        if path.startswith('/assets/') and method in ['GET', 'HEAD']:
+            return self.asset(method, path)
+
+        latency = server.latency_ms + random.uniform(0, server.jitter_ms)
+        if latency > 0:
+            time.sleep(latency / 1000.0)
+
+        allowed, headers = server.rate_limit_headers()
+
+        if not allowed:
+            return self.respond(method, path, 429, {
+                'statusCode' : 429,
+                'error' : 'Too Many Requests',
+                'message' : 'Global limit has been reached'
+            }, headers=headers)
+
+        failure = server.scripted_failure() if path != '/oauth/token' else None
+
+        if failure is not None:
+            if failure == 429:
+                headers = dict(headers, **{'Retry-After' : '0'})
+
+            return self.respond(method, path, failure, {
+                'statusCode' : failure,
+                'error' : 'Scripted failure',
+                'message' : 'Scripted failure'
+            }, headers=headers)
+
+        if path != '/oauth/token' and server.should_fail(path):
+            return self.respond(method, path, 503, {
+                'statusCode' : 503,
+                'error' : 'Service Unavailable',
+                'message' : 'Injected failure'
+            }, headers=headers)
+
+        for route_method, pattern, handler_name in self.routes:
+            match = re.match(pattern, path)
+
+            if match is not None and route_method == method:
+
+                if path != '/oauth/token' and not self.authorized():
+                    return self.respond(method, path, 401, {
+                        'statusCode' : 401,
+                        'error' : 'Unauthorized',
+                        'message' : 'Invalid token'
+                    }, headers=headers)
+
+                with server.tenant.lock:
+                    status, body = getattr(self, handler_name)(**match.groupdict())
+
+                return self.respond(method, path, status, body, headers=headers)
+
+        return self.respond(method, path, 404, {
+            'statusCode' : 404,
+            'error' : 'Not Found',
+            'message' : 'Not Found'
+        }, headers=headers)
+
+
+    def authorized(self):
+
+        auth = self.headers.get('Authorization', '')
+
+        return auth.startswith('Bearer ') and auth[len('Bearer '):] in self.server.tokens
+
+
+    def json_body(self):
+
+        try:
+            return json.loads(self.body.decode('utf-8'))
+        except ValueError:
+            return None
+
+
+    def respond(self, method, path, status, body, headers=None):
+
+        if body is None:
+            payload = b''
+        elif isinstance(body, (dict, list)):
+            payload = json.dumps(body).encode('utf-8')
+        else:
+            payload = body.encode('utf-8')
+
+        ##
+        ## GETs carry an ETag and honour If-None-Match with a bodiless 304
+        ##
+        etag = None
+
+        if method == 'GET' and status == 200:
+            etag = '"{}"'.format(hashlib.sha256(payload).hexdigest()[:32])
+
+            if self.headers.get('If-None-Match') == etag:
+                status = 304
+                payload = b''
+
+        self.server.record(method, path, status)
+
+        self.send_response(status)
+
+        if etag is not None:
+            self.send_header('ETag', etag)
+
+        if payload:
+            self.send_header('content-type', 'application/json; charset=utf-8')
+
+        ##
+        ## chunked bodies are sent in two chunks to exercise the reassembly
+        ##
+        chunked = self.server.chunked and payload and method != 'HEAD'
+
+        if chunked:
+            self.send_header('transfer-encoding', 'chunked')
+        else:
+            self.send_header('content-length', str(len(payload)))
+
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+
+        self.end_headers()
+
+        if chunked:
+            half = len(payload) // 2
+            for chunk in [payload[:half], payload[half:], b'']:
+                self.wfile.write('{:x}\r\n'.format(len(chunk)).encode('ascii') + chunk + b'\r\n')
+        else:
+            self.wfile.write(payload)
+
+        return
+
+
+    def asset(self, method, path):
+
+        server = self.server
+        name = path[len('/assets/'):]
+        extension = name.rsplit('.', 1)[-1].lower()
+
+        if server.latency_ms > 0:
+            time.sleep(server.latency_ms / 1000.0)
+
+        missing = name.startswith('missing') or extension not in ASSET_TYPES
+        server.record(method, path, 404 if missing else 200)
+
+        if missing:
+            self.send_response(404)
+            self.send_header('content-length', '0')
+            self.end_headers()
+            return
+
+        size = ASSET_LARGE if name.startswith('large') else server.asset_bytes
+
+        self.send_response(200)
+        self.send_header('content-type', ASSET_TYPES[extension])
+        self.send_header('content-length', str(size))
+        self.end_headers()
+
+        if method == 'GET':
+            self.wfile.write(b'\0' * size)
+
+        return
+
+
+    def not_found(self):
+        return tuple([404, {'statusCode' : 404, 'error' : 'Not Found', 'message' : 'Not Found'}])
+
+
+    ##########################################################################
+    ##########################################################################
+    ##
+    ## token
+    ##
+    ##########################################################################
+    ##########################################################################
+
+
+    def post_token(self):
+
+        data = self.json_body() or {}
+
+        if not data.get('client_id') or not data.get('client_secret'):
+            return tuple([401, {'error' : 'access_denied', 'error_description' : 'Unauthorized'}])
+
+        access_token = uuid.uuid4().hex
+        self.server.tokens.add(access_token)
+
+        return tuple([200, {
+            'access_token' : access_token,
+            'token_type' : 'Bearer',
+            'expires_in' : self.server.token_lifetime
+        }])
+
+
+    ##########################################################################
+    ##########################################################################
+    ##
+    ## global branding
+    ##
+    ##########################################################################
+    ##########################################################################
+
+
+    def get_branding(self):
+        return tuple([200, dict(self.server.tenant.global_branding)])
+
+
+    def patch_branding(self):
+
+        ##
+        ## like the API, a null clears the field
+        ##
+        def merge(current, patch):
+            for k, v in patch.items():
+                if v is None:
+                    current.pop(k, None)
+                elif isinstance(v, dict) and isinstance(current.get(k), dict):
+                    merge(current[k], v)
+                else:
+                    current[k] = v
+
+        merge(self.server.tenant.global_branding, self.json_body() or {})
+
+        return tuple([200, dict(self.server.tenant.global_branding)])
+
+
+    ##########################################################################
+    ##########################################################################
+    ##
+    ## branding themes
+    ##
+    ##########################################################################
+    ##########################################################################
+
+
+    def list_themes(self):
+        return tuple([200, list(self.server.tenant.themes.values())])
+
+
+    def post_theme(self):
+
+        tenant = self.server.tenant
+
+        if tenant.themes:
+            return tuple([409, {
+                'statusCode' : 409,
+                'error' : 'Conflict',
+                'message' : 'There is already a branding theme configured'
+            }])
+
+        theme = dict(self.json_body() or {})
+        theme['themeId'] = uuid.uuid4().hex
+
+        tenant.themes[theme['themeId']] = theme
+        tenant.default_theme_id = theme['themeId']
+
+        return tuple([200, theme])
+
+
+    def get_default_theme(self):
+
+        tenant = self.server.tenant
+
+        if tenant.default_theme_id is None:
+            return self.not_found()
+
+        return tuple([200, tenant.themes[tenant.default_theme_id]])
+
+
+    def get_theme(self, theme_id=None):
+
+        if theme_id not in self.server.tenant.themes:
+            return self.not_found()
+
+        return tuple([200, self.server.tenant.themes[theme_id]])
+
+
+    def patch_theme(self, theme_id=None):
+
+        tenant = self.server.tenant
+
+        if theme_id not in tenant.themes:
+            return self.not_found()
+
+        tenant.themes[theme_id].update(self.json_body() or {})
+
+        return tuple([200, tenant.themes[theme_id]])
+
+
+    def delete_theme(self, theme_id=None):
+
+        tenant = self.server.tenant
+
+        if theme_id not in tenant.themes:
+            return self.not_found()
+
+        del tenant.themes[theme_id]
+
+        if tenant.default_theme_id == theme_id:
+            tenant.default_theme_id = None
+
+        return tuple([204, None])
+
+
+    ##########################################################################
+    ##########################################################################
+    ##
+    ## prompts custom text
+    ##
+    ##########################################################################
+    ##########################################################################
+
+
+    def get_custom_text(self, prompt=None, language=None):
+        return tuple([200, self.server.tenant.custom_text.get(tuple([prompt, language]), {})])
+
+
+    def put_custom_text(self, prompt=None, language=None):
+
+        data = self.json_body()
+
+        if not isinstance(data, dict):
+            return tuple([400, {
+                'statusCode' : 400,
+                'error' : 'Bad Request',
+                'message' : 'Payload validation error'
+            }])
+
+        self.server.tenant.custom_text[tuple([prompt, language])] = data
+
+        return tuple([200, data])
+
+
+    ##########################################################################
+    ##########################################################################
+    ##
+    ## universal login template
+    ##
+    ##########################################################################
+    ##########################################################################
+
+
+    def get_template(self):
+
+        if self.server.tenant.template is None:
+            return self.not_found()
+
+        return tuple([200, {'body' : self.server.tenant.template}])
+
+
+    def put_template(self):
+
+        if self.headers.get('content-type', '').startswith('application/json'):
+            template = (self.json_body() or {}).get('template')
+        else:
+            template = self.body.decode('utf-8')
+
+        if not template:
+            return tuple([400, {
+                'statusCode' : 400,
+                'error' : 'Bad Request',
+                'message' : 'Payload validation error'
+            }])
+
+        self.server.tenant.template = template
+
+        return tuple([201, None])
+
+
+    def delete_template(self):
+
+        self.server.tenant.template = None
+
+        return tuple([204, None])
+
+
+    ##########################################################################
+    ##########################################################################
+    ##
+    ## tenant settings
+    ##
+    ##########################################################################
+    ##########################################################################
+
+
+    def get_tenant_settings(self):
+        return tuple([200, {'enabled_locales' : list(self.server.tenant.enabled_locales)}])
+
+
+###########################################################################
+###########################################################################
+##
+## MAIN
+##
+###########################################################################
+###########################################################################
+
+if __name__ == '__main__':
+
+    a = Args()
+    args = a.parse()
+
+    server = MockServer(
+        port=args.port[0] if args.port else 8080,
+        latency_ms=args.latency_ms[0] if args.latency_ms else 0,
+        jitter_ms=args.jitter_ms[0] if args.jitter_ms else 0,
+        rate_limit=args.rate_limit[0] if args.rate_limit else None,
+        failure_rate=args.failure_rate[0] if args.failure_rate else 0
+    )
+
+    print('[+] Mock Auth0 Management API: {}'.format(server.mgmt_endpoint))
+    print('[+] export AUTH0_MGMT_API_ENDPOINT={}'.format(server.mgmt_endpoint))
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+    server.server_close()
@@ -0,0 +1,125 @@
+'''
+
+    Tests for branding overlays, input validation and deployment bundles in
+    branding.py
+
+'''
+
+import json
+
+import pytest
+
+import branding
+
+
+REV1 = 'examples/branding/default_rev1.json'
+OVERLAYS = 'examples/branding/overlays/'
+
+
+def test_deep_merge():
+
+    base = {'colors' : {'primary' : '#000', 'page_background' : '#fff'}, 'widget' : {'logo_url' : 'a'}, 'keep' : 1}
+    overlay = {'colors' : {'primary' : '#111', 'page_background' : None}, 'widget' : 'flat', 'added' : [1]}
+
+    merged = branding.deep_merge(base, overlay)
+
+    assert merged == {'colors' : {'primary' : '#111'}, 'widget' : 'flat', 'keep' : 1, 'added' : [1]}
+    assert base == {'colors' : {'primary' : '#000', 'page_background' : '#fff'}, 'widget' : {'logo_url' : 'a'}, 'keep' : 1}
+
+
+def test_overlays_rebuild_the_example_revisions():
+
+    rev2 = branding.resolve_branding([REV1, OVERLAYS + 'rev2.json'])
+    rev3 = branding.resolve_branding([REV1, OVERLAYS + 'rev2.json', OVERLAYS + 'rev3.json'])
+
+    assert rev2 == branding.load_json('examples/branding/default_rev2.json')
+    assert rev3 == branding.load_json('examples/branding/default_rev3.json')
+
+
+def test_shared_layers_are_merged_once():
+
+    first = branding.resolve_branding([REV1, OVERLAYS + 'rev2.json'])
+
+    assert branding.resolve_branding([REV1, OVERLAYS + 'rev2.json']) is first
+    assert branding.resolve_branding([REV1]) is branding.load_layer(REV1)[1]
+
+
+def test_example_inputs_are_valid():
+
+    for path in ['examples/branding/default_rev1.json', 'examples/branding/default_rev3.json',
+            'examples/branding/default_BLANK.json']:
+        assert branding.validate_branding(branding.load_json(path)) == []
+
+    assert branding.validate_prompts(branding.load_json('examples/prompts/prompts.json')) == []
+
+
+def test_invalid_branding_is_reported_by_path():
+
+    errors = branding.validate_branding({
+        'colors' : {'primary_button' : 'red'},
+        'borders' : {'buttons_style' : 'square', 'button_border_weight' : True},
+        'unknown' : 1
+    })
+
+    assert sorted(errors) == sorted([
+        "branding.colors.primary_button: expected a hex color like #1e212a, got 'red'",
+        "branding.borders.buttons_style: expected one of ['sharp', 'rounded', 'pill'], got 'square'",
+        'branding.borders.button_border_weight: expected an int, got True',
+        'branding.unknown: unknown option'
+    ])
+
+
+def test_invalid_prompts_and_template_are_reported():
+
+    assert branding.validate_prompts({'login' : {'en' : {'login' : {'title' : 1}}}}) == \
+        ['prompts.login.en.login.title: expected a string, got 1']
+
+    assert branding.validate_template('<div style="width:100%}">{%- auth0:head -%}{{ x</div>') == [
+        'template: missing required {%- auth0:widget -%} tag',
+        'template: unbalanced {{ }} Liquid output tags'
+    ]
+
+
+def test_bundle_round_trip(tmp_path):
+
+    bundle = branding.build_bundle(
+        branding_json=branding.load_json(REV1),
+        prompts_json=branding.load_json('examples/prompts/prompts.json'),
+        html_template=branding.build_template('examples/templates/default_combined.liquid')
+    )
+
+    path = branding.write_bundle(bundle, str(tmp_path))
+
+    assert path.endswith('bundle-{}.json'.format(bundle['id'][:16]))
+    assert branding.load_bundle(path) == bundle
+
+    ##
+    ## same inputs, same ID
+    ##
+    assert branding.build_bundle(bundle['branding'], bundle['prompts'], bundle['template'])['id'] == bundle['id']
+
+
+def test_invalid_inputs_are_never_bundled():
+
+    with pytest.raises(ValueError, match='missing required'):
+        branding.build_bundle(html_template='<html></html>')
+
+
+def test_tampered_bundle_is_rejected(tmp_path):
+
+    ##
+    ## a copy ... load_json hands back the cached object
+    ##
+    bundle = json.loads(json.dumps(branding.build_bundle(branding_json=branding.load_json(REV1))))
+    bundle['branding']['colors']['primary_button'] = '#000000'
+
+    path = tmp_path / 'bundle.json'
+    path.write_text(json.dumps(bundle))
+
+    with pytest.raises(ValueError, match='does not match its hashes'):
+        branding.load_bundle(str(path))
+
+    path.write_text(json.dumps({'format' : 0}))
+
+    with pytest.raises(ValueError, match='not a version'):
+        branding.load_bundle(str(path))
@@ -0,0 +1,131 @@
+'''
+
+    Tests for the token, theme and state caches in branding.py ... each
+    merges its entries into the shared file under file_lock, so threads,
+    fleet workers and concurrent runs never drop each other's entries
+
+'''
+
+import json
+import multiprocessing
+import os
+import threading
+
+import pytest
+
+import branding
+
+
+def test_token_cache_honours_the_expiry_margin(tmp_path):
+
+    cache_file = str(tmp_path / 'tokens.json')
+    cache = branding.TokenCache(cache_file=cache_file, margin=60)
+
+    cache.put(('t', 'a'), 'fresh', expires_in=3600)
+    cache.put(('t', 'b'), 'expiring', expires_in=30)
+    cache.put(('t', 'c'), 'no lifetime')
+
+    assert cache.get(('t', 'a')) == 'fresh'
+    assert cache.get(('t', 'b')) is None
+    assert cache.get(('t', 'c')) is None
+
+    ##
+    ## a new process picks the token up from the file, which only its owner
+    ## can read
+    ##
+    assert branding.TokenCache(cache_file=cache_file).get(('t', 'a')) == 'fresh'
+    assert os.stat(cache_file).st_mode & 0o777 == 0o600
+
+
+def test_token_cache_merges_instead_of_overwriting(tmp_path):
+
+    cache_file = str(tmp_path / 'tokens.json')
+
+    first = branding.TokenCache(cache_file=cache_file)
+    second = branding.TokenCache(cache_file=cache_file)
+
+    first.put(('t', 'a'), 'a', expires_in=3600)
+    second.put(('t', 'b'), 'b', expires_in=3600)
+    second.invalidate(('t', 'a'))
+
+    with open(cache_file, 'r') as f:
+        assert sorted(json.load(f)) == ['t|b']
+
+
+def test_theme_cache_survives_invalidation_by_another_instance(tmp_path):
+
+    cache_file = str(tmp_path / 'themes.json')
+
+    first = branding.ThemeCache(cache_file=cache_file)
+    second = branding.ThemeCache(cache_file=cache_file)
+
+    first.put('a', 'theme-a')
+    second.put('b', 'theme-b')
+    first.invalidate('b')
+
+    assert branding.ThemeCache(cache_file=cache_file).themes == {'a' : 'theme-a'}
+
+
+def put_themes(cache_file, worker):
+
+    cache = branding.ThemeCache(cache_file=cache_file)
+
+    for i in range(10):
+        cache.put('tenant-{}-{}'.format(worker, i), 'theme-{}'.format(i))
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork')
+def test_file_lock_serializes_processes_and_threads(tmp_path):
+
+    cache_file = str(tmp_path / 'themes.json')
+
+    context = multiprocessing.get_context('fork')
+    processes = [context.Process(target=put_themes, args=(cache_file, 'p{}'.format(i))) for i in range(4)]
+    threads = [threading.Thread(target=put_themes, args=(cache_file, 't{}'.format(i))) for i in range(4)]
+
+    for worker in processes + threads:
+        worker.start()
+
+    for worker in processes + threads:
+        worker.join()
+
+    assert all(p.exitcode == 0 for p in processes)
+    assert len(branding.ThemeCache(cache_file=cache_file).themes) == 80
+
+
+def test_state_manifest_keeps_other_tenants(tmp_path):
+
+    state_file = str(tmp_path / 'state.json')
+    prompts_json = {'login' : {'en' : {'login' : {'title' : 'Welcome'}}}}
+
+    branding.StateManifest(state_file=state_file).record(tenant='a', prompts_json=prompts_json)
+    branding.StateManifest(state_file=state_file).record(tenant='b', html_template='<html></html>')
+
+    manifest = branding.StateManifest(state_file=state_file)
+
+    assert sorted(manifest.state) == ['a', 'b']
+
+    ##
+    ## unchanged resources are filtered out, changed ones are kept
+    ##
+    changed = {'login' : {'en' : {'login' : {'title' : 'Hello'}}, 'fr' : {'login' : {'title' : 'Bonjour'}}}}
+
+    branding_json, prompts, template, skipped = manifest.filter(tenant='a', prompts_json=prompts_json)
+
+    assert tuple([prompts, skipped]) == tuple([{}, 1])
+
+    branding_json, prompts, template, skipped = manifest.filter(tenant='a', prompts_json=changed)
+
+    assert tuple([prompts, skipped]) == tuple([changed, 0])
+
+
+def test_state_manifest_drops_failed_resources(tmp_path):
+
+    state_file = str(tmp_path / 'state.json')
+    prompts_json = {'login' : {'en' : {}, 'fr' : {}}}
+
+    manifest = branding.StateManifest(state_file=state_file)
+    manifest.record(tenant='a', prompts_json=prompts_json)
+    manifest.record(tenant='a', prompts_json=prompts_json, failed=['prompts/login/fr'])
+
+    assert list(branding.StateManifest(state_file=state_file).state['a']) == ['prompts/login/en']
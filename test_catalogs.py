@@ -0,0 +1,135 @@
+'''
+
+    Tests for translation catalogs in branding.py ... records are checked as
+    they stream, the first bad one stops the stream and what was already
+    sent is journaled and reported
+
+'''
+
+import pytest
+
+import branding
+from mock_api import MockServer
+
+
+@pytest.fixture
+def server():
+    with MockServer() as server:
+        yield server
+
+
+def event(server, catalogs, **kwargs):
+
+    return dict({
+        'catalogs' : catalogs,
+        'rate_limit' : 1000,
+        'client_id' : 'test',
+        'client_secret' : 'test',
+        'auth0_domain' : 'localhost',
+        'mgmt_endpoint' : server.mgmt_endpoint
+    }, **kwargs)
+
+
+def write_catalog(tmp_path, name, rows):
+
+    path = tmp_path / name
+    path.write_text('prompt,screen,key,value\n' + ''.join(['{}\n'.format(r) for r in rows]), encoding='utf-8')
+
+    return str(path)
+
+
+def prompt_writes(server):
+    return [r for r in server.requests if r[0] == 'PUT' and '/custom-text/' in r[1]]
+
+
+def test_payloads_are_yielded_before_a_later_bad_record(tmp_path):
+
+    path = write_catalog(tmp_path, 'fr.csv', [
+        'login,login,title,Connexion',
+        'login,login,description,Bienvenue',
+        'signup,signup,title,Inscription',
+        'login,login,buttonText,Continuer'
+    ])
+
+    errors = []
+    keys = []
+    payloads = branding.catalog_payloads([path], errors=errors, keys=keys)
+
+    assert next(payloads) == tuple(['login', 'fr', {'login' : {'title' : 'Connexion', 'description' : 'Bienvenue'}}])
+    assert errors == []
+
+    ##
+    ## the split login rows end the stream, the signup payload they cut
+    ## short is never yielded
+    ##
+    assert list(payloads) == []
+    assert keys == ['prompts/login/fr']
+    assert errors == ['{}: rows for login / fr are not contiguous'.format(path)]
+
+
+def test_duplicate_across_files_stops_the_stream(tmp_path):
+
+    first = write_catalog(tmp_path, 'fr.csv', ['login,login,title,Connexion'])
+    second = write_catalog(tmp_path, 'login.fr.csv', ['login,login,title,Se connecter'])
+
+    errors = []
+    payloads = list(branding.catalog_payloads([first, second], errors=errors))
+
+    assert [p[:2] for p in payloads] == [tuple(['login', 'fr'])]
+    assert errors == ['{}: rows for login / fr are also in {}'.format(second, first)]
+
+
+def test_missing_language_and_unreadable_catalogs_are_errors(tmp_path):
+
+    errors = []
+    assert list(branding.catalog_payloads([write_catalog(tmp_path, 'messages.csv', ['login,login,title,x'])], errors=errors)) == []
+    assert 'no language for login' in errors[0]
+
+    errors = []
+    assert list(branding.catalog_payloads([str(tmp_path / 'missing.csv')], errors=errors)) == []
+    assert 'cannot read catalog' in errors[0]
+
+
+def test_deploy_reports_what_was_sent_before_a_bad_record(server, tmp_path):
+
+    good = write_catalog(tmp_path, 'fr.csv', [
+        'login,login,title,Connexion',
+        'signup,signup,title,Inscription'
+    ])
+    bad = write_catalog(tmp_path, 'de.csv', [
+        'login,login,title,Anmelden',
+        'signup,signup,title,Registrieren',
+        'login,login,description,Willkommen'
+    ])
+
+    result = branding.lambda_handler(event(server, [good, bad], journal_dir=str(tmp_path / 'journal')), None)
+
+    assert result['patched'] == 3
+    assert result['failed'] == ['catalogs']
+    assert result['catalogs'] == ['{}: rows for login / de are not contiguous'.format(bad)]
+    assert len(prompt_writes(server)) == 3
+
+    ##
+    ## only the prompts that were written are journaled
+    ##
+    entry = branding.Journal(str(tmp_path / 'journal')).load(tenant=server.mgmt_endpoint)
+
+    assert sorted(entry['resources']) == ['prompts/login/de', 'prompts/login/fr', 'prompts/signup/fr']
+
+
+def test_state_file_forgets_only_sent_prompts(server, tmp_path):
+
+    path = write_catalog(tmp_path, 'fr.csv', ['login,login,title,Connexion'])
+    state_file = str(tmp_path / 'state.json')
+
+    prompts_json = {
+        'login' : {'fr' : {'login' : {'title' : 'Connexion'}}},
+        'signup' : {'fr' : {'signup' : {'title' : 'Inscription'}}}
+    }
+
+    branding.StateManifest(state_file=state_file).record(tenant=server.mgmt_endpoint, prompts_json=prompts_json)
+
+    result = branding.lambda_handler(event(server, [path], state_file=state_file), None)
+
+    assert result['failed'] == []
+    assert list(branding.StateManifest(state_file=state_file).state[server.mgmt_endpoint]) == ['prompts/signup/fr']
@@ -0,0 +1,287 @@
+'''
+
+    Tests for the Management API client in branding.py against the local
+    mock in mock_api.py ... keep-alive reuse, chunked bodies, 429 / 5xx
+    retries, timeouts and the shared event loop
+
+'''
+
+import asyncio
+import threading
+import time
+
+import pytest
+import requests
+
+import branding
+from mock_api import MockServer
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(branding, 'BASE_BACKOFF', 0.01)
+
+
+@pytest.fixture
+def server():
+    with MockServer() as server:
+        yield server
+
+
+def client(server, **kwargs):
+
+    kwargs.setdefault('rate_limit', 1000)
+
+    return branding.Auth0(
+        client_id='test',
+        client_secret='test',
+        auth0_domain='localhost',
+        mgmt_endpoint=server.mgmt_endpoint,
+        **kwargs
+    )
+
+
+def api_requests(server, method=None):
+    return [r for r in server.requests if r[1].startswith('/api/') and method in [None, r[0]]]
+
+
+def test_keep_alive_connection_is_reused(server):
+
+    with client(server) as auth0:
+        auth0.create_template('<html>{%- auth0:head -%}{%- auth0:widget -%}</html>', skip_unchanged=False)
+
+        for i in range(10):
+            assert auth0.get_template().startswith('<html>')
+
+    assert len(api_requests(server)) == 11
+    assert server.connections == 1
+
+
+def test_chunked_bodies_are_reassembled():
+
+    with MockServer(chunked=True) as server:
+        with client(server) as auth0:
+            html = '<html>{}{{%- auth0:head -%}}{{%- auth0:widget -%}}</html>'.format('x' * 5000)
+            auth0.create_template(html, skip_unchanged=False)
+
+            assert auth0.get_template() == html
+
+
+def test_429_is_retried(server):
+
+    server.fail_next = [429, 429]
+
+    with client(server) as auth0:
+        assert auth0.get_template() is None
+
+    assert [r[2] for r in api_requests(server)] == [429, 429, 404]
+
+
+def test_5xx_is_retried_up_to_max_retries(server):
+
+    server.fail_next = [503, 503, 503]
+
+    with client(server, max_retries=2) as auth0:
+        response = auth0.create_request(
+            url=auth0.template_url,
+            headers={'Authorization' : 'Bearer {}'.format(auth0.access_token)},
+            get=True
+        )
+
+    assert response['statusCode'] == 503
+    assert [r[2] for r in api_requests(server)] == [503, 503, 503]
+
+
+def test_post_is_never_retried(server):
+
+    server.fail_next = [503]
+
+    with client(server) as auth0:
+        response = auth0.create_request(
+            url=auth0.branding_themes_url,
+            headers={'Authorization' : 'Bearer {}'.format(auth0.access_token)},
+            json_data={'displayName' : 'test'},
+            post=True
+        )
+
+    assert response['statusCode'] == 503
+    assert len(api_requests(server, 'POST')) == 1
+
+
+def test_read_timeout_is_retried_then_raised():
+
+    with MockServer() as server:
+        with client(server, read_timeout=0.2, max_retries=1) as auth0:
+            headers = {'Authorization' : 'Bearer {}'.format(auth0.access_token)}
+
+            server.latency_ms = 500
+
+            with pytest.raises(requests.Timeout):
+                auth0.get_template(headers=headers)
+
+            server.latency_ms = 0
+
+        assert auth0.metrics.report()['resources']['template']['retries'] == 1
+
+
+def test_post_is_not_retried_after_a_timeout():
+
+    with MockServer() as server:
+        with client(server, read_timeout=0.2, max_retries=3) as auth0:
+            headers = {'Authorization' : 'Bearer {}'.format(auth0.access_token)}
+
+            server.latency_ms = 500
+
+            with pytest.raises(requests.Timeout):
+                auth0.create_request(url=auth0.branding_themes_url, headers=headers,
+                    json_data={'displayName' : 'test'}, post=True)
+
+            server.latency_ms = 0
+
+        assert auth0.metrics.report()['resources']['theme']['retries'] == 0
+
+
+def test_clients_share_one_event_loop(server):
+
+    clients = [client(server) for i in range(5)]
+
+    for auth0 in clients:
+        auth0.get_template()
+
+    assert len([t for t in threading.enumerate() if t.name == 'auth0-loop']) == 1
+
+    for auth0 in clients:
+        auth0.close()
+
+
+def test_client_cache_is_bounded(server, monkeypatch):
+
+    monkeypatch.setattr(branding, 'CLIENTS', {})
+    monkeypatch.setattr(branding, 'MAX_CLIENTS', 2)
+
+    event = {
+        'client_id' : 'test',
+        'client_secret' : 'test',
+        'auth0_domain' : 'localhost',
+        'mgmt_endpoint' : server.mgmt_endpoint
+    }
+
+    first = branding.get_client(dict(event, pool_size=11))
+    second = branding.get_client(dict(event, pool_size=12))
+
+    assert branding.get_client(dict(event, pool_size=11)) is first
+
+    branding.get_client(dict(event, pool_size=13))
+
+    assert len(branding.CLIENTS) == 2
+    assert first in branding.CLIENTS.values()
+    assert second not in branding.CLIENTS.values()
+
+
+def test_async_client_does_not_block_the_loop():
+
+    with MockServer(latency_ms=200) as server:
+
+        async def main():
+            async with branding.AsyncAuth0('test', 'test', 'localhost',
+                    mgmt_endpoint=server.mgmt_endpoint, rate_limit=1000) as auth0:
+
+                ticks = []
+
+                async def tick():
+                    while True:
+                        ticks.append(time.monotonic())
+                        await asyncio.sleep(0.01)
+
+                ##
+                ## the token and template calls take 400ms ... the loop keeps
+                ## ticking the whole time
+                ##
+                ticker = asyncio.ensure_future(tick())
+                await auth0.get_template()
+                ticker.cancel()
+
+                return len(ticks)
+
+        assert asyncio.run(main()) > 20
+
+
+def test_deadline_in_diff_is_a_failure():
+
+    with MockServer(latency_ms=300) as server:
+        event = {
+            'branding_json' : 'examples/branding/default_rev1.json',
+            'prompts_json' : 'examples/prompts/prompts.json',
+            'html_template' : 'examples/templates/default_combined.liquid',
+            'delete_input' : False,
+            'diff_input' : True,
+            'deadline' : 0.5,
+            'rate_limit' : 1000,
+            'client_id' : 'test',
+            'client_secret' : 'test',
+            'auth0_domain' : 'localhost',
+            'mgmt_endpoint' : server.mgmt_endpoint
+        }
+
+        result = branding.lambda_handler(event, None)
+
+    assert result['deadline_exceeded'] is True
+    assert 'deadline' in result['failed']
+
+
+def fake_response(status, content, reason=''):
+
+    response = requests.Response()
+    response.status_code = status
+    response.reason = reason
+    response._content = content
+
+    return response
+
+
+@pytest.mark.parametrize('status, content', [
+    (502, b'<html><body>Bad Gateway</body></html>'),
+    (503, b''),
+    (500, b'["not", "an", "error", "object"]'),
+])
+def test_non_json_error_responses_are_errors(status, content):
+
+    response_data = branding.response_body(fake_response(status, content, reason='Gateway'))
+
+    assert branding.response_status(response_data) == status
+    assert branding.response_error(response_data) == 'HTTP {} Gateway'.format(status)
+
+
+def test_json_error_without_status_code_is_an_error():
+
+    response_data = branding.response_body(fake_response(502, b'{"message": "upstream down"}'))
+
+    assert response_data['statusCode'] == 502
+    assert branding.response_error(response_data) == 'upstream down'
+
+
+def test_bodiless_success_is_not_an_error():
+
+    response_data = branding.response_body(fake_response(201, b''))
+
+    assert branding.response_error(response_data) is None
+
+
+def test_failed_writes_are_not_counted_as_patched(server):
+
+    prompts_json = {'login' : {'en' : {'login' : {'title' : 'Welcome'}}}}
+
+    with client(server) as auth0:
+        auth0.access_token
+
+        server.fail_next = [400]
+        result = auth0.deploy(prompts_json=prompts_json)
+
+        assert result['patched'] == 0
+        assert result['failed'] == ['prompts/login/en']
+
+        server.fail_next = [400]
+        result = auth0.stream_prompts(iter([('login', 'en', prompts_json['login']['en'])]))
+
+        assert result['patched'] == 0
+        assert result['failed'] == ['prompts/login/en']
@@ -0,0 +1,82 @@
+'''
+
+    Tests for --export in branding.py against the local mock in mock_api.py
+
+'''
+
+import json
+import os
+
+import pytest
+
+import branding
+from mock_api import MockServer
+
+
+@pytest.fixture
+def server():
+    with MockServer() as server:
+        yield server
+
+
+def client(server):
+
+    return branding.Auth0(
+        client_id='test',
+        client_secret='test',
+        auth0_domain='localhost',
+        mgmt_endpoint=server.mgmt_endpoint,
+        rate_limit=1000
+    )
+
+
+def test_every_enabled_locale_is_exported(server, tmp_path):
+
+    server.tenant.enabled_locales = ['en', 'fr', 'de']
+
+    with client(server) as auth0:
+        auth0.set_prompt('login', 'fr', {'login' : {'title' : 'Connexion'}})
+        auth0.set_prompt('signup', 'de', {'signup' : {'title' : 'Registrieren'}})
+
+        auth0.export(out_dir=str(tmp_path))
+
+    custom_text = [r[1] for r in server.requests if r[0] == 'GET' and '/custom-text/' in r[1]]
+
+    assert len(custom_text) == len(branding.EXPORT_PROMPTS) * 3
+
+    with open(os.path.join(str(tmp_path), 'prompts', 'prompts.json'), 'r') as f:
+        assert json.load(f) == {
+            'login' : {'fr' : {'login' : {'title' : 'Connexion'}}},
+            'signup' : {'de' : {'signup' : {'title' : 'Registrieren'}}}
+        }
+
+
+def test_unreadable_settings_fall_back_to_export_languages(server, tmp_path):
+
+    with client(server) as auth0:
+        auth0.access_token
+
+        server.fail_next = [403]
+        languages = auth0.export_languages()
+
+    assert languages == branding.EXPORT_LANGUAGES
+
+
+def test_missing_theme_removes_the_stale_export(server, tmp_path):
+
+    with client(server) as auth0:
+        auth0.create_branding(json_data={'colors' : {'primary' : '#123456'}})
+
+        summary = auth0.export(out_dir=str(tmp_path))
+
+        path = os.path.join(str(tmp_path), 'branding', 'default.json')
+
+        assert os.path.exists(path)
+
+        auth0.delete_branding()
+
+        summary = auth0.export(out_dir=str(tmp_path))
+
+    assert summary['removed'] == 1
+    assert summary['failed'] == []
+    assert not os.path.exists(path)
@@ -0,0 +1,121 @@
+'''
+
+    Tests for the rollback journal in branding.py against the local mock in
+    mock_api.py
+
+'''
+
+import pytest
+
+import branding
+from mock_api import MockServer
+
+
+@pytest.fixture
+def server():
+    with MockServer() as server:
+        yield server
+
+
+def event(server, journal_dir, **kwargs):
+
+    return dict({
+        'branding_json' : 'examples/branding/default_rev1.json',
+        'prompts_json' : 'examples/prompts/prompts.json',
+        'html_template' : 'examples/templates/default_combined.liquid',
+        'delete_input' : False,
+        'journal_dir' : journal_dir,
+        'rate_limit' : 1000,
+        'client_id' : 'test',
+        'client_secret' : 'test',
+        'auth0_domain' : 'localhost',
+        'mgmt_endpoint' : server.mgmt_endpoint
+    }, **kwargs)
+
+
+def test_restore_patch_clears_added_fields():
+
+    current = {'logo_url' : 'b', 'favicon_url' : 'b', 'colors' : {'primary' : '#000', 'page_background' : '#fff'}}
+    saved = {'logo_url' : 'a', 'colors' : {'primary' : '#111'}}
+
+    patch = branding.restore_patch(current, saved)
+
+    assert patch == {'logo_url' : 'a', 'favicon_url' : None, 'colors' : {'primary' : '#111', 'page_background' : None}}
+    assert branding.deep_merge(current, patch) == saved
+
+
+def test_entries_are_per_tenant_and_newest_first(tmp_path):
+
+    journal = branding.Journal(str(tmp_path))
+
+    first = journal.record(tenant='a', resources={'template' : None})
+    other = journal.record(tenant='b', resources={'template' : None})
+    second = journal.record(tenant='a', resources={'prompts/login/en' : {}})
+
+    assert [e['id'] for e in journal.entries(tenant='a')] == [second, first]
+    assert journal.load(tenant='a')['id'] == second
+    assert journal.load(tenant='a', entry_id=first)['resources'] == {'template' : None}
+
+    ##
+    ## an entry can also be loaded straight from its file
+    ##
+    assert journal.load(entry_id=str(tmp_path / '{}.json'.format(other)))['tenant'] == 'b'
+
+    with pytest.raises(ValueError, match='No journal entry'):
+        journal.load(tenant='c')
+
+    assert branding.Journal(str(tmp_path / 'missing')).entries() == []
+
+
+def test_latest_skips_rollback_entries(tmp_path):
+
+    journal = branding.Journal(str(tmp_path))
+
+    deploy_id = journal.record(tenant='t', resources={'template' : None})
+    rollback_id = journal.record(tenant='t', resources={'template' : '<html></html>'}, rollback_of=deploy_id)
+
+    assert journal.load(tenant='t')['id'] == deploy_id
+    assert journal.load(tenant='t', entry_id=rollback_id)['rollback_of'] == deploy_id
+
+
+def test_second_rollback_does_not_toggle_back(server, tmp_path):
+
+    journal_dir = str(tmp_path)
+
+    server.tenant.template = '<html>before</html>'
+
+    branding.lambda_handler(event(server, journal_dir), None)
+    deployed = server.tenant.template
+
+    first = branding.lambda_handler(event(server, journal_dir, rollback=True), None)
+
+    assert first['failed'] == []
+    assert server.tenant.template == '<html>before</html>'
+
+    second = branding.lambda_handler(event(server, journal_dir, rollback=True), None)
+
+    assert second['rolled_back_to'] == first['rolled_back_to']
+    assert server.tenant.template == '<html>before</html>'
+
+    ##
+    ## the rollback itself is undone only by ID
+    ##
+    branding.lambda_handler(event(server, journal_dir, rollback=True, rollback_to=first['journal']), None)
+
+    assert server.tenant.template == deployed
+
+
+def test_rollback_clears_global_branding_fields_added_since(server, tmp_path):
+
+    journal_dir = str(tmp_path)
+
+    server.tenant.global_branding = {'logo_url' : 'https://example.com/old.svg'}
+
+    branding.lambda_handler(event(server, journal_dir, prompts_json=None, html_template=None), None)
+
+    server.tenant.global_branding['colors'] = {'primary' : '#123456'}
+
+    result = branding.lambda_handler(event(server, journal_dir, rollback=True), None)
+
+    assert result['failed'] == []
+    assert server.tenant.global_branding == {'logo_url' : 'https://example.com/old.svg'}
@@ -0,0 +1,142 @@
+'''
+
+    Tests for the asset pre-flight in branding.py against the mock's
+    /assets/{name} ... missing* is a 404 and large* is over the size cap
+
+'''
+
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import branding
+from mock_api import MockServer
+
+
+@pytest.fixture
+def server():
+    with MockServer() as server:
+        yield server
+
+
+def asset_requests(server):
+    return [r for r in server.requests if r[1].startswith('/assets/')]
+
+
+def branding_with(server, logo, background, font):
+
+    def asset(name):
+        return server.base_url + '/assets/' + name
+
+    return {
+        'widget' : {'logo_url' : asset(logo)},
+        'page_background' : {'background_image_url' : asset(background)},
+        'fonts' : {'font_url' : asset(font)}
+    }
+
+
+def test_broken_assets_are_each_reported(server):
+
+    checker = branding.AssetChecker()
+    broken = branding_with(server, 'missing-logo.png', 'page.css', 'large.woff2')
+
+    errors = branding.preflight_assets(broken, checker=checker)
+
+    assert len(errors) == 3
+    assert 'HTTP 404' in errors[0]
+    assert 'content-type text/css where image expected' in errors[1]
+    assert 'exceeds the {} byte limit'.format(checker.max_bytes) in errors[2]
+
+
+def test_concurrent_tenants_share_one_request_per_asset(server):
+
+    checker = branding.AssetChecker()
+    good = branding_with(server, 'logo.svg', 'background.jpg', 'font.woff2')
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        errors = list(executor.map(lambda i: branding.preflight_assets(good, checker=checker), range(8)))
+
+    assert not any(errors)
+    assert len(asset_requests(server)) == 3
+
+
+def test_results_are_fetched_again_after_the_ttl(server):
+
+    checker = branding.AssetChecker(ttl=0.3)
+    good = branding_with(server, 'logo.svg', 'background.jpg', 'font.woff2')
+
+    branding.preflight_assets(good, checker=checker)
+    branding.preflight_assets(good, checker=checker)
+
+    assert len(asset_requests(server)) == 3
+
+    time.sleep(0.3)
+
+    branding.preflight_assets(good, checker=checker)
+
+    assert len(asset_requests(server)) == 6
+
+
+def test_ttl_applies_per_call(server):
+
+    checker = branding.AssetChecker(ttl=300)
+    good = branding_with(server, 'logo.svg', 'background.jpg', 'font.woff2')
+
+    branding.preflight_assets(good, checker=checker)
+
+    ##
+    ## one tenant asking for fresh results leaves the shared TTL alone
+    ##
+    branding.preflight_assets(good, checker=checker, ttl=0)
+    branding.preflight_assets(good, checker=checker)
+
+    assert checker.ttl == 300
+    assert len(asset_requests(server)) == 6
+
+
+def test_failures_are_cached_briefly(server, monkeypatch):
+
+    monkeypatch.setattr(branding, 'FAILED_ASSET_TTL', 0.3)
+
+    checker = branding.AssetChecker(ttl=300)
+    url = server.base_url + '/assets/missing-logo.png'
+
+    assert checker.check(url)['status'] == 404
+    assert checker.check(url)['status'] == 404
+    assert len(asset_requests(server)) == 1
+
+    time.sleep(0.3)
+
+    checker.check(url)
+
+    assert len(asset_requests(server)) == 2
+
+
+def test_failed_preflight_writes_nothing(server, tmp_path):
+
+    with open('examples/branding/default_rev1.json', 'r') as f:
+        deploy_branding = json.load(f)
+
+    deploy_branding.update(branding_with(server, 'missing-logo.svg', 'background.jpg', 'font.woff2'))
+
+    path = tmp_path / 'branding.json'
+    path.write_text(json.dumps(deploy_branding))
+
+    result = branding.lambda_handler({
+        'branding_json' : str(path),
+        'prompts_json' : None,
+        'html_template' : None,
+        'delete_input' : False,
+        'preflight' : True,
+        'asset_ttl' : 0,
+        'client_id' : 'test',
+        'client_secret' : 'test',
+        'auth0_domain' : 'localhost',
+        'mgmt_endpoint' : server.mgmt_endpoint
+    }, None)
+
+    assert result['failed'] == ['preflight']
+    assert not [r for r in server.requests if r[0] in ['POST', 'PUT', 'PATCH', 'DELETE']]
+    assert branding.ASSET_CHECKER.ttl == branding.ASSET_TTL
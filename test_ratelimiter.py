@@ -0,0 +1,89 @@
+'''
+
+    Tests for the client-side RateLimiter token bucket in branding.py
+
+'''
+
+import asyncio
+import time
+
+import pytest
+
+import branding
+
+
+def test_burst_then_paced():
+
+    limiter = branding.RateLimiter(rate=10, burst=2)
+
+    assert limiter.reserve() == 0
+    assert limiter.reserve() == 0
+    assert limiter.reserve() == pytest.approx(0.1, abs=0.02)
+
+
+def test_acquire_waits_for_tokens():
+
+    limiter = branding.RateLimiter(rate=50, burst=1)
+
+    start = time.monotonic()
+
+    for i in range(6):
+        limiter.acquire()
+
+    assert time.monotonic() - start >= 0.09
+
+
+def test_acquire_async_shares_the_bucket():
+
+    limiter = branding.RateLimiter(rate=50, burst=1)
+
+    async def main():
+        start = time.monotonic()
+        await asyncio.gather(*[limiter.acquire_async() for i in range(6)])
+        return time.monotonic() - start
+
+    assert asyncio.run(main()) >= 0.09
+
+
+def test_wait_past_the_deadline_is_not_started():
+
+    limiter = branding.RateLimiter(rate=1, burst=1)
+    limiter.acquire()
+
+    start = time.monotonic()
+
+    with pytest.raises(branding.DeadlineExceeded):
+        limiter.acquire(remaining=0.5)
+
+    assert time.monotonic() - start < 0.1
+
+
+def test_server_budget_caps_tokens_and_pauses():
+
+    limiter = branding.RateLimiter(rate=100)
+
+    limiter.update({'X-RateLimit-Limit' : '10', 'X-RateLimit-Remaining' : '5'})
+
+    assert limiter.capacity == 10
+    assert limiter.tokens == 5
+
+    limiter.update({'X-RateLimit-Remaining' : '0', 'X-RateLimit-Reset' : str(int(time.time()) + 2)})
+
+    assert 0.5 < limiter.reserve() <= 2
+
+
+def test_far_off_reset_is_capped():
+
+    limiter = branding.RateLimiter(rate=100)
+
+    limiter.update({'X-RateLimit-Remaining' : '0', 'X-RateLimit-Reset' : str(int(time.time()) + 3600)})
+
+    assert limiter.reserve() <= branding.MAX_BACKOFF
+
+
+def test_pause_holds_every_caller():
+
+    limiter = branding.RateLimiter(rate=100)
+    limiter.pause(0.5)
+
+    assert limiter.reserve() == pytest.approx(0.5, abs=0.05)
@@ -0,0 +1,55 @@
+'''
+
+    Tests for the TaskGraph scheduler in branding.py
+
+'''
+
+import pytest
+
+import branding
+
+
+def test_dependencies_receive_results():
+
+    graph = branding.TaskGraph()
+
+    graph.add('a', lambda: 1)
+    graph.add('b', lambda a: a + 1, deps=['a'])
+    graph.add('c', lambda a, b: a + b, deps=['a', 'b'])
+
+    graph.run(max_workers=2)
+
+    assert graph.tasks['c']['result'] == 3
+    assert [t['task'] for t in graph.critical_path()] == ['a', 'b', 'c']
+
+
+def test_failed_dependency_skips_dependents():
+
+    graph = branding.TaskGraph()
+
+    graph.add('a', lambda: 1 / 0)
+    graph.add('b', lambda a: a, deps=['a'])
+
+    graph.run()
+
+    assert graph.tasks['a']['error'].startswith('ZeroDivisionError')
+    assert graph.tasks['b']['error'] == 'skipped: a failed'
+
+
+def test_unknown_dependency_is_rejected():
+
+    graph = branding.TaskGraph()
+
+    with pytest.raises(ValueError, match='unknown tasks: missing'):
+        graph.add('a', lambda missing: missing, deps=['missing'])
+
+
+def test_unschedulable_tasks_raise_instead_of_spinning():
+
+    graph = branding.TaskGraph()
+
+    graph.add('a', lambda: 1)
+    graph.tasks['a']['deps'].append('a')
+
+    with pytest.raises(ValueError, match='can never run: a'):
+        graph.run()
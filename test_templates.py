@@ -0,0 +1,106 @@
+'''
+
+    Tests for the template build in branding.py ... partials composed back
+    into the templates they were split from, byte for byte, and minified
+    without touching Liquid
+
+'''
+
+import os
+
+import pytest
+
+import branding
+
+
+TEMPLATES = ['default_3_col', 'default_bg_img', 'default_combined', 'default_footer']
+
+
+@pytest.mark.parametrize('name', TEMPLATES)
+def test_composed_templates_match_the_originals(name):
+
+    ##
+    ## test_data/templates holds each template as it was before it was split
+    ## into partials
+    ##
+    with open(os.path.join('test_data', 'templates', name + '.liquid'), 'rb') as f:
+        original = f.read()
+
+    composed = branding.compose_template(os.path.join('examples', 'templates', name + '.liquid'))
+
+    assert composed.encode('utf-8') == original
+
+
+def test_partials_are_indented_and_recorded(tmp_path):
+
+    (tmp_path / 'partials').mkdir()
+    (tmp_path / 'partials' / 'a.html').write_text('<p>a</p>\n<!-- include: b.html -->\n')
+    (tmp_path / 'partials' / 'b.html').write_text('<p>b</p>\n\n<p>c</p>\n')
+    (tmp_path / 'page.liquid').write_text('<body>\n    <!-- include: partials/a.html -->\n</body>\n')
+
+    sources = []
+    composed = branding.compose_template(str(tmp_path / 'page.liquid'), sources=sources)
+
+    assert composed == '<body>\n    <p>a</p>\n    <p>b</p>\n\n    <p>c</p>\n</body>\n'
+    assert [os.path.basename(s) for s in sources] == ['page.liquid', 'a.html', 'b.html']
+
+
+def test_include_cycles_and_missing_partials_are_errors(tmp_path):
+
+    (tmp_path / 'a.html').write_text('<!-- include: b.html -->\n')
+    (tmp_path / 'b.html').write_text('<!-- include: a.html -->\n')
+    (tmp_path / 'c.html').write_text('/* include: missing.css */\n')
+
+    with pytest.raises(ValueError, match='include cycle'):
+        branding.compose_template(str(tmp_path / 'a.html'))
+
+    with pytest.raises(ValueError, match='cannot include missing.css'):
+        branding.compose_template(str(tmp_path / 'c.html'))
+
+
+@pytest.mark.parametrize('html, minified', [
+    (
+        '<html>\n  <head>\n    {%- auth0:head -%}\n  </head>\n  <!-- note -->\n'
+        '  <body>\n    <p>Hello   {{ user.name }}  there</p>\n  </body>\n</html>\n',
+        '<html><head>{%- auth0:head -%}</head><body><p>Hello {{ user.name }} there</p></body></html>'
+    ),
+    (
+        '<style>\n  .a { color: red ;  content: "a  ;  b" ; }\n  /* c */\n  .b > .c { margin: 0 }\n</style>',
+        '<style>.a{color:red;content:"a  ;  b"}.b>.c{margin:0}</style>'
+    ),
+    (
+        '<pre>\n  keep   this\n</pre>\n<div>\n  {% if x %}\n    <span>y</span>\n  {% endif %}\n</div>',
+        '<pre>\n  keep   this\n</pre><div>{% if x %}<span>y</span>{% endif %}</div>'
+    ),
+    (
+        '<!--[if IE]><p>ie</p><![endif]-->',
+        '<!--[if IE]><p>ie</p><![endif]-->'
+    ),
+])
+def test_minify(html, minified):
+    assert branding.minify_html(html) == minified
+
+
+@pytest.mark.parametrize('name', TEMPLATES)
+def test_minify_keeps_every_liquid_tag(name):
+
+    composed = branding.compose_template(os.path.join('examples', 'templates', name + '.liquid'))
+    minified = branding.build_template(os.path.join('examples', 'templates', name + '.liquid'), minify=True)
+
+    assert len(minified) < len(composed)
+    assert branding.LIQUID_MARKUP.findall(minified) == branding.LIQUID_MARKUP.findall(composed)
+    assert branding.validate_template(minified) == []
+
+
+def test_build_template_is_cached_by_content(tmp_path):
+
+    path = tmp_path / 'page.liquid'
+    path.write_text('<body>\n  {%- auth0:widget -%}\n</body>\n')
+
+    first = branding.build_template(str(path), minify=True)
+
+    assert branding.build_template(str(path), minify=True) is first
+
+    path.write_text('<body>\n  {%- auth0:widget -%}\n  <p>changed</p>\n</body>\n')
+
+    assert branding.build_template(str(path), minify=True) == '<body>{%- auth0:widget -%}<p>changed</p></body>'
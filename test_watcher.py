@@ -0,0 +1,121 @@
+'''
+
+    Tests for --watch in branding.py ... Watcher.push against the local mock
+    in mock_api.py, without the polling loop
+
+'''
+
+import json
+import shutil
+
+import pytest
+
+import branding
+from mock_api import MockServer
+
+
+@pytest.fixture
+def server():
+    with MockServer() as server:
+        yield server
+
+
+@pytest.fixture
+def inputs(tmp_path):
+
+    shutil.copy('examples/branding/default_rev1.json', str(tmp_path / 'branding.json'))
+    shutil.copy('examples/prompts/prompts.json', str(tmp_path / 'prompts.json'))
+    shutil.copytree('examples/templates', str(tmp_path / 'templates'))
+
+    return tmp_path
+
+
+def watcher(server, inputs):
+
+    auth0 = branding.Auth0(
+        client_id='test',
+        client_secret='test',
+        auth0_domain='localhost',
+        mgmt_endpoint=server.mgmt_endpoint,
+        rate_limit=1000
+    )
+
+    return branding.Watcher(auth0, {
+        'branding_json' : str(inputs / 'branding.json'),
+        'prompts_json' : str(inputs / 'prompts.json'),
+        'html_template' : str(inputs / 'templates' / 'default_footer.liquid')
+    })
+
+
+def writes(server):
+    return [r for r in server.requests if r[0] in ['POST', 'PUT', 'PATCH', 'DELETE']]
+
+
+def test_only_changed_resources_are_pushed(server, inputs):
+
+    w = watcher(server, inputs)
+    prompts_json = json.loads((inputs / 'prompts.json').read_text())
+
+    ##
+    ## the first push writes everything, global branding included
+    ##
+    branding_json = branding.load_json(str(inputs / 'branding.json'))
+
+    assert w.push() == len(branding.resource_keys(branding_json, prompts_json, html_template=''))
+
+    before = len(writes(server))
+
+    assert w.push() == 0
+    assert len(writes(server)) == before
+
+    prompt = sorted(prompts_json)[0]
+    language = sorted(prompts_json[prompt])[0]
+    screen = sorted(prompts_json[prompt][language])[0]
+    prompts_json[prompt][language][screen]['watched'] = 'changed'
+
+    (inputs / 'prompts.json').write_text(json.dumps(prompts_json))
+
+    assert w.push() == 1
+    assert [r[1] for r in writes(server)[before:]] == ['/api/v2/prompts/{}/custom-text/{}'.format(prompt, language)]
+
+
+def test_partials_are_watched(server, inputs):
+
+    w = watcher(server, inputs)
+    w.push()
+
+    assert str(inputs / 'templates' / 'partials' / 'footer.html') in w.paths()
+
+    with open(str(inputs / 'templates' / 'partials' / 'footer.html'), 'a') as f:
+        f.write('<p>watched</p>\n')
+
+    assert w.push() == 1
+    assert '<p>watched</p>' in server.tenant.template
+
+
+def test_failed_push_is_retried(server, inputs):
+
+    w = watcher(server, inputs)
+    w.push()
+
+    (inputs / 'templates' / 'default_footer.liquid').write_text(
+        '<html>{%- auth0:head -%}{%- auth0:widget -%}<p>new</p></html>')
+
+    server.fail_next = [400]
+
+    assert w.push() == 0
+    assert w.failed == ['template']
+
+    assert w.push() == 1
+    assert w.failed == []
+    assert '<p>new</p>' in server.tenant.template
+
+
+def test_half_written_input_is_skipped(server, inputs):
+
+    w = watcher(server, inputs)
+    w.push()
+
+    (inputs / 'prompts.json').write_text('{"login": ')
+
+    assert w.push() == 0